@@ -85,24 +85,54 @@ export function ChatInterface({ chatId, userId, onTitleUpdate }: ChatInterfacePr
     setInput("");
     setIsTyping(true);
     
+    const botMessageId = (Date.now() + 1).toString();
+
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/chats/${userId}/${chatId}/messages`, {
+      const response = await fetch(`http://127.0.0.1:8000/api/chats/${userId}/${chatId}/messages/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ message: currentInput }),
       });
     
-      if (!response.ok) throw new Error("Network response was not ok");
-    
-      const data: ChatMessage = await response.json();
-    
-      const botResponse: Message = {
-        id: (Date.now() + 1).toString(),
-        type: "bot",
-        content: data.bot,
-      };
-    
-      setMessages((prev) => [...prev, botResponse]);
+      if (!response.ok || !response.body) throw new Error("Network response was not ok");
+
+      // Read the Server-Sent Events stream and grow the bot message token by token
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let started = false;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split("\n\n");
+        buffer = events.pop() ?? "";
+
+        for (const rawEvent of events) {
+          const lines = rawEvent.split("\n");
+          const eventType = lines.find((line) => line.startsWith("event: "))?.slice(7) ?? "message";
+          const dataLine = lines.find((line) => line.startsWith("data: "));
+          if (!dataLine) continue;
+          const data = JSON.parse(dataLine.slice(6));
+
+          if (eventType === "error") throw new Error(data.detail);
+          if (eventType === "done") continue;
+
+          if (!started) {
+            started = true;
+            setIsTyping(false);
+            setMessages((prev) => [...prev, { id: botMessageId, type: "bot", content: data.token }]);
+          } else {
+            setMessages((prev) =>
+              prev.map((message) =>
+                message.id === botMessageId ? { ...message, content: message.content + data.token } : message
+              )
+            );
+          }
+        }
+      }
 
       // If this was the first message, trigger a title update
       if (wasFirstMessage) {
@@ -112,11 +142,11 @@ export function ChatInterface({ chatId, userId, onTitleUpdate }: ChatInterfacePr
     } catch (error) {
       console.error("Failed to fetch bot response:", error);
       const errorResponse: Message = {
-        id: (Date.now() + 1).toString(),
+        id: botMessageId,
         type: "bot",
         content: "Sorry, I'm having trouble connecting to my brain right now. Please try again later.",
       };
-      setMessages((prev) => [...prev, errorResponse]);
+      setMessages((prev) => [...prev.filter((message) => message.id !== botMessageId), errorResponse]);
     } finally {
       setIsTyping(false);
     }
@@ -47,7 +47,7 @@ export function QuizzesTab() {
   const fetchQuestion = async () => {
     setIsLoading(true)
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/quiz?topic=${selectedTopic}&difficulty=easy`);
+      const response = await fetch(`http://127.0.0.1:8000/api/quiz?topic=${selectedTopic}&difficulty=easy&user_id=default_user`);
       if (!response.ok) throw new Error("Failed to fetch question");
       const data: QuizQuestion = await response.json();
       setCurrentQuestion(data)
@@ -0,0 +1,231 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Users with fewer answers than this in a topic are left out of that topic's cohort statistics
+ANALYTICS_MIN_QUESTIONS = int(os.environ.get("ANALYTICS_MIN_QUESTIONS", 3))
+PERCENTILES = (10, 25, 50, 75, 90)
+DIFFICULTY_ORDER = ["easy", "medium", "hard"]
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return np.nan
+
+
+class QuizResultsStore:
+    """Column store of every quiz answer on the platform, for vectorised cohort queries.
+
+    One row per answered question: user index, topic code, difficulty code, correct
+    flag and session timestamp, each in its own NumPy array. Strings are
+    dictionary-encoded, so group-bys are np.bincount calls over small integer keys.
+    The store is built from the profile storage on first use and then appended to
+    by add_quiz_result().
+    """
+
+    # Topic and difficulty come from user input, so their codes get the same range as users
+    _COLUMNS = (("user", np.int32), ("topic", np.int32), ("difficulty", np.int32),
+                ("correct", np.bool_), ("timestamp", np.float64))
+
+    def __init__(self, initial_capacity=1024):
+        self._lock = threading.Lock()
+        self._built = False
+        self._size = 0
+        self._columns = {name: np.empty(initial_capacity, dtype=dtype) for name, dtype in self._COLUMNS}
+        self._codes = {"user": {}, "topic": {}, "difficulty": {}}
+        self._values = {"user": [], "topic": [], "difficulty": []}
+
+    # --- loading ---
+
+    def _code(self, column, value):
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self._values[column].append(value)
+        return code
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._columns["user"])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _append_rows(self, rows):
+        """rows: list of (user_id, topic, difficulty, correct, timestamp)."""
+        self._reserve(len(rows))
+        start, end = self._size, self._size + len(rows)
+        parsed = {}
+        self._columns["user"][start:end] = [self._code("user", row[0]) for row in rows]
+        self._columns["topic"][start:end] = [self._code("topic", row[1]) for row in rows]
+        self._columns["difficulty"][start:end] = [self._code("difficulty", str(row[2])) for row in rows]
+        self._columns["correct"][start:end] = [bool(row[3]) for row in rows]
+        self._columns["timestamp"][start:end] = [
+            parsed[row[4]] if row[4] in parsed else parsed.setdefault(row[4], _parse_timestamp(row[4]))
+            for row in rows
+        ]
+        self._size = end
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        batch = []
+        for row in get_storage().iter_quiz_results():
+            batch.append(row)
+            if len(batch) >= 100_000:
+                self._append_rows(batch)
+                batch = []
+        if batch:
+            self._append_rows(batch)
+        self._built = True
+
+    def append_session(self, user_id, quiz_session_data):
+        """Adds a newly saved quiz session. A no-op until the store has been built.
+
+        Never raises: the session is already saved, so if it can't be added the
+        store is dropped and rebuilt from storage on the next query.
+        """
+        rows = [
+            (user_id, r.get("topic"), r.get("difficulty"), r.get("correct"), quiz_session_data.get("timestamp"))
+            for r in quiz_session_data.get("results", [])
+            if r.get("topic") and r.get("difficulty") is not None
+        ]
+        with self._lock:
+            if not (self._built and rows):
+                return
+            try:
+                self._append_rows(rows)
+            except Exception as e:
+                logger.warning("Could not add quiz results to the analytics store, rebuilding it: %s", e)
+                self.__init__()
+
+    def reset(self):
+        """Forgets everything; the next query rebuilds from storage."""
+        with self._lock:
+            self.__init__()
+
+    def _snapshot(self, user_id=None):
+        """Views of the filled part of each column, the decode tables, and the code of `user_id` (None if unknown)."""
+        with self._lock:
+            self._ensure_built()
+            size = self._size
+            columns = {name: column[:size] for name, column in self._columns.items()}
+            values = {name: list(vals) for name, vals in self._values.items()}
+            user_code = self._codes["user"].get(user_id)
+        return columns, values, user_code
+
+    @staticmethod
+    def _user_topic_cells(columns, n_users, n_topics):
+        """Answer counts per (user, topic) pair that has answers, grouped by topic.
+
+        Returns (bounds, users, total, correct): the cells of topic t are
+        bounds[t]:bounds[t + 1], with the user code and counts of each cell. Only
+        pairs that occur are materialised, not a users x topics matrix.
+        """
+        key = columns["topic"].astype(np.int64) * n_users + columns["user"]
+        cells, inverse = np.unique(key, return_inverse=True)
+        total = np.bincount(inverse, minlength=len(cells))
+        correct = np.bincount(inverse, weights=columns["correct"].astype(np.float64), minlength=len(cells))
+        bounds = np.searchsorted(cells, np.arange(n_topics + 1, dtype=np.int64) * n_users)
+        return bounds, cells % n_users, total, correct
+
+    # --- queries ---
+
+    def topic_analytics(self, min_questions=ANALYTICS_MIN_QUESTIONS):
+        """Per-topic accuracy, distribution of per-user accuracy, and accuracy by difficulty."""
+        columns, values, _ = self._snapshot()
+        n_users, n_topics, n_difficulties = len(values["user"]), len(values["topic"]), len(values["difficulty"])
+        correct = columns["correct"].astype(np.float64)
+
+        topic_total = np.bincount(columns["topic"], minlength=n_topics)
+        topic_correct = np.bincount(columns["topic"], weights=correct, minlength=n_topics)
+
+        bounds, _, cell_total, cell_correct = self._user_topic_cells(columns, n_users, n_topics)
+
+        # (topic, difficulty) cells
+        td = columns["topic"].astype(np.int64) * n_difficulties + columns["difficulty"]
+        td_total = np.bincount(td, minlength=n_topics * n_difficulties).reshape(n_topics, n_difficulties)
+        td_correct = np.bincount(td, weights=correct, minlength=n_topics * n_difficulties).reshape(n_topics, n_difficulties)
+
+        result = {}
+        for t, topic in enumerate(values["topic"]):
+            cells = slice(bounds[t], bounds[t + 1])
+            eligible = cell_total[cells] >= min_questions
+            user_accuracy = cell_correct[cells][eligible] / cell_total[cells][eligible]
+            distribution = {}
+            if user_accuracy.size:
+                distribution["mean"] = float(user_accuracy.mean())
+                for p, value in zip(PERCENTILES, np.percentile(user_accuracy, PERCENTILES)):
+                    distribution[f"p{p}"] = float(value)
+
+            by_difficulty = {
+                difficulty: {"results": int(td_total[t, d]), "accuracy": float(td_correct[t, d] / td_total[t, d])}
+                for d, difficulty in enumerate(values["difficulty"])
+                if td_total[t, d]
+            }
+            # Calibrated if accuracy doesn't go up as the labelled difficulty goes up
+            ordered = [by_difficulty[d]["accuracy"] for d in DIFFICULTY_ORDER if d in by_difficulty]
+            result[topic] = {
+                "results": int(topic_total[t]),
+                "accuracy": float(topic_correct[t] / topic_total[t]) if topic_total[t] else 0.0,
+                "users": int(eligible.sum()),
+                "user_accuracy": distribution,
+                "by_difficulty": by_difficulty,
+                "difficulty_calibrated": all(a >= b for a, b in zip(ordered, ordered[1:])),
+            }
+        return result
+
+    def user_percentiles(self, user_id, min_questions=ANALYTICS_MIN_QUESTIONS):
+        """Where the user's accuracy in each topic ranks within the cohort (0-100), or None if unknown."""
+        columns, values, u = self._snapshot(user_id)
+        if u is None:
+            return None
+        n_users, n_topics = len(values["user"]), len(values["topic"])
+        bounds, cell_user, cell_total, cell_correct = self._user_topic_cells(columns, n_users, n_topics)
+
+        result = {}
+        for cell in np.flatnonzero(cell_user == u):
+            t = int(np.searchsorted(bounds, cell, side="right")) - 1
+            cells = slice(bounds[t], bounds[t + 1])
+            eligible = cell_total[cells] >= min_questions
+            cohort = cell_correct[cells][eligible] / cell_total[cells][eligible]
+            questions = cell_total[cell]
+            accuracy = cell_correct[cell] / questions
+            entry = {"accuracy": float(accuracy), "questions": int(questions), "cohort_size": int(cohort.size)}
+            if questions >= min_questions and cohort.size:
+                # Mid-rank percentile: users below plus half of the ties
+                below = np.count_nonzero(cohort < accuracy)
+                ties = np.count_nonzero(cohort == accuracy)
+                entry["percentile"] = float(100.0 * (below + 0.5 * ties) / cohort.size)
+            else:
+                entry["percentile"] = None
+            result[values["topic"][t]] = entry
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "built": self._built,
+                "results": self._size,
+                "users": len(self._values["user"]),
+                "topics": len(self._values["topic"]),
+                "bytes": sum(column.nbytes for column in self._columns.values()),
+            }
+
+
+quiz_results_store = QuizResultsStore()
@@ -1,14 +1,35 @@
+import asyncio
 import json
-from fastapi import FastAPI, Response, status
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
-import requests
-from bs4 import BeautifulSoup
 
 # Existing Functions
-from bot import chat
-from mcq import mcq_assessment
+from bot import achat, stream_chat, arefresh_chat_summary
+from llm_client import llm_client
+from kv_cache import context_cache
+from response_cache import response_cache
+from mcq import MCQ_BATCH_MAX, QUIZ_TOPICS, amcq_assessment, amcq_assessment_batch, mcq_stats, shuffle_options
+from question_bank import question_bank
+from analytics import ANALYTICS_MIN_QUESTIONS, quiz_results_store
+from resource_search import resource_search
+from catalog import resource_catalog
+from chat_search import chat_search_index
+from vector_memory import vector_memory
+from events import events_cache
+from jobs import JOBS_MAX_PAGE_SIZE, JOBS_PAGE_SIZE, job_store
+from metrics import HTTP_REQUEST_SECONDS, register_stats
+from singleflight import single_flight, single_flight_stats
+from scheduler import LLMOverloaded, llm_scheduler
 from user_prof import (
     add_quiz_result, 
     analyze_performance, 
@@ -16,15 +37,47 @@ from user_prof import (
     create_chat_session,
     get_chat_sessions,
     get_chat_history,
+    get_chat_summary,
     delete_chat_session,
-    add_message_to_chat
+    add_message_to_chat,
+    profile_cache_stats
 )
 
+# Key=value log lines; DEBUG output is skipped before formatting unless LOG_LEVEL=DEBUG
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="ts=%(asctime)s level=%(levelname)s logger=%(name)s msg=%(message)s",
+)
+# httpx logs every Ollama call at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+async def _generate_quiz_question(topic, difficulty):
+    return await amcq_assessment(topic=topic, difficulty=difficulty, priority="background")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep the quiz question bank topped up in the background
+    refill_task = asyncio.create_task(question_bank.run(_generate_quiz_question))
+    # Re-scrape events on a schedule so requests never wait on Google
+    events_task = asyncio.create_task(events_cache.run())
+    yield
+    for task in (refill_task, events_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    # Release the pooled Ollama connections on shutdown
+    await llm_client.aclose()
+    response_cache.save()
+
 # FastAPI app initialisation
 app = FastAPI(
     title = "AI Career Coach API",
     description = "An API for an AI Career Coach Assistant application.",
     veersion = "1.0.0",
+    lifespan = lifespan,
 )
 
 # CORSMiddleware setup
@@ -39,8 +92,66 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the browser read the pagination cursor of /api/jobs and the chat endpoints
+    expose_headers=["X-Next-Cursor"],
 )
 
+class RequestMetricsMiddleware:
+    """Records the latency of every request by route template (not raw path), including streamed bodies."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status_code)
+            ).observe(time.perf_counter() - start)
+
+app.add_middleware(RequestMetricsMiddleware)
+
+# The numbers behind /api/stats, also exported as gauges on /metrics
+STATS_SOURCES = {
+    "profile_cache": profile_cache_stats,
+    "kv_context_cache": context_cache.stats,
+    "response_cache": response_cache.stats,
+    "question_bank": question_bank.stats,
+    "mcq": mcq_stats,
+    "analytics": quiz_results_store.stats,
+    "resource_search": resource_search.stats,
+    "events": events_cache.stats,
+    "jobs": job_store.stats,
+    "llm": llm_client.stats,
+    "single_flight": single_flight_stats,
+    "llm_scheduler": llm_scheduler.stats,
+    "chat_search": chat_search_index.stats,
+    "vector_memory": vector_memory.stats,
+}
+register_stats(STATS_SOURCES)
+
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    """Shed LLM work: 429 when the user has too much queued, 503 when the model is saturated."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # --- Models ---
 class ChatMessage(BaseModel):
     user: str
@@ -48,10 +159,20 @@ class ChatMessage(BaseModel):
 
 class NewChatMessageRequest(BaseModel):
     message: str
+    # False skips the response cache and always generates a fresh answer
+    use_cache: bool = True
 
 class ChatSessionInfo(BaseModel):
     id: str
     title: str
+    message_count: int = 0
+    updated_at: Optional[float] = None
+
+class ChatSearchHit(BaseModel):
+    chat_id: str
+    turn: int
+    score: float
+    snippet: str
 
 # --- API Endpoints ---
 
@@ -59,12 +180,40 @@ class ChatSessionInfo(BaseModel):
 def read_root():
     return {"message": "Welcome to the AI Career Assistant API"}
 
+@app.get("/api/stats")
+async def get_stats():
+    """Returns internal cache counters for monitoring."""
+    return {name: stats() for name, stats in STATS_SOURCES.items()}
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # --- New Chat Session Endpoints ---
 
+def _paged(items, limit, response):
+    """Trims a limit + 1 lookahead fetch to one page and sets X-Next-Cursor if there's more."""
+    if limit is not None and len(items) > limit:
+        items = items[:limit]
+        response.headers["X-Next-Cursor"] = str(items[-1]["seq"])
+    return items
+
 @app.get("/api/chats/{user_id}", response_model=List[ChatSessionInfo])
-async def get_user_chat_sessions(user_id: str):
-    """Gets a list of all chat sessions for a user."""
-    return get_chat_sessions(user_id)
+async def get_user_chat_sessions(
+    user_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    newest_first: bool = False,
+):
+    """Gets a user's chat sessions, all of them unless a limit is given.
+
+    For the next page pass X-Next-Cursor as `after` (or as `before` with newest_first).
+    """
+    sessions = get_chat_sessions(user_id, None if limit is None else limit + 1, before, after, newest_first)
+    return _paged(sessions, limit, response)
 
 @app.post("/api/chats/{user_id}", response_model=ChatSessionInfo)
 async def create_new_chat_session(user_id: str):
@@ -72,10 +221,31 @@ async def create_new_chat_session(user_id: str):
     new_chat_id = create_chat_session(user_id)
     return {"id": new_chat_id, "title": "New Chat"}
 
+# Declared before /api/chats/{user_id}/{chat_id} so "search" isn't taken for a chat id
+@app.get("/api/chats/{user_id}/search", response_model=List[ChatSearchHit])
+async def search_chat_history(user_id: str, q: str, limit: int = Query(20, ge=1, le=100)):
+    """Full-text search over all of a user's chat sessions, best matching turns first.
+
+    `turn` is the position of the matching message pair in its session's history.
+    """
+    return await run_in_threadpool(chat_search_index.search, user_id, q, limit)
+
 @app.get("/api/chats/{user_id}/{chat_id}", response_model=List[ChatMessage])
-async def get_specific_chat_history(user_id: str, chat_id: str):
-    """Gets the message history for a specific chat session."""
-    return get_chat_history(user_id, chat_id)
+async def get_specific_chat_history(
+    user_id: str,
+    chat_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    newest_first: bool = False,
+):
+    """Gets the message history for a specific chat session, all of it unless a limit is given.
+
+    For the next page pass X-Next-Cursor as `after` (or as `before` with newest_first).
+    """
+    history = get_chat_history(user_id, chat_id, None if limit is None else limit + 1, before, after, newest_first)
+    return _paged(history, limit, response)
 
 @app.delete("/api/chats/{user_id}/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_a_chat_session(user_id: str, chat_id: str):
@@ -84,13 +254,64 @@ async def delete_a_chat_session(user_id: str, chat_id: str):
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.post("/api/chats/{user_id}/{chat_id}/messages", response_model=ChatMessage)
-async def post_message_to_chat(user_id: str, chat_id: str, request: NewChatMessageRequest):
+async def post_message_to_chat(user_id: str, chat_id: str, request: NewChatMessageRequest, background_tasks: BackgroundTasks):
     """Posts a new message to a chat, gets a bot response, and saves the turn."""
-    history = get_chat_history(user_id, chat_id)
-    bot_response = chat(request.message, history=history)
-    add_message_to_chat(user_id, chat_id, request.message, bot_response)
+    history = await run_in_threadpool(get_chat_history, user_id, chat_id)
+    summary = await run_in_threadpool(get_chat_summary, user_id, chat_id)
+    bot_response = await achat(
+        request.message, history=history, summary=summary, session=(user_id, chat_id), use_cache=request.use_cache
+    )
+    await run_in_threadpool(add_message_to_chat, user_id, chat_id, request.message, bot_response)
+    # Fold older turns into the rolling summary after the response has been sent
+    background_tasks.add_task(arefresh_chat_summary, user_id, chat_id)
     return {"user": request.message, "bot": bot_response}
 
+def _sse(data, event=None):
+    """Formats one Server-Sent Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/api/chats/{user_id}/{chat_id}/messages/stream")
+async def stream_message_to_chat(user_id: str, chat_id: str, request: NewChatMessageRequest, http_request: Request):
+    """
+    Posts a new message to a chat and streams the bot response as Server-Sent Events.
+
+    Each token arrives as `data: {"token": ...}`. Once the model is done, the turn is
+    saved and a final `event: done` carries the whole message. If the client goes
+    away, the upstream generation is cancelled and nothing is saved.
+    """
+    # Refuse now rather than after the 200 has gone out
+    llm_scheduler.check("interactive", user_id)
+    history = await run_in_threadpool(get_chat_history, user_id, chat_id)
+    summary = await run_in_threadpool(get_chat_summary, user_id, chat_id)
+
+    async def event_stream():
+        tokens = stream_chat(
+            request.message, history=history, summary=summary, session=(user_id, chat_id), use_cache=request.use_cache
+        )
+        try:
+            parts = []
+            async for token in tokens:
+                if await http_request.is_disconnected():
+                    return
+                parts.append(token)
+                yield _sse({"token": token})
+            bot_response = "".join(parts)
+            await run_in_threadpool(add_message_to_chat, user_id, chat_id, request.message, bot_response)
+            yield _sse({"user": request.message, "bot": bot_response}, event="done")
+        except Exception as e:
+            yield _sse({"detail": f"Error generating response: {str(e)}"}, event="error")
+        finally:
+            # Closing the upstream stream drops the connection, so Ollama stops generating for a departed client
+            await tokens.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(arefresh_chat_summary, user_id, chat_id),
+    )
+
 
 # --- Other Endpoints (Quizzes, Performance, etc.) ---
 
@@ -115,22 +336,65 @@ class QuizSubmission(BaseModel):
 
 
 @app.get("/api/quiz", response_model = QuizQuestion)
-async def get_quiz_question(topic : str = "random", difficulty : str = "easy"):
+async def get_quiz_question(topic : str = "random", difficulty : str = "easy", user_id : Optional[str] = None):
     """
-    Generates and returns a quiz question based on the specified topic and difficulty.
+    Returns a quiz question for the specified topic and difficulty.
+
+    Questions come from the pre-generated question bank, skipping ones `user_id` has
+    already seen; a question is only generated live when the bank has none left, and
+    concurrent requests for the same topic and difficulty share that generation.
+    With a `user_id`, the options are shuffled per user.
     """
     if topic == "random":
         import random
-        topics = ["data science", "machine learning", 
-      "deep learning", "statistics", "data engineering", "AI ethics"]
-        topic = random.choice(topics)
+        topic = random.choice(QUIZ_TOPICS)
+
+    question_data = question_bank.take(topic, difficulty, user_id)
+    if question_data is not None:
+        return shuffle_options(question_data, user_id) if user_id else question_data
 
     try : 
-        question_data = mcq_assessment(topic = topic, difficulty=difficulty, chat_fn=chat)
-        return question_data
+        question_data = await amcq_assessment(topic = topic, difficulty=difficulty, user_id=user_id)
+        question_bank.add(topic, difficulty, question_data, served_to=user_id)
+        return shuffle_options(question_data, user_id) if user_id else question_data
+    except LLMOverloaded:
+        raise
     except Exception as e:
         from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"Error generating quiz question: {str(e)}")
+
+@app.get("/api/quiz/batch")
+async def get_quiz_batch(topics : str = "random", n : int = Query(5, ge=1, le=MCQ_BATCH_MAX), difficulty : str = "easy", user_id : Optional[str] = None):
+    """
+    Generates several quiz questions in a single model call.
+
+    `topics` is a comma-separated list (or "random"), cycled through for the `n` questions.
+    The response is NDJSON: one QuizQuestion per line, sent as soon as the model has
+    finished writing it. A malformed question is skipped rather than failing the batch.
+    """
+    if topics == "random":
+        import random
+        topic_list = random.sample(QUIZ_TOPICS, len(QUIZ_TOPICS))
+    else:
+        topic_list = [t.strip() for t in topics.split(",") if t.strip()] or QUIZ_TOPICS
+    llm_scheduler.check("quiz", user_id)
+
+    async def question_stream():
+        try:
+            async for question_data in amcq_assessment_batch(topic_list, n=n, difficulty=difficulty, user_id=user_id):
+                try:
+                    question = QuizQuestion.model_validate(question_data)
+                except ValidationError as e:
+                    # Only this question is dropped; the rest of the batch keeps streaming
+                    logger.warning("Dropping invalid question from batch: %s", e)
+                    continue
+                # Banked only once it is known to be servable
+                question_bank.add(question_data["topic"], difficulty, question_data, served_to=user_id)
+                yield question.model_dump_json() + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Error generating quiz questions: {str(e)}"}) + "\n"
+
+    return StreamingResponse(question_stream(), media_type="application/x-ndjson")
     
 
 @app.post("/api/quiz/result")
@@ -160,16 +424,14 @@ async def get_performance_analysis(user_id: str):
     """
     Analyzes and returns a user's performance data.
     """
-    print("\n--- Starting Performance Analysis ---")
     try:
         # Step 1: Call the analysis function
-        print(f"Analyzing performance for user: {user_id}")
         analysis_data = analyze_performance(user_id)
-        print(f"1. Raw data from analyze_performance: {analysis_data}")
+        logger.debug("Performance analysis user_id=%s data=%s", user_id, analysis_data)
 
         # Step 2: Check for logical errors from the function
         if "error" in analysis_data:
-            print(f"2. Function returned a known error: {analysis_data['error']}")
+            logger.debug("Performance analysis user_id=%s error=%r", user_id, analysis_data["error"])
             # If there's no quiz history, return an empty analysis for the frontend to handle
             if analysis_data["error"] == "No quiz history available for analysis.":
                 return PerformanceAnalysis(
@@ -181,21 +443,52 @@ async def get_performance_analysis(user_id: str):
             raise HTTPException(status_code=404, detail=analysis_data["error"])
 
         # Step 3: Manually validate against the Pydantic model
-        print("3. Data looks okay, attempting to validate with Pydantic model...")
         validated_data = PerformanceAnalysis.model_validate(analysis_data)
-        print("4. Pydantic validation successful!")
         
         return validated_data
 
     except Exception as e:
-        # Step 4: Catch and print ANY other exception
-        print("\n--- AN UNEXPECTED ERROR OCCURRED ---")
-        import traceback
-        traceback.print_exc() # This will force a traceback to be printed
-        print("-------------------------------------\n")
+        # Step 4: Log ANY other exception with its traceback
+        logger.exception("Performance analysis failed user_id=%s", user_id)
         from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
+class TopicPercentile(BaseModel):
+    accuracy : float
+    questions : int
+    cohort_size : int
+    percentile : Optional[float] = None
+
+class PerformancePercentiles(BaseModel):
+    user_id : str
+    topics : dict[str, TopicPercentile]
+
+@app.get("/api/performance/{user_id}/percentiles", response_model=PerformancePercentiles)
+async def get_performance_percentiles(user_id: str, min_questions: int = Query(ANALYTICS_MIN_QUESTIONS, ge=1)):
+    """Ranks the user's per-topic accuracy against every other user who answered enough questions in it."""
+    topics = await run_in_threadpool(quiz_results_store.user_percentiles, user_id, min_questions)
+    if topics is None:
+        from fastapi import HTTPException
+        raise HTTPException(status_code=404, detail="No quiz results found for this user.")
+    return PerformancePercentiles(user_id=user_id, topics=topics)
+
+class DifficultyStats(BaseModel):
+    results : int
+    accuracy : float
+
+class TopicAnalytics(BaseModel):
+    results : int
+    accuracy : float
+    users : int
+    user_accuracy : dict[str, float]
+    by_difficulty : dict[str, DifficultyStats]
+    difficulty_calibrated : bool
+
+@app.get("/api/analytics/topics", response_model=dict[str, TopicAnalytics])
+async def get_topic_analytics(min_questions: int = Query(ANALYTICS_MIN_QUESTIONS, ge=1)):
+    """Cohort view per topic: overall accuracy, spread of per-user accuracy and accuracy by difficulty."""
+    return await run_in_threadpool(quiz_results_store.topic_analytics, min_questions)
+
 class CourseResource(BaseModel):
     title: str
     url: str
@@ -203,6 +496,8 @@ class CourseResource(BaseModel):
     topics_covered: List[str]
     difficulty_level: str
 
+_recommendations_flight = single_flight("recommendations")
+
 @app.get("/api/recommendations/{user_id}", response_model=List[CourseResource])
 async def get_recommendations(user_id: str):
     """
@@ -212,12 +507,23 @@ async def get_recommendations(user_id: str):
     try:
         # This function already returns a list of course dictionaries
         # that match the CourseResource model.
-        resources = recommend_resources(user_id)
+        # Repeated requests for a user while one is running (e.g. a double-mounted page) share it
+        resources = await _recommendations_flight.do(user_id, lambda: run_in_threadpool(recommend_resources, user_id))
         return resources
     except Exception as e:
         from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
 
+@app.get("/api/resources/search", response_model=List[CourseResource])
+async def search_resources(
+    q: str = "",
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Full-text search over the local resource catalog, optionally filtered by topic and difficulty."""
+    return resource_catalog.search(q, topic=topic, difficulty=difficulty, limit=limit)
+
 class Job(BaseModel):
     id: int
     title: str
@@ -231,54 +537,34 @@ class Event(BaseModel):
     description: str
     url: str
 
-def load_jobs_and_events():
-    """A helper function to load data from the new JSON file."""
-    try:
-        with open("jobs_and_events.json", "r") as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {"jobs": [], "events": []}
-
 @app.get("/api/jobs", response_model=List[Job])
-async def get_jobs():
-    """Returns a list of job opportunities from a static JSON file."""
-    data = load_jobs_and_events()
-    return data.get("jobs", [])
+async def get_jobs(
+    response: Response,
+    location: Optional[str] = None,
+    job_type: Optional[str] = Query(None, alias="type"),
+    company: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=JOBS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Returns job opportunities, filtered by location, type, company and title words.
+
+    Without `limit` or `cursor` every matching job is returned. Otherwise one page
+    comes back (JOBS_PAGE_SIZE jobs by default) and the cursor for the next page,
+    if there is one, is sent in the X-Next-Cursor header.
+    """
+    if limit is None and cursor is not None:
+        limit = JOBS_PAGE_SIZE
+    try:
+        jobs, next_cursor = job_store.query(location, job_type, company, q, limit, cursor)
+    except ValueError as e:
+        from fastapi import HTTPException
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return jobs
 
 @app.get("/api/events", response_model=List[Event])
 async def get_events():
-    """Returns a list of upcoming events by scraping Google."""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    search_query = "online data science events"
-    search_url = f"https://www.google.com/search?q={search_query.replace(' ', '+')}"
-    events = []
-    try:
-        response = requests.get(search_url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        for i, result in enumerate(soup.find_all('div', class_='g')):
-            title_element = result.find('h3')
-            link_element = result.find('a')
-            description_element = result.find('div', style="display: -webkit-box")
-
-            if title_element and link_element and description_element:
-                title = title_element.get_text()
-                url = link_element['href']
-                description = description_element.get_text()
-
-                if "›" in title or not url.startswith('http'):
-                    continue
-                
-                events.append({
-                    "id": i,
-                    "title": title,
-                    "description": description,
-                    "url": url
-                })
-    except Exception as e:
-        print(f"Could not perform event search: {e}")
-
-    return events[:10]
\ No newline at end of file
+    """Returns upcoming events: the static ones plus the last successful Google scrape, refreshed in the background."""
+    return events_cache.get()
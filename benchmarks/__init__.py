@@ -0,0 +1 @@
+"""Benchmarks and load tests; see the Benchmarks section of the README."""
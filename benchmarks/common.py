@@ -0,0 +1,103 @@
+"""Shared helpers: percentile summaries and JSON result files that can be diffed between runs."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, wall_seconds=None, errors=0):
+    """p50/p95/p99/mean/max in milliseconds, plus throughput in operations per second."""
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "p50_ms": _ms(percentile(values, 50)),
+        "p95_ms": _ms(percentile(values, 95)),
+        "p99_ms": _ms(percentile(values, 99)),
+        "mean_ms": _ms(sum(values) / len(values)) if values else None,
+        "max_ms": _ms(values[-1]) if values else None,
+    }
+    if wall_seconds:
+        summary["throughput_per_s"] = round(len(values) / wall_seconds, 2)
+    return summary
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(name, config, results, out=None):
+    """Prints the run as JSON and writes it to `out` (default benchmarks/results/<name>-<time>.json)."""
+    report = {
+        "benchmark": name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Results written to {out}", file=sys.stderr)
+    return report
+
+
+def isolated_environment(workdir, ollama_url=None, search_url=None):
+    """Points every data file at `workdir` (and the LLM/scrapers at a fake server) via env vars.
+
+    Must run before the app modules are imported, since they read their
+    configuration at import time.
+    """
+    env = {
+        "USER_PROFILES_FILE": os.path.join(workdir, "user_profiles.json"),
+        "USER_PROFILES_DB": os.path.join(workdir, "user_profiles.db"),
+        "QUESTION_BANK_FILE": os.path.join(workdir, "question_bank.json"),
+        "RESOURCE_SEARCH_CACHE_FILE": os.path.join(workdir, "resource_search_cache.json"),
+        "EVENTS_CACHE_FILE": os.path.join(workdir, "events_cache.json"),
+        # Never created, so a local llm_config.json can't route the benchmark away from the fake server
+        "LLM_CONFIG_FILE": os.path.join(workdir, "llm_config.json"),
+        "RESOURCE_CATALOG_FILES": os.path.join(REPO_ROOT, "course_ressource.json"),
+        "JOBS_AND_EVENTS_FILE": os.path.join(REPO_ROOT, "jobs_and_events.json"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    }
+    if ollama_url:
+        env["OLLAMA_URL"] = f"{ollama_url}/api/generate"
+    if search_url:
+        env["RESOURCE_SEARCH_URL"] = f"{search_url}/search?q={{query}}"
+        env["EVENTS_SEARCH_URL"] = f"{search_url}/search?q=events"
+    os.environ.update(env)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,179 @@
+"""Local stand-in for Ollama's /api/generate, for benchmarks and load tests.
+
+Replies are canned but shaped like Ollama's: chat prompts get a short text
+answer, single-MCQ prompts (or any request with a `format`) get an MCQ object,
+and batch prompts ("Generate N multiple-choice ...") get a JSON array wrapped in
+prose, with a configurable share of malformed elements. Timing is simulated
+with a time-to-first-token latency plus a token rate, for both streaming and
+non-streaming calls. GET /search returns a small results page, so the
+recommendation and events scrapers can be pointed here too.
+
+    python -m benchmarks.fake_ollama --port 11435 --latency 0.2 --tokens-per-sec 40
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_REPLY = (
+    "A good first step is to get comfortable with Python and statistics, then build a few small "
+    "projects with real data and write about what you learned."
+)
+SEARCH_PAGE = """<html><body>
+<div class="g"><div><a href="https://example.com/course-{n}"><h3>Example course {n}</h3></a>
+<div style="display: -webkit-box"><span class="VwiC3b">An example result.</span></div></div></div>
+</body></html>"""
+
+_BATCH_RE = re.compile(r"Generate (\d+) multiple-choice")
+
+
+def _mcq(rng, topic="statistics"):
+    return {
+        "topic": topic,
+        "question": f"Which statement about {topic} is true? (#{rng.randrange(10**9)})",
+        "options": ["Option A", "Option B", "Option C", "Option D"],
+        "correct_answer": str(rng.randint(1, 4)),
+        "explanation": "Canned explanation.",
+    }
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply_text(self, body):
+        options = self.server.options
+        rng = self.server.rng
+        prompt = body.get("prompt", "")
+        batch = _BATCH_RE.search(prompt)
+        if batch:
+            items = []
+            for _ in range(int(batch.group(1))):
+                if rng.random() < options["malformed_rate"]:
+                    items.append('{"question": "broken", "options": ["only one"], "correct_answer": 9}')
+                else:
+                    items.append(json.dumps(_mcq(rng)))
+            return "Here are your questions:\n```json\n[" + ", ".join(items) + "]\n```"
+        if "format" in body or "multiple-choice" in prompt:
+            if rng.random() < options["malformed_rate"]:
+                return '{"question": "Unterminated'
+            return json.dumps(_mcq(rng))
+        return CHAT_REPLY
+
+    def _tokens(self, text):
+        # Roughly 4 characters per token, like the estimate used for prompt budgeting
+        return [text[i:i + 4] for i in range(0, len(text), 4)] or [""]
+
+    def _final(self, body, tokens, started):
+        elapsed_ns = int((time.perf_counter() - started) * 1e9)
+        prompt_tokens = len(body.get("prompt", "")) // 4 + 1
+        return {
+            "model": body.get("model", ""),
+            "response": "",
+            "done": True,
+            "context": list(range(min(prompt_tokens + len(tokens), 4096))),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.server.options["latency"] * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": max(elapsed_ns - int(self.server.options["latency"] * 1e9), 0),
+            "total_duration": elapsed_ns,
+        }
+
+    def do_POST(self):
+        if not self.path.startswith("/api/generate"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.count_request()
+        started = time.perf_counter()
+        tokens = self._tokens(self._reply_text(body))
+        per_token = 1.0 / self.server.options["tokens_per_sec"]
+        time.sleep(self.server.options["latency"])
+
+        if body.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(per_token)
+                    self._chunk({"model": body.get("model", ""), "response": token, "done": False})
+                self._chunk(self._final(body, tokens, started))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+        else:
+            time.sleep(per_token * len(tokens))
+            data = {**self._final(body, tokens, started), "response": "".join(tokens)}
+            self._send(200, "application/json", json.dumps(data).encode())
+
+    def do_GET(self):
+        if self.path.startswith("/search"):
+            self._send(200, "text/html", SEARCH_PAGE.format(n=self.server.rng.randrange(1000)).encode())
+        else:
+            self.send_error(404)
+
+    def _chunk(self, data):
+        line = (json.dumps(data) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _send(self, status, content_type, payload):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.05, tokens_per_sec=200.0, malformed_rate=0.0, seed=0):
+        super().__init__(address, FakeOllamaHandler)
+        self.options = {"latency": latency, "tokens_per_sec": tokens_per_sec, "malformed_rate": malformed_rate}
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_server(port=0, **options):
+    """Starts a fake server on a background thread and returns it; .url is its base URL."""
+    server = FakeOllamaServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of MCQs returned malformed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = FakeOllamaServer(("127.0.0.1", args.port), args.latency, args.tokens_per_sec, args.malformed_rate, args.seed)
+    print(f"Fake Ollama listening on {server.url}/api/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Load test: concurrent simulated users against the real FastAPI app and a fake Ollama.
+
+Starts the fake Ollama server and api.py under uvicorn (both in-process, on
+local ports, with every data file in a temporary directory), then runs N users
+for a fixed duration. Each user loops over a weighted mix of chat turns
+(plain and streamed), quiz fetches, result submissions, and performance and
+recommendation reads. Reports per-operation latency percentiles and throughput as JSON.
+
+    python -m benchmarks.loadtest --users 20 --duration 30 --latency 0.2 --tokens-per-sec 50
+"""
+import argparse
+import asyncio
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.common import isolated_environment, summarize, write_results
+from benchmarks.fake_ollama import start_server
+
+# Relative weights of what a simulated user does next
+SCENARIO = {
+    "chat_turn": 4,
+    "chat_stream": 2,
+    "quiz_question": 4,
+    "quiz_submit": 2,
+    "performance": 2,
+    "recommendations": 1,
+    "chat_list": 1,
+}
+TOPICS = ["python", "statistics", "machine learning", "deep learning", "data engineering"]
+MESSAGES = [
+    "hello",
+    "how do I become a data scientist?",
+    "what should I learn after pandas?",
+    "can you explain overfitting?",
+    "which projects look good on a CV?",
+]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_api(port):
+    import uvicorn
+    import api
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+class SimulatedUser:
+    def __init__(self, client, user_id, rng, record):
+        self.client = client
+        self.user_id = user_id
+        self.rng = rng
+        self.record = record
+        self.chat_id = None
+
+    async def run(self, deadline):
+        operations, weights = zip(*SCENARIO.items())
+        while time.perf_counter() < deadline:
+            operation = self.rng.choices(operations, weights)[0]
+            start = time.perf_counter()
+            try:
+                await getattr(self, operation)()
+                self.record(operation, time.perf_counter() - start, ok=True)
+            except Exception:
+                self.record(operation, time.perf_counter() - start, ok=False)
+
+    async def _ensure_chat(self):
+        if self.chat_id is None or self.rng.random() < 0.1:
+            response = await self.client.post(f"/api/chats/{self.user_id}")
+            response.raise_for_status()
+            self.chat_id = response.json()["id"]
+        return self.chat_id
+
+    async def chat_turn(self):
+        chat_id = await self._ensure_chat()
+        response = await self.client.post(
+            f"/api/chats/{self.user_id}/{chat_id}/messages", json={"message": self.rng.choice(MESSAGES)}
+        )
+        response.raise_for_status()
+
+    async def chat_stream(self):
+        chat_id = await self._ensure_chat()
+        async with self.client.stream(
+            "POST", f"/api/chats/{self.user_id}/{chat_id}/messages/stream", json={"message": self.rng.choice(MESSAGES)}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event: error"):
+                    raise RuntimeError("stream reported an error")
+
+    async def quiz_question(self):
+        response = await self.client.get(
+            "/api/quiz",
+            params={"topic": self.rng.choice(TOPICS), "difficulty": self.rng.choice(["easy", "medium", "hard"]),
+                    "user_id": self.user_id},
+        )
+        response.raise_for_status()
+
+    async def quiz_submit(self):
+        results = [
+            {"topic": self.rng.choice(TOPICS), "difficulty": self.rng.choice(["easy", "medium", "hard"]),
+             "correct": self.rng.random() < 0.6}
+            for _ in range(self.rng.randint(1, 10))
+        ]
+        response = await self.client.post("/api/quiz/result", json={
+            "user_id": self.user_id, "timestamp": str(datetime.now()), "type": "full_quiz", "results": results,
+        })
+        response.raise_for_status()
+
+    async def performance(self):
+        response = await self.client.get(f"/api/performance/{self.user_id}")
+        # 404 is the expected answer until the user has a profile
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    async def recommendations(self):
+        (await self.client.get(f"/api/recommendations/{self.user_id}")).raise_for_status()
+
+    async def chat_list(self):
+        (await self.client.get(f"/api/chats/{self.user_id}", params={"limit": 20})).raise_for_status()
+
+
+async def _drive(base_url, users, duration, seed):
+    import httpx
+
+    latencies = {}
+    errors = {}
+
+    def record(operation, seconds, ok):
+        if ok:
+            latencies.setdefault(operation, []).append(seconds)
+        else:
+            errors[operation] = errors.get(operation, 0) + 1
+
+    limits = httpx.Limits(max_connections=users * 2, max_keepalive_connections=users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(
+            SimulatedUser(client, f"load_user_{i}", random.Random(seed + i), record).run(deadline)
+            for i in range(users)
+        ))
+        wall = time.perf_counter() - started
+
+    results = {
+        operation: summarize(latencies.get(operation, []), wall, errors.get(operation, 0))
+        for operation in SCENARIO
+    }
+    results["all"] = summarize([s for values in latencies.values() for s in values], wall, sum(errors.values()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--latency", type=float, default=0.1, help="fake Ollama time to first token, seconds")
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default benchmarks/results/loadtest-<time>.json)")
+    args = parser.parse_args()
+
+    fake = start_server(latency=args.latency, tokens_per_sec=args.tokens_per_sec,
+                        malformed_rate=args.malformed_rate, seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    isolated_environment(workdir, ollama_url=fake.url, search_url=fake.url)
+    port = _free_port()
+    server, thread = _start_api(port)
+    try:
+        results = asyncio.run(_drive(f"http://127.0.0.1:{port}", args.users, args.duration, args.seed))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        fake.shutdown()
+    results["ollama_requests"] = fake.requests
+    write_results("loadtest", {**vars(args), "workdir": workdir}, results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Micro-benchmarks for the profile layer at synthetic sizes.
+
+For each user count, writes a synthetic set of profiles with save_user_profiles(),
+reads it back with load_user_profiles(), then times analyze_performance() for
+random users with a cold and a warm profile cache. Runs against a temporary
+database/file, for the configured backend.
+
+    python -m benchmarks.microbench --sizes 10,1000,100000 --backend sqlite
+"""
+import argparse
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks.common import isolated_environment, summarize, timed, write_results
+
+TOPICS = ["python", "statistics", "machine learning", "deep learning", "data engineering", "sql"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+def synthetic_profiles(n_users, rng, quizzes=5, questions=10, sessions=2, turns=5):
+    """Profiles shaped like the real ones: quiz sessions with per-question results plus chat sessions."""
+    start = datetime(2025, 1, 1)
+    profiles = {}
+    for u in range(n_users):
+        quiz_history = [
+            {
+                "timestamp": str(start + timedelta(minutes=rng.randrange(500_000))),
+                "type": "full_quiz",
+                "score": rng.randrange(300),
+                "results": [
+                    {"topic": rng.choice(TOPICS), "difficulty": rng.choice(DIFFICULTIES), "correct": rng.random() < 0.6}
+                    for _ in range(questions)
+                ],
+            }
+            for _ in range(quizzes)
+        ]
+        chat_sessions = {
+            f"session_{u}_{s}": {
+                "id": f"session_{u}_{s}",
+                "title": "How do I become a data scientist?",
+                "history": [{"user": f"question {t}", "bot": "An answer of typical length. " * 8} for t in range(turns)],
+            }
+            for s in range(sessions)
+        }
+        profiles[f"user_{u}"] = {"quiz_history": quiz_history, "chat_sessions": chat_sessions}
+    return profiles
+
+
+def run_size(user_prof, storage_module, n_users, samples, rng):
+    profiles = synthetic_profiles(n_users, rng)
+    results = {}
+
+    # save_user_profiles replaces the whole store, so each size starts from a clean slate
+    save_seconds, _ = timed(user_prof.save_user_profiles, profiles)
+    results["save_user_profiles"] = summarize([save_seconds])
+    results["save_user_profiles"]["users_per_s"] = round(n_users / save_seconds, 1)
+
+    load_seconds, loaded = timed(user_prof.load_user_profiles)
+    assert len(loaded) == n_users
+    results["load_user_profiles"] = summarize([load_seconds])
+
+    user_ids = [f"user_{rng.randrange(n_users)}" for _ in range(samples)]
+    cold = []
+    for user_id in user_ids:
+        user_prof._profile_cache.clear()
+        seconds, _ = timed(user_prof.analyze_performance, user_id)
+        cold.append(seconds)
+    results["analyze_performance_cold"] = summarize(cold, sum(cold))
+    warm = [timed(user_prof.analyze_performance, user_id)[0] for user_id in user_ids]
+    results["analyze_performance_warm"] = summarize(warm, sum(warm))
+
+    path = storage_module.get_storage().path
+    results["storage_bytes"] = sum(
+        os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p)
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000", help="comma-separated user counts")
+    parser.add_argument("--backend", choices=["sqlite", "json"], default="sqlite")
+    parser.add_argument("--samples", type=int, default=200, help="analyze_performance calls per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default benchmarks/results/microbench-<time>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="microbench-")
+    isolated_environment(workdir)
+    os.environ["USER_PROFILES_BACKEND"] = args.backend
+    import storage
+    import user_prof
+
+    rng = random.Random(args.seed)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = {str(n): run_size(user_prof, storage, n, args.samples, rng) for n in sizes}
+    write_results("microbench", {**vars(args), "workdir": workdir}, results, args.out)
+
+
+if __name__ == "__main__":
+    main()
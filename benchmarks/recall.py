@@ -0,0 +1,72 @@
+"""Latency of recalling relevant past turns from a user's vector memory at synthetic sizes.
+
+For each size, embeds that many synthetic chat turns into a TurnIndex, then
+times recall for random queries: embedding the query, scoring every stored turn
+and picking the top k, plus building the chat prompt around the hits.
+
+    python -m benchmarks.recall --sizes 1000,10000,100000
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from benchmarks.common import isolated_environment, summarize, timed, write_results
+
+TOPICS = ["python", "statistics", "machine learning", "deep learning", "data engineering", "sql",
+          "career change", "interviews", "portfolio", "cloud", "visualization", "nlp"]
+WORDS = ("model data pipeline feature training query join window spark pandas numpy regression "
+         "classification cluster resume recruiter salary project notebook dashboard deploy docker "
+         "airflow warehouse kaggle transformer embedding metric accuracy gradient tensor").split()
+
+
+def synthetic_turn(rng, session):
+    topic = rng.choice(TOPICS)
+    user = f"How do I get better at {topic} with {' '.join(rng.choices(WORDS, k=6))}?"
+    bot = f"For {topic}, focus on {' '.join(rng.choices(WORDS, k=40))}."
+    return f"session_{session}", user, bot
+
+
+def run_size(n_turns, samples, k, rng):
+    from bot import build_prompt
+    from vector_memory import TurnIndex
+
+    index = TurnIndex()
+    build_start = time.perf_counter()
+    for t in range(n_turns):
+        chat_id, user, bot = synthetic_turn(rng, t // 20)
+        index.add(chat_id, None, user, bot)
+    build_seconds = time.perf_counter() - build_start
+
+    queries = [f"what did we say about {rng.choice(TOPICS)} and {rng.choice(WORDS)}" for _ in range(samples)]
+    recall, prompt = [], []
+    for query in queries:
+        seconds, hits = timed(index.search, query, k, exclude_chat_id="session_0")
+        recall.append(seconds)
+        prompt.append(timed(build_prompt, query, [], None, hits)[0])
+    return {
+        "build": {"turns_per_s": round(n_turns / build_seconds, 1), "seconds": round(build_seconds, 3)},
+        "recall": summarize(recall, sum(recall)),
+        "build_prompt": summarize(prompt, sum(prompt)),
+        "index_bytes": index.nbytes(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated turn counts")
+    parser.add_argument("--samples", type=int, default=500, help="recalls per size")
+    parser.add_argument("--k", type=int, default=4, help="turns recalled per query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default benchmarks/results/recall-<time>.json)")
+    args = parser.parse_args()
+
+    isolated_environment(tempfile.mkdtemp(prefix="recall-"))
+    rng = random.Random(args.seed)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = {str(n): run_size(n, args.samples, args.k, rng) for n in sizes}
+    write_results("recall", vars(args), results, args.out)
+
+
+if __name__ == "__main__":
+    main()
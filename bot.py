@@ -1,33 +1,145 @@
+import asyncio
+import logging
+from llm_client import llm_client
+from context import build_chat_prompt, build_summary_prompt, format_memories, turns_to_summarize
+from user_prof import get_chat_history, get_chat_summary, update_chat_summary
+from kv_cache import context_cache
+from response_cache import normalize_message, response_cache
+from vector_memory import VECTOR_MEMORY_TOP_K, vector_memory
 
+logger = logging.getLogger(__name__)
 
-from memory import add_conversation, load_memory, save_memory
-
-import requests, json
-import re
-from mcq import mcq_assessment
-
-def chat(message, history=None, model="mistral"):
-    url = "http://localhost:11434/api/generate"
-    
-    # Add a system instruction to help the bot remember and use the user's name
-    system_instruction = (
-        "You are an AI Career Coach, a specialized assistant designed to help students and professionals navigate their careers in Data and Artificial Intelligence. "
-        "Your goal is to provide accurate information about career paths, assess user knowledge, and recommend learning resources. "
-        "Be encouraging, professional, and focus your answers strictly on topics related to Data and AI careers."
-        " Don't forget to check the conversation history to provide contextually relevant responses."
-        "Give small and organize responses "
-    )
-    if history:
-        history_prompt = "\n".join([
-            f"User: {h['user']}\nBot: {h['bot']}" for h in history
-        ])
-        full_prompt = f"{system_instruction}\n{history_prompt}\nUser: {message}"
-    else:
-        full_prompt = f"{system_instruction}\nUser: {message}"
-    payload = {"model": model, "prompt": full_prompt, "stream": False}
-    response = requests.post(url, json=payload)
-    data = response.json()
+# Add a system instruction to help the bot remember and use the user's name
+SYSTEM_INSTRUCTION = (
+    "You are an AI Career Coach, a specialized assistant designed to help students and professionals navigate their careers in Data and Artificial Intelligence. "
+    "Your goal is to provide accurate information about career paths, assess user knowledge, and recommend learning resources. "
+    "Be encouraging, professional, and focus your answers strictly on topics related to Data and AI careers."
+    " Don't forget to check the conversation history to provide contextually relevant responses."
+    "Give small and organize responses "
+)
+
+def build_prompt(message, history=None, summary=None, memories=None):
+    """Builds the prompt sent to the model, keeping the history within the token budget.
+
+    `summary` is the chat session's rolling summary ({"summary": ..., "upto": ...}),
+    which stands in for the turns it covers. `memories` are relevant turns recalled
+    from the user's earlier conversations.
+    """
+    return build_chat_prompt(SYSTEM_INSTRUCTION, message, history, summary, memories=memories)
+
+async def _recall(message, session, summary=None):
+    """Past turns relevant to `message`, leaving out the turns of this session that are still in the prompt."""
+    if session is None or VECTOR_MEMORY_TOP_K <= 0:
+        return None
+    # Turns covered by the summary are only in the prompt in condensed form, so they may be recalled verbatim
+    window_start = summary.get("upto", 0) if summary and summary.get("summary") else 0
+    # Building a user's index reads their whole history from storage, so keep it off the event loop
+    return await asyncio.to_thread(vector_memory.recall, session[0], message, session[1], window_start)
+
+def _cached_response(message, history, model, summary, use_cache, memories=None):
+    """Returns (cache key, cached response or None); the key is None when the cache is bypassed."""
+    if not use_cache:
+        response_cache.bypass()
+        return None, None
+    key = response_cache.key(model, build_prompt(normalize_message(message), history, summary, memories))
+    return key, response_cache.get(key)
+
+def chat(message, history=None, model=None, summary=None, use_cache=True, memories=None):
+    """Blocking chat call, kept for the CLI in main.py. `model` defaults to the chat route's model."""
+    model = model or llm_client.model_for("chat")
+    key, cached = _cached_response(message, history, model, summary, use_cache, memories)
+    if cached is not None:
+        return cached
+    payload = {"model": model, "prompt": build_prompt(message, history, summary, memories)}
+    data = llm_client.generate_sync(payload)
+    if key is not None:
+        response_cache.put(key, data["response"])
+    return data["response"]
+
+def _session_payload(message, history, model, summary, session, memories=None):
+    """Builds the generate payload, continuing from the session's cached KV context when possible.
+
+    `session` is a (user_id, chat_id) tuple. With a usable cached context only the
+    new message is sent, because the context already holds the system instruction
+    and every earlier turn, preceded by the turns recalled for this message.
+    """
+    if session is not None:
+        context = context_cache.get(*session, model, len(history or []))
+        if context is not None:
+            prompt = "\n".join(part for part in (format_memories(memories), f"User: {message}") if part)
+            return {"model": model, "prompt": prompt, "context": context}
+    return {"model": model, "prompt": build_prompt(message, history, summary, memories)}
+
+def _remember_context(session, model, history, data):
+    # The returned context covers the history plus the turn that is about to be saved
+    if session is not None:
+        context_cache.put(*session, model, len(history or []) + 1, data.get("context"))
+
+async def achat(message, history=None, model=None, summary=None, session=None, use_cache=True):
+    """Async counterpart of chat() for the API; doesn't block the event loop.
+
+    Pass `session=(user_id, chat_id)` to reuse Ollama's KV context across the turns
+    of a chat and to recall relevant turns from the user's earlier conversations, and
+    `use_cache=False` to always generate a fresh response.
+    """
+    model = model or llm_client.model_for("chat")
+    memories = await _recall(message, session, summary)
+    key, cached = _cached_response(message, history, model, summary, use_cache, memories)
+    if cached is not None:
+        # No KV context covers this turn, so the next one sends the full prompt
+        _remember_context(session, model, history, {})
+        return cached
+    payload = _session_payload(message, history, model, summary, session, memories)
+    data = await llm_client.generate(payload, user_id=session[0] if session else None)
+    _remember_context(session, model, history, data)
+    if key is not None:
+        response_cache.put(key, data["response"])
     return data["response"]
 
+async def stream_chat(message, history=None, model=None, summary=None, session=None, use_cache=True):
+    """Yields the bot response piece by piece as the model generates it; a cached response comes in one piece."""
+    model = model or llm_client.model_for("chat")
+    memories = await _recall(message, session, summary)
+    key, cached = _cached_response(message, history, model, summary, use_cache, memories)
+    if cached is not None:
+        _remember_context(session, model, history, {})
+        yield cached
+        return
+    payload = _session_payload(message, history, model, summary, session, memories)
+    parts = []
+    async for chunk in llm_client.stream(payload, user_id=session[0] if session else None):
+        if chunk.get("response"):
+            parts.append(chunk["response"])
+            yield chunk["response"]
+        if chunk.get("done"):
+            _remember_context(session, model, history, chunk)
+            if key is not None:
+                response_cache.put(key, "".join(parts))
+
+# Sessions whose summary is being rewritten right now, so concurrent turns don't fold the same turns twice
+_summaries_in_progress = set()
 
+async def arefresh_chat_summary(user_id, chat_id, model=None):
+    """Folds turns that dropped out of the recent window into the session's rolling summary.
 
+    Only the turns added since the last update are sent to the model, together with
+    the previous summary, so the cost doesn't grow with the length of the chat.
+    """
+    key = (user_id, chat_id)
+    if key in _summaries_in_progress:
+        return
+    _summaries_in_progress.add(key)
+    try:
+        history = await asyncio.to_thread(get_chat_history, user_id, chat_id)
+        summary = await asyncio.to_thread(get_chat_summary, user_id, chat_id)
+        pending = turns_to_summarize(history, summary)
+        if pending is None:
+            return
+        start, end = pending
+        prompt = build_summary_prompt(summary["summary"] if summary else "", history[start:end])
+        data = await llm_client.generate({"model": model, "prompt": prompt}, task="summary", user_id=user_id)
+        await asyncio.to_thread(update_chat_summary, user_id, chat_id, data["response"].strip(), end)
+    except Exception as e:
+        logger.warning("Could not update the summary of chat %s: %s", chat_id, e)
+    finally:
+        _summaries_in_progress.discard(key)
@@ -0,0 +1,158 @@
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated list of JSON files, each a list of resources like course_ressource.json
+RESOURCE_CATALOG_FILES = os.environ.get("RESOURCE_CATALOG_FILES", "course_ressource.json")
+
+# Catalog files mix easy/medium/hard with beginner/intermediate/advanced
+DIFFICULTY_LEVELS = {
+    "easy": "easy", "beginner": "easy",
+    "medium": "medium", "intermediate": "medium",
+    "hard": "hard", "advanced": "hard",
+}
+DIFFICULTY_RANK = {"easy": 0, "medium": 1, "hard": 2}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def normalize_difficulty(level):
+    return DIFFICULTY_LEVELS.get(str(level).lower(), "mixed")
+
+
+class ResourceCatalog:
+    """Searchable, in-memory list of learning resources.
+
+    Built once from the catalog files. Keeps inverted indexes from topic and from
+    difficulty to resource ids, plus a TF-IDF index over title, description and
+    topics, so lookups only touch the resources that can match.
+    """
+
+    def __init__(self, resources=()):
+        self.resources = []
+        self._by_key = {} # url, or title when there's no url -> resource id
+        self._by_topic = defaultdict(set)
+        self._by_difficulty = defaultdict(set)
+        self._postings = {} # term -> {resource id: normalised tf-idf weight}
+        for resource in resources:
+            self._add(resource)
+        self._build_text_index()
+
+    @classmethod
+    def from_files(cls, paths=RESOURCE_CATALOG_FILES):
+        if isinstance(paths, str):
+            paths = [path.strip() for path in paths.split(",") if path.strip()]
+        resources = []
+        for path in paths:
+            try:
+                with open(path, "r") as f:
+                    resources.extend(json.load(f))
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Could not load resource catalog %s: %s", path, e)
+        return cls(resources)
+
+    def _add(self, resource):
+        # The same course listed in several files is only kept once; resources without a url are told apart by title
+        key = resource.get("url") or resource.get("title")
+        if key and key in self._by_key:
+            return
+        resource_id = len(self.resources)
+        self.resources.append(resource)
+        if key:
+            self._by_key[key] = resource_id
+        for topic in resource.get("topics_covered", []):
+            self._by_topic[topic.lower()].add(resource_id)
+        self._by_difficulty[normalize_difficulty(resource.get("difficulty_level"))].add(resource_id)
+
+    def _build_text_index(self):
+        term_counts = [
+            Counter(tokenize(" ".join([r.get("title", ""), r.get("description", "")] + r.get("topics_covered", []))))
+            for r in self.resources
+        ]
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        n = len(self.resources)
+        postings = defaultdict(dict)
+        for resource_id, counts in enumerate(term_counts):
+            weights = {
+                term: (1 + math.log(count)) * math.log((1 + n) / (1 + document_frequency[term]) + 1)
+                for term, count in counts.items()
+            }
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for term, weight in weights.items():
+                postings[term][resource_id] = weight / norm
+        self._postings = dict(postings)
+
+    def __len__(self):
+        return len(self.resources)
+
+    def ids_for_topic(self, topic):
+        return self._by_topic.get(topic.lower(), set())
+
+    def ids_for_difficulty(self, difficulty):
+        return self._by_difficulty.get(normalize_difficulty(difficulty), set())
+
+    def text_scores(self, query):
+        """Cosine similarity between the query and every resource sharing a term with it."""
+        terms = Counter(tokenize(query))
+        scores = defaultdict(float)
+        for term, count in terms.items():
+            for resource_id, weight in self._postings.get(term, {}).items():
+                scores[resource_id] += weight * count
+        norm = math.sqrt(sum(c * c for c in terms.values())) or 1.0
+        return {resource_id: score / norm for resource_id, score in scores.items()}
+
+    def search(self, query="", topic=None, difficulty=None, limit=10):
+        """Resources matching the query text, optionally restricted to a topic and/or difficulty."""
+        candidates = None
+        if topic:
+            candidates = set(self.ids_for_topic(topic))
+        if difficulty:
+            ids = self.ids_for_difficulty(difficulty)
+            candidates = ids if candidates is None else candidates & ids
+        if query.strip():
+            scores = self.text_scores(query)
+            if candidates is not None:
+                scores = {resource_id: s for resource_id, s in scores.items() if resource_id in candidates}
+        else:
+            scores = dict.fromkeys(candidates if candidates is not None else range(len(self.resources)), 0.0)
+        ranked = sorted(scores, key=lambda resource_id: (-scores[resource_id], resource_id))
+        return [self.resources[resource_id] for resource_id in ranked[:limit]]
+
+    def recommend(self, topic_needs, limit=5):
+        """Ranks resources for a set of weak topics.
+
+        topic_needs maps each topic to (weight, target difficulty): how much help
+        the user needs with it and the level they're struggling at. Resources
+        tagged with the topic score highest, resources that only mention it in
+        their text score less; both are scaled by how close their level is to the
+        target difficulty.
+        """
+        scores = defaultdict(float)
+        for topic, (weight, target) in topic_needs.items():
+            tagged = self.ids_for_topic(topic)
+            matches = {resource_id: 1.0 for resource_id in tagged}
+            for resource_id, similarity in self.text_scores(topic).items():
+                if resource_id not in tagged:
+                    matches[resource_id] = 0.5 * similarity
+            for resource_id, match in matches.items():
+                scores[resource_id] += weight * match * self._difficulty_fit(resource_id, target)
+        ranked = sorted(scores, key=lambda resource_id: (-scores[resource_id], resource_id))
+        return [self.resources[resource_id] for resource_id in ranked[:limit] if scores[resource_id] > 0]
+
+    def _difficulty_fit(self, resource_id, target):
+        level = normalize_difficulty(self.resources[resource_id].get("difficulty_level"))
+        if level not in DIFFICULTY_RANK or target not in DIFFICULTY_RANK:
+            return 0.5
+        return (1.0, 0.5, 0.25)[abs(DIFFICULTY_RANK[level] - DIFFICULTY_RANK[target])]
+
+
+resource_catalog = ResourceCatalog.from_files()
@@ -0,0 +1,135 @@
+import heapq
+import math
+import os
+import threading
+from collections import Counter
+
+from catalog import tokenize
+from user_indexes import UserIndexCache
+
+# Users whose index is kept in memory; the least recently searched are rebuilt on demand
+CHAT_SEARCH_MAX_USERS = int(os.environ.get("CHAT_SEARCH_MAX_USERS", 1000))
+CHAT_SEARCH_SNIPPET_CHARS = int(os.environ.get("CHAT_SEARCH_SNIPPET_CHARS", 160))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def make_snippet(text, terms, width=CHAT_SEARCH_SNIPPET_CHARS):
+    """About `width` characters of `text` around the first query term it contains."""
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms]
+    first = min((p for p in positions if p >= 0), default=0)
+    start = max(0, first - width // 3)
+    end = min(len(text), start + width)
+    snippet = text[start:end].strip()
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class _UserIndex:
+    """BM25 index over one user's turns. A document is one turn: the user message plus the bot reply."""
+
+    def __init__(self):
+        self.docs = {} # doc id -> (chat_id, turn, user text, bot text, term counts, length)
+        self.sessions = {} # chat_id -> {turn position: doc id}
+        self.postings = {} # term -> {doc id: term frequency}
+        self.total_length = 0
+        self._next_id = 0
+
+    def add(self, chat_id, turn, user_text, bot_text):
+        """Indexes the turn at position `turn` of a session, unless it's already indexed."""
+        turns = self.sessions.setdefault(chat_id, {})
+        if turn in turns:
+            return
+        counts = Counter(tokenize(f"{user_text} {bot_text}"))
+        length = sum(counts.values())
+        doc_id = self._next_id
+        self._next_id += 1
+        self.docs[doc_id] = (chat_id, turn, user_text, bot_text, counts, length)
+        turns[turn] = doc_id
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        self.total_length += length
+
+    def remove_session(self, chat_id):
+        for doc_id in self.sessions.pop(chat_id, {}).values():
+            _, _, _, _, counts, length = self.docs.pop(doc_id)
+            for term in counts:
+                posting = self.postings[term]
+                del posting[doc_id]
+                if not posting:
+                    del self.postings[term]
+            self.total_length -= length
+
+    def search(self, query, limit):
+        terms = list(dict.fromkeys(tokenize(query)))
+        n = len(self.docs)
+        if not terms or not n:
+            return []
+        average_length = self.total_length / n
+        scores = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                length = self.docs[doc_id][5]
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        hits = []
+        for doc_id, score in heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0])):
+            chat_id, turn, user_text, bot_text, counts, _ = self.docs[doc_id]
+            # Show the side of the turn with more matches
+            user_counts = Counter(tokenize(user_text))
+            in_user = sum(user_counts[t] for t in terms)
+            side = user_text if in_user >= sum(counts[t] for t in terms) - in_user else bot_text
+            hits.append({
+                "chat_id": chat_id,
+                "turn": turn,
+                "score": round(score, 4),
+                "snippet": make_snippet(side, terms),
+            })
+        return hits
+
+
+class ChatSearchIndex:
+    """Per-user full-text indexes over chat history, ranked with BM25.
+
+    Indexes are kept up to date as turns are saved, so a query only touches the
+    postings of its own terms.
+    """
+
+    def __init__(self, max_users=CHAT_SEARCH_MAX_USERS):
+        self._indexes = UserIndexCache(_UserIndex, max_users)
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def search(self, user_id, query, limit=20):
+        """Returns up to `limit` hits, best first: {"chat_id", "turn", "score", "snippet"}."""
+        with self._lock:
+            self.queries += 1
+        with self._indexes.index(user_id) as index:
+            return index.search(query, limit)
+
+    def add_turn(self, user_id, chat_id, turn, user_text, bot_text):
+        """Indexes a newly saved turn at position `turn` of its session, if the user's index is built."""
+        self._indexes.add_turn(user_id, chat_id, turn, user_text, bot_text)
+
+    def remove_session(self, user_id, chat_id):
+        self._indexes.remove_session(user_id, chat_id)
+
+    def reset(self):
+        self._indexes.reset()
+
+    def stats(self):
+        indexes = self._indexes.built()
+        with self._lock:
+            return {
+                "users": len(indexes),
+                "turns": sum(len(index.docs) for index in indexes),
+                "builds": self._indexes.builds,
+                "queries": self.queries,
+            }
+
+
+chat_search_index = ChatSearchIndex()
@@ -0,0 +1,4 @@
+import os
+
+# Static jobs and events listings, read by both the jobs index and the events cache
+JOBS_AND_EVENTS_FILE = os.environ.get("JOBS_AND_EVENTS_FILE", "jobs_and_events.json")
@@ -0,0 +1,109 @@
+import os
+
+# Rough prompt budget for system instruction + summary + history + new message
+CHAT_TOKEN_BUDGET = int(os.environ.get("CHAT_TOKEN_BUDGET", 3000))
+# Turns that are always kept verbatim; older ones get folded into the rolling summary
+CHAT_RECENT_TURNS = int(os.environ.get("CHAT_RECENT_TURNS", 6))
+# Don't call the model to update the summary until this many turns are waiting to be folded
+CHAT_SUMMARY_BATCH = int(os.environ.get("CHAT_SUMMARY_BATCH", 4))
+# Share of the budget that turns recalled from earlier sessions may take
+CHAT_MEMORY_TOKEN_BUDGET = int(os.environ.get("CHAT_MEMORY_TOKEN_BUDGET", 600))
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def format_turn(turn):
+    return f"User: {turn['user']}\nBot: {turn['bot']}"
+
+
+def format_memories(memories, token_budget=CHAT_MEMORY_TOKEN_BUDGET):
+    """Block of recalled turns, most relevant first, skipping any that don't fit in `token_budget`; "" if none fit."""
+    header = "Relevant excerpts from earlier conversations:"
+    remaining = token_budget - estimate_tokens(header)
+    recalled = []
+    for turn in memories or []:
+        line = format_turn(turn)
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            continue
+        recalled.append(line)
+        remaining -= cost
+    return "\n".join([header, *recalled]) if recalled else ""
+
+
+def build_chat_prompt(system_instruction, message, history=None, summary=None, token_budget=CHAT_TOKEN_BUDGET,
+                      memories=None, memory_budget=CHAT_MEMORY_TOKEN_BUDGET):
+    """Builds a prompt that stays within `token_budget`.
+
+    Turns already covered by the rolling summary are replaced by the summary text.
+    Recalled turns from earlier sessions come next, most relevant first, within
+    `memory_budget`. The remaining turns are added newest first until the budget
+    runs out, so the most recent exchanges always survive and the prompt size
+    stays flat however long the conversation gets.
+
+    Args:
+        system_instruction (str): Instruction placed at the top of the prompt.
+        message (str): The new user message.
+        history (list): Previous turns as {"user": ..., "bot": ...} dicts.
+        summary (dict): Optional {"summary": str, "upto": int}, where `upto` is the
+            number of leading turns the summary covers.
+        memories (list): Optional past turns relevant to the message, best first.
+    """
+    history = history or []
+    remaining = token_budget - estimate_tokens(system_instruction) - estimate_tokens(message)
+
+    parts = [system_instruction]
+    start = 0
+    if summary and summary.get("summary"):
+        summary_block = f"Summary of the earlier conversation: {summary['summary']}"
+        parts.append(summary_block)
+        remaining -= estimate_tokens(summary_block)
+        start = min(summary.get("upto", 0), len(history))
+
+    memory_block = format_memories(memories, min(memory_budget, remaining))
+    if memory_block:
+        parts.append(memory_block)
+        remaining -= estimate_tokens(memory_block)
+
+    kept = []
+    for turn in reversed(history[start:]):
+        line = format_turn(turn)
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        kept.append(line)
+        remaining -= cost
+    kept.reverse()
+
+    parts.extend(kept)
+    parts.append(f"User: {message}")
+    return "\n".join(parts)
+
+
+def turns_to_summarize(history, summary=None, recent_turns=CHAT_RECENT_TURNS, batch=CHAT_SUMMARY_BATCH):
+    """Returns (start, end) of the turns that should be folded into the summary next, or None.
+
+    Everything older than the last `recent_turns` turns is eventually folded, but
+    only once at least `batch` turns are waiting, so the summary isn't rewritten
+    on every message.
+    """
+    start = summary.get("upto", 0) if summary else 0
+    end = len(history) - recent_turns
+    if end - start < batch:
+        return None
+    return start, end
+
+
+def build_summary_prompt(previous_summary, turns):
+    """Prompt asking the model to fold `turns` into the existing running summary."""
+    conversation = "\n".join(format_turn(turn) for turn in turns)
+    return (
+        "You maintain a running summary of a conversation between a user and an AI Career Coach. "
+        "Update the summary with the new exchanges below. Keep facts about the user (background, skills, goals, "
+        "preferences) and any advice or decisions already given. Reply ONLY with the updated summary, in at most 150 words.\n"
+        f"Current summary: {previous_summary or '(none yet)'}\n"
+        f"New exchanges:\n{conversation}"
+    )
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import requests
+from bs4 import BeautifulSoup
+
+from config import JOBS_AND_EVENTS_FILE
+from metrics import SCRAPE_SECONDS
+from singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CACHE_FILE = os.environ.get("EVENTS_CACHE_FILE", "events_cache.json")
+# Scraped events are considered fresh for this long; older ones are still served while a refresh runs
+EVENTS_TTL = float(os.environ.get("EVENTS_TTL", 6 * 3600))
+# Wait before retrying after a scrape fails or finds nothing
+EVENTS_RETRY_INTERVAL = float(os.environ.get("EVENTS_RETRY_INTERVAL", 300))
+EVENTS_CONNECT_TIMEOUT = float(os.environ.get("EVENTS_CONNECT_TIMEOUT", 3))
+EVENTS_READ_TIMEOUT = float(os.environ.get("EVENTS_READ_TIMEOUT", 10))
+EVENTS_SEARCH_URL = os.environ.get("EVENTS_SEARCH_URL", "https://www.google.com/search?q=online+data+science+events")
+EVENTS_SCRAPE_LIMIT = 10
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+
+def scrape_events():
+    """Scrapes upcoming events from a Google results page. Raises on network errors."""
+    response = requests.get(EVENTS_SEARCH_URL, headers=HEADERS, timeout=(EVENTS_CONNECT_TIMEOUT, EVENTS_READ_TIMEOUT))
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    events = []
+    for result in soup.find_all('div', class_='g'):
+        title_element = result.find('h3')
+        link_element = result.find('a')
+        description_element = result.find('div', style="display: -webkit-box")
+
+        if title_element and link_element and description_element:
+            title = title_element.get_text()
+            url = link_element['href']
+            if "›" in title or not url.startswith('http'):
+                continue
+            events.append({"title": title, "description": description_element.get_text(), "url": url})
+    return events[:EVENTS_SCRAPE_LIMIT]
+
+
+def load_static_events(path=JOBS_AND_EVENTS_FILE):
+    """The curated events from jobs_and_events.json, in the same shape as scraped ones."""
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    events = []
+    for event in data.get("events", []):
+        details = [event.get(key) for key in ("organizer", "date", "location") if event.get(key)]
+        events.append({
+            "title": event.get("title", ""),
+            "description": event.get("description") or " · ".join(details),
+            "url": event.get("url", ""),
+        })
+    return events
+
+
+_scrape_flight = single_flight("events_scrape")
+
+
+class EventsCache:
+    """In-memory list of events, served without waiting on the network.
+
+    The list is the curated events from jobs_and_events.json followed by the last
+    successful scrape. A background task (run()) re-scrapes every EVENTS_TTL
+    seconds; a failed or empty scrape keeps the previous snapshot, which is also
+    persisted to disk so a restart starts from it instead of an empty list.
+    """
+
+    def __init__(self, path=EVENTS_CACHE_FILE, ttl=EVENTS_TTL, static_path=JOBS_AND_EVENTS_FILE):
+        self.path = path
+        self.ttl = ttl
+        self.static_path = static_path
+        self._scraped = []
+        self._fetched_at = 0.0
+        self._events = []
+        self._retry_at = 0.0
+        self._wakeup = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error = None
+        self.load()
+
+    # --- persistence ---
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self._scraped = data.get("events", [])
+                self._fetched_at = data.get("fetched_at", 0.0)
+            except (json.JSONDecodeError, OSError) as e:
+                logger.warning("Could not load events cache from %s: %s", self.path, e)
+        self._merge()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": self._fetched_at, "events": self._scraped}, f)
+        os.replace(tmp_path, self.path)
+
+    def _merge(self):
+        merged = []
+        seen = set()
+        for event in load_static_events(self.static_path) + self._scraped:
+            key = event["title"].strip().lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append({"id": len(merged) + 1, **event})
+        # Swapped in one assignment so readers never see a half-built list
+        self._events = merged
+
+    # --- serving ---
+
+    def is_stale(self):
+        return time.time() - self._fetched_at >= self.ttl
+
+    def get(self):
+        """The current events. Never blocks; a stale list nudges the refresher."""
+        if self.is_stale() and time.time() >= self._retry_at and self._wakeup is not None:
+            self._wakeup.set()
+        return self._events
+
+    def stats(self):
+        return {
+            "events": len(self._events),
+            "scraped": len(self._scraped),
+            "age_seconds": time.time() - self._fetched_at if self._fetched_at else None,
+            "stale": self.is_stale(),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+    # --- background refresh ---
+
+    async def refresh(self, scrape_fn=scrape_events):
+        """Re-scrapes once, or waits for the scrape already running. Returns True if the snapshot was replaced."""
+        return await _scrape_flight.do("events", lambda: self._refresh(scrape_fn))
+
+    async def _refresh(self, scrape_fn):
+        start = time.perf_counter()
+        try:
+            scraped = await asyncio.to_thread(scrape_fn)
+        except Exception as e:
+            SCRAPE_SECONDS.labels("events", "error").observe(time.perf_counter() - start)
+            self.failures += 1
+            self.last_error = str(e)
+            self._retry_at = time.time() + EVENTS_RETRY_INTERVAL
+            logger.warning("Could not perform event search: %s", e)
+            return False
+        SCRAPE_SECONDS.labels("events", "ok" if scraped else "empty").observe(time.perf_counter() - start)
+        if not scraped:
+            # Most likely a blocked or changed results page; keep the last good snapshot
+            self.failures += 1
+            self.last_error = "scrape returned no events"
+            self._retry_at = time.time() + EVENTS_RETRY_INTERVAL
+            return False
+        self._scraped = scraped
+        self._fetched_at = time.time()
+        self.refreshes += 1
+        self.last_error = None
+        self._merge()
+        await asyncio.to_thread(self.save)
+        return True
+
+    async def run(self, scrape_fn=scrape_events):
+        """Background loop: refreshes whenever the snapshot is stale, retrying failures sooner."""
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                now = time.time()
+                if self.is_stale() and now >= self._retry_at:
+                    await self.refresh(scrape_fn)
+                    now = time.time()
+                if self.is_stale():
+                    delay = self._retry_at - now
+                else:
+                    delay = self.ttl - (now - self._fetched_at)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(delay, 1))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wakeup = None
+
+
+events_cache = EventsCache()
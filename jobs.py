@@ -0,0 +1,139 @@
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+
+from config import JOBS_AND_EVENTS_FILE
+
+logger = logging.getLogger(__name__)
+
+JOBS_PAGE_SIZE = int(os.environ.get("JOBS_PAGE_SIZE", 50))
+JOBS_MAX_PAGE_SIZE = int(os.environ.get("JOBS_MAX_PAGE_SIZE", 500))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _key(value):
+    return " ".join(str(value).lower().split())
+
+
+def _tokens(text):
+    return set(_TOKEN_RE.findall(str(text).lower()))
+
+
+def _contains(sorted_positions, position):
+    i = bisect.bisect_left(sorted_positions, position)
+    return i < len(sorted_positions) and sorted_positions[i] == position
+
+
+class _JobIndex:
+    """One immutable, fully indexed copy of the jobs feed."""
+
+    def __init__(self, jobs, version):
+        self.jobs = jobs
+        self.version = version
+        self.by_field = {"location": {}, "type": {}, "company": {}}
+        self.by_title_token = {}
+        # Positions are appended in order, so every posting list stays sorted
+        for position, job in enumerate(jobs):
+            for field, index in self.by_field.items():
+                index.setdefault(_key(job.get(field, "")), []).append(position)
+            for token in _tokens(job.get("title", "")):
+                self.by_title_token.setdefault(token, []).append(position)
+
+
+class JobStore:
+    """In-memory jobs feed with indexes on location, type, company and title words.
+
+    The file is parsed once and re-parsed only when its mtime or size changes;
+    the new index is built on the side and swapped in with one assignment, so a
+    query never sees a half-loaded feed. Results are in file order and paged with
+    an opaque cursor (the position after the last job returned).
+    """
+
+    def __init__(self, path=JOBS_AND_EVENTS_FILE):
+        self.path = path
+        self._index = _JobIndex([], None)
+        self._reload_lock = threading.Lock()
+        self.reloads = 0
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _current(self):
+        version = self._file_version()
+        if version == self._index.version:
+            return self._index
+        with self._reload_lock:
+            if version != self._index.version:
+                try:
+                    with open(self.path, "r") as f:
+                        jobs = json.load(f).get("jobs", [])
+                except FileNotFoundError:
+                    jobs = []
+                except (json.JSONDecodeError, OSError) as e:
+                    # Probably caught mid-write; keep serving the old copy and retry next time
+                    logger.warning("Could not load jobs from %s: %s", self.path, e)
+                    return self._index
+                self._index = _JobIndex(jobs, version)
+                self.reloads += 1
+            return self._index
+
+    def query(self, location=None, job_type=None, company=None, q=None, limit=JOBS_PAGE_SIZE, cursor=None):
+        """Returns (jobs, next_cursor). next_cursor is None on the last page.
+
+        Filters are exact, case-insensitive matches; q matches jobs whose title
+        contains every word of it. A limit of None returns every match. Raises
+        ValueError for a malformed cursor.
+        """
+        index = self._current()
+        if limit is None:
+            limit = len(index.jobs)
+        start = 0
+        if cursor:
+            try:
+                start = int(cursor)
+            except ValueError:
+                start = -1
+            if start < 0:
+                raise ValueError(f"Invalid cursor: {cursor!r}")
+
+        postings = []
+        for field, value in (("location", location), ("type", job_type), ("company", company)):
+            if value:
+                postings.append(index.by_field[field].get(_key(value), []))
+        if q:
+            tokens = _tokens(q)
+            if not tokens:
+                # Nothing in the query can match a title
+                return [], None
+            postings.extend(index.by_title_token.get(token, []) for token in tokens)
+
+        if not postings:
+            positions = range(start, min(start + limit + 1, len(index.jobs)))
+        else:
+            # Walk the shortest posting list and probe the rest
+            postings.sort(key=len)
+            shortest, others = postings[0], postings[1:]
+            positions = []
+            for position in shortest[bisect.bisect_left(shortest, start):]:
+                if all(_contains(other, position) for other in others):
+                    positions.append(position)
+                    if len(positions) > limit:
+                        break
+
+        page = [index.jobs[position] for position in positions[:limit]]
+        next_cursor = str(positions[limit]) if len(positions) > limit else None
+        return page, next_cursor
+
+    def stats(self):
+        return {"jobs": len(self._index.jobs), "reloads": self.reloads}
+
+
+job_store = JobStore()
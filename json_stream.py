@@ -0,0 +1,66 @@
+class JSONObjectStreamParser:
+    """Incrementally picks complete JSON objects out of streamed model output.
+
+    Feed it text fragments as they arrive; feed() returns the source text of every
+    object that was closed by that fragment. Objects are recognised either at the
+    top level or as elements of a top-level array, so `[{...}, {...}]`, a bare
+    sequence of objects and output wrapped in prose or code fences all work.
+    Strings are tracked so braces inside them don't confuse the parser. A broken
+    element doesn't stop the parser from finding the next one.
+    """
+
+    def __init__(self):
+        self._stack = [] # open containers: "[" or "{"
+        self._in_string = False
+        self._escaped = False
+        self._current = None # characters of the object being captured
+        self._capture_depth = None
+
+    def feed(self, text):
+        completed = []
+        for char in text:
+            if self._current is not None:
+                self._current.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                # Strings only matter inside JSON; a stray quote in surrounding prose is ignored
+                if self._stack:
+                    self._in_string = True
+            elif char in "[{":
+                if char == "{" and self._current is None and self._stack in ([], ["["]):
+                    self._current = [char]
+                    self._capture_depth = len(self._stack)
+                self._stack.append(char)
+            elif char in "]}":
+                if not self._stack:
+                    continue
+                expected = "[" if char == "]" else "{"
+                if self._stack[-1] != expected:
+                    # Mismatched bracket: give up on the current element and resynchronise
+                    self._reset_element()
+                    continue
+                self._stack.pop()
+                if self._current is not None and len(self._stack) == self._capture_depth:
+                    completed.append("".join(self._current))
+                    self._current = None
+                    self._capture_depth = None
+        return completed
+
+    def _reset_element(self):
+        if self._capture_depth is not None:
+            del self._stack[self._capture_depth:]
+        else:
+            self._stack.clear()
+        self._current = None
+        self._capture_depth = None
+        self._in_string = False
+        self._escaped = False
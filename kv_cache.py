@@ -0,0 +1,82 @@
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+KV_CACHE_MAX_SESSIONS = int(os.environ.get("KV_CACHE_MAX_SESSIONS", 256))
+# Total token ids kept across all sessions (4 bytes each)
+KV_CACHE_MAX_TOKENS = int(os.environ.get("KV_CACHE_MAX_TOKENS", 2_000_000))
+# A session whose context grows past this is rebuilt from the summary + recent turns instead,
+# so we never run into the model's context window
+KV_CONTEXT_MAX_TOKENS = int(os.environ.get("KV_CONTEXT_MAX_TOKENS", 3500))
+
+
+class ContextCache:
+    """Per-chat-session store of the `context` token arrays returned by Ollama.
+
+    Sending the context back with the next message lets Ollama skip re-evaluating the
+    system instruction and history. An entry is only used when it was produced by the
+    same model and covers exactly the turns currently stored for the session, so an
+    edited or externally extended history falls back to a full prompt.
+    """
+
+    def __init__(self, max_sessions=KV_CACHE_MAX_SESSIONS, max_tokens=KV_CACHE_MAX_TOKENS,
+                 max_context_tokens=KV_CONTEXT_MAX_TOKENS):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.max_context_tokens = max_context_tokens
+        self._entries = OrderedDict() # (user_id, chat_id) -> (model, turns, array of token ids)
+        self._tokens = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, chat_id, model, turns):
+        """Returns the cached context as a list, or None if there is no usable entry."""
+        key = (user_id, chat_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != model or entry[1] != turns:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2].tolist()
+
+    def put(self, user_id, chat_id, model, turns, context):
+        key = (user_id, chat_id)
+        with self._lock:
+            self._drop(key)
+            if not context or len(context) > self.max_context_tokens:
+                return
+            tokens = array("i", context)
+            self._entries[key] = (model, turns, tokens)
+            self._tokens += len(tokens)
+            while self._entries and (len(self._entries) > self.max_sessions or self._tokens > self.max_tokens):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._tokens -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, user_id, chat_id):
+        with self._lock:
+            self._drop((user_id, chat_id))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "sessions": len(self._entries),
+                "tokens": self._tokens,
+                "max_tokens": self.max_tokens,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._tokens -= len(entry[2])
+
+
+context_cache = ContextCache()
@@ -0,0 +1,493 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import LLM_REQUEST_ERRORS, LLM_REQUEST_SECONDS, observe_llm_response
+from scheduler import llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+LLM_MODEL = os.environ.get("LLM_MODEL", "mistral")
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+# Generations on CPU-only nodes can take a while, so the read timeout is generous
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", 300))
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", 4))
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", 10))
+# Backends and the per-task routing table; see llm_config.example.json
+LLM_CONFIG_FILE = os.environ.get("LLM_CONFIG_FILE", "llm_config.json")
+# How long a replica that refused a connection is skipped
+LLM_REPLICA_COOLDOWN = float(os.environ.get("LLM_REPLICA_COOLDOWN", 30))
+
+# What the code asks the LLM to do; each task is routed to a backend and model
+LLM_TASKS = ("chat", "mcq", "summary")
+# Scheduler class of each task's calls, unless the caller says otherwise
+TASK_PRIORITIES = {"chat": "interactive", "mcq": "quiz", "summary": "background"}
+
+
+class _observed:
+    """Times one LLM call; record() takes the final message and notes its reported stats.
+
+    A call that raises, or is abandoned before record() (e.g. a stream closed on
+    client disconnect), counts as an error and isn't added to the latency histogram.
+    """
+
+    def __init__(self, caller, payload):
+        self.caller = caller
+        self.model = payload.get("model", "")
+        self.recorded = False
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.record
+
+    def record(self, data):
+        LLM_REQUEST_SECONDS.labels(self.caller, self.model).observe(time.perf_counter() - self.start)
+        observe_llm_response(self.caller, self.model, data)
+        self.recorded = True
+        return data
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and not self.recorded:
+            LLM_REQUEST_ERRORS.labels(self.caller, self.model).inc()
+        return False
+
+
+class _Replica:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.down_until = 0.0
+
+
+class LLMBackend:
+    """One inference server type, spread over one or more replicas.
+
+    Payloads and replies use Ollama's generate format ({"model", "prompt",
+    "format", "context"} in, {"response", "done", ...} out); subclasses translate
+    to and from their server's API. Generations in flight are capped per backend,
+    and each call goes to a replica picked round-robin or by the fewest calls in
+    flight. A replica that refuses a connection is skipped for
+    LLM_REPLICA_COOLDOWN seconds and the call moves on to the next one.
+    """
+
+    path = ""
+
+    def __init__(self, name, urls, connect_timeout=LLM_CONNECT_TIMEOUT, read_timeout=LLM_READ_TIMEOUT,
+                 max_in_flight=LLM_MAX_IN_FLIGHT, pool_size=LLM_POOL_SIZE, balance="least_loaded", api_key=None):
+        if balance not in ("round_robin", "least_loaded"):
+            raise ValueError(f"Unknown balance {balance!r} for LLM backend {name!r}")
+        if not urls:
+            raise ValueError(f"LLM backend {name!r} has no urls")
+        self.name = name
+        self.replicas = [_Replica(url) for url in urls]
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_in_flight = max_in_flight
+        self.pool_size = pool_size
+        self.balance = balance
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._next = itertools.count()
+        # httpx clients and asyncio semaphores belong to one event loop
+        self._loop = None
+        self._async_client = None
+        self._async_slots = None
+        # Closes of clients whose event loop has gone, kept referenced until they finish
+        self._closing = set()
+        self._session = None
+        self._sync_slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    # --- translation (overridden per server type) ---
+
+    def request_body(self, payload, stream):
+        return {**payload, "stream": stream}
+
+    def parse_reply(self, data):
+        return data
+
+    def parse_stream_line(self, line):
+        """Returns the chunk for one line of a streamed reply, or None for lines that carry nothing."""
+        return json.loads(line) if line else None
+
+    # --- replicas ---
+
+    def _acquire_replica(self, tried):
+        now = time.time()
+        with self._lock:
+            candidates = [r for r in self.replicas if r not in tried]
+            if not candidates:
+                return None
+            # If every replica is cooling down, try them anyway rather than fail outright
+            candidates = [r for r in candidates if r.down_until <= now] or candidates
+            offset = next(self._next)
+            candidates = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+            replica = candidates[0] if self.balance == "round_robin" else min(candidates, key=lambda r: r.in_flight)
+            replica.in_flight += 1
+            replica.requests += 1
+            return replica
+
+    def _release_replica(self, replica, error=None):
+        with self._lock:
+            replica.in_flight -= 1
+            if error is not None:
+                replica.errors += 1
+                if isinstance(error, (httpx.ConnectError, requests.ConnectionError)):
+                    replica.down_until = time.time() + LLM_REPLICA_COOLDOWN
+                    logger.warning("LLM replica %s of %s is unreachable: %s", replica.url, self.name, error)
+
+    def _replicas(self):
+        """Yields replicas to try in turn; the caller releases each one with _release_replica()."""
+        tried = set()
+        while True:
+            replica = self._acquire_replica(tried)
+            if replica is None:
+                return
+            tried.add(replica)
+            yield replica
+
+    @staticmethod
+    def _retryable(error):
+        # Nothing was sent yet, so another replica can take the call
+        return isinstance(error, (httpx.ConnectError, requests.ConnectionError))
+
+    # --- async ---
+
+    def _async_state(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._close_stale_client(loop)
+            self._loop = loop
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                headers=self.headers,
+            )
+            self._async_slots = asyncio.Semaphore(self.max_in_flight)
+        return self._async_client, self._async_slots
+
+    def _close_stale_client(self, loop):
+        """Closes the client left behind by a previous event loop, so its pooled connections aren't leaked.
+
+        The close runs on the old loop if it's still running, otherwise on `loop`;
+        a loop that is already closed may have taken its sockets with it, so
+        errors from that close are only logged.
+        """
+        client, old_loop = self._async_client, self._loop
+        if client is None:
+            return
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), old_loop)
+            return
+        task = loop.create_task(client.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._stale_client_closed)
+
+    def _stale_client_closed(self, task):
+        self._closing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Closing the stale %s client failed: %s", self.name, task.exception())
+
+    async def generate(self, payload, caller):
+        client, slots = self._async_state()
+        async with slots:
+            with _observed(caller, payload) as record:
+                for replica in self._replicas():
+                    try:
+                        response = await client.post(replica.url + self.path, json=self.request_body(payload, False))
+                        response.raise_for_status()
+                        data = self.parse_reply(response.json())
+                    except Exception as e:
+                        self._release_replica(replica, e)
+                        if self._retryable(e) and len(self.replicas) > 1:
+                            continue
+                        raise
+                    self._release_replica(replica)
+                    return record(data)
+                raise RuntimeError(f"No reachable replica for LLM backend {self.name!r}")
+
+    async def stream(self, payload, caller):
+        client, slots = self._async_state()
+        async with slots:
+            with _observed(caller, payload) as record:
+                for replica in self._replicas():
+                    started = False
+                    error = None
+                    try:
+                        async with client.stream(
+                            "POST", replica.url + self.path, json=self.request_body(payload, True)
+                        ) as response:
+                            response.raise_for_status()
+                            started = True
+                            async for line in response.aiter_lines():
+                                chunk = self.parse_stream_line(line)
+                                if chunk is None:
+                                    continue
+                                if chunk.get("error"):
+                                    raise RuntimeError(chunk["error"])
+                                if chunk.get("done"):
+                                    record(chunk)
+                                yield chunk
+                                if chunk.get("done"):
+                                    return
+                        # The stream ended without a `done` chunk, so the answer is incomplete
+                        raise RuntimeError(f"{self.name} stream ended before the response was complete.")
+                    except Exception as e:
+                        error = e
+                        if not started and self._retryable(e) and len(self.replicas) > 1:
+                            continue
+                        raise
+                    finally:
+                        self._release_replica(replica, error)
+                raise RuntimeError(f"No reachable replica for LLM backend {self.name!r}")
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._loop = None
+
+    # --- sync ---
+
+    def _sync_session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                session.headers.update(self.headers)
+                adapter = HTTPAdapter(pool_connections=len(self.replicas), pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def generate_sync(self, payload, caller):
+        with self._sync_slots:
+            with _observed(caller, payload) as record:
+                for replica in self._replicas():
+                    try:
+                        response = self._sync_session().post(
+                            replica.url + self.path,
+                            json=self.request_body(payload, False),
+                            timeout=(self.connect_timeout, self.read_timeout),
+                        )
+                        response.raise_for_status()
+                        data = self.parse_reply(response.json())
+                    except Exception as e:
+                        self._release_replica(replica, e)
+                        if self._retryable(e) and len(self.replicas) > 1:
+                            continue
+                        raise
+                    self._release_replica(replica)
+                    return record(data)
+                raise RuntimeError(f"No reachable replica for LLM backend {self.name!r}")
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                f"{self.name} {replica.url}": {
+                    "in_flight": replica.in_flight,
+                    "requests": replica.requests,
+                    "errors": replica.errors,
+                    "down": int(replica.down_until > now),
+                }
+                for replica in self.replicas
+            }
+
+
+class OllamaBackend(LLMBackend):
+    """Ollama's /api/generate, which the payloads already follow."""
+
+    path = "/api/generate"
+
+
+class LlamaCppBackend(LLMBackend):
+    """llama.cpp's server (/completion). Keeps the prompt cache warm instead of returning a KV context."""
+
+    path = "/completion"
+
+    def request_body(self, payload, stream):
+        body = {"prompt": payload["prompt"], "stream": stream, "cache_prompt": True}
+        schema = payload.get("format")
+        if schema is not None:
+            body["json_schema"] = schema if isinstance(schema, dict) else {}
+        return body
+
+    def parse_reply(self, data):
+        timings = data.get("timings") or {}
+        reply = {"response": data.get("content", ""), "done": bool(data.get("stop", True))}
+        if "tokens_evaluated" in data:
+            reply["prompt_eval_count"] = data["tokens_evaluated"]
+        if "tokens_predicted" in data:
+            reply["eval_count"] = data["tokens_predicted"]
+        if "prompt_ms" in timings:
+            reply["prompt_eval_duration"] = int(timings["prompt_ms"] * 1e6)
+        if "predicted_ms" in timings:
+            reply["eval_duration"] = int(timings["predicted_ms"] * 1e6)
+        return reply
+
+    def parse_stream_line(self, line):
+        if not line.startswith("data:"):
+            return None
+        return self.parse_reply(json.loads(line[len("data:"):]))
+
+
+class OpenAIBackend(LLMBackend):
+    """Any server with an OpenAI-compatible /v1/chat/completions (vLLM, LM Studio, llama.cpp, ...)."""
+
+    path = "/v1/chat/completions"
+
+    def request_body(self, payload, stream):
+        body = {
+            "model": payload["model"],
+            "messages": [{"role": "user", "content": payload["prompt"]}],
+            "stream": stream,
+        }
+        if stream:
+            body["stream_options"] = {"include_usage": True}
+        schema = payload.get("format")
+        if isinstance(schema, dict):
+            body["response_format"] = {"type": "json_schema", "json_schema": {"name": "response", "schema": schema}}
+        elif schema is not None:
+            body["response_format"] = {"type": "json_object"}
+        return body
+
+    @staticmethod
+    def _usage(data):
+        usage = data.get("usage") or {}
+        counts = {}
+        if "prompt_tokens" in usage:
+            counts["prompt_eval_count"] = usage["prompt_tokens"]
+        if "completion_tokens" in usage:
+            counts["eval_count"] = usage["completion_tokens"]
+        return counts
+
+    def parse_reply(self, data):
+        return {"response": data["choices"][0]["message"]["content"] or "", "done": True, **self._usage(data)}
+
+    def parse_stream_line(self, line):
+        if not line.startswith("data:"):
+            return None
+        line = line[len("data:"):].strip()
+        if line == "[DONE]":
+            return {"response": "", "done": True}
+        data = json.loads(line)
+        choices = data.get("choices") or []
+        if data.get("usage") and not choices:
+            # The usage chunk comes last, just before [DONE]
+            return {"response": "", "done": True, **self._usage(data)}
+        text = (choices[0].get("delta") or {}).get("content") if choices else None
+        return {"response": text, "done": False} if text else None
+
+
+BACKEND_TYPES = {"ollama": OllamaBackend, "llama.cpp": LlamaCppBackend, "openai": OpenAIBackend}
+
+
+def _default_config():
+    """A single Ollama backend at OLLAMA_URL serving every task with LLM_MODEL, as before routing existed."""
+    base_url = OLLAMA_URL[:-len(OllamaBackend.path)] if OLLAMA_URL.endswith(OllamaBackend.path) else OLLAMA_URL
+    return {
+        "backends": {"ollama": {"type": "ollama", "urls": [base_url]}},
+        "routes": {task: {"backend": "ollama", "model": LLM_MODEL} for task in LLM_TASKS},
+    }
+
+
+def load_config(path=LLM_CONFIG_FILE):
+    if not os.path.exists(path):
+        return _default_config()
+    with open(path, "r") as f:
+        config = json.load(f)
+    logger.info("Loaded LLM routing from %s", path)
+    return config
+
+
+class LLMClient:
+    """Routes each LLM call to the backend and model configured for its task.
+
+    The async methods are what the API awaits; generate_sync() is for the CLI.
+    `task` picks the route (chat, mcq, summary); a task without a route uses the
+    chat route. `caller` labels the latency and token metrics of each call and
+    defaults to the task. A payload without a "model" gets the route's model.
+
+    Async calls wait for a slot from llm_scheduler in the task's priority class
+    (or `priority`), sharing it fairly between `user_id`s, and raise
+    scheduler.LLMOverloaded when shed. The CLI path isn't scheduled.
+    """
+
+    def __init__(self, config=None):
+        config = config or load_config()
+        self.backends = {}
+        for name, options in config["backends"].items():
+            options = dict(options)
+            backend_type = options.pop("type", "ollama")
+            if backend_type not in BACKEND_TYPES:
+                raise ValueError(f"Unknown type {backend_type!r} for LLM backend {name!r}")
+            if "api_key_env" in options:
+                options["api_key"] = os.environ.get(options.pop("api_key_env"))
+            self.backends[name] = BACKEND_TYPES[backend_type](name, **options)
+        self.routes = {}
+        for task, route in config["routes"].items():
+            if route["backend"] not in self.backends:
+                raise ValueError(f"Route {task!r} uses unknown LLM backend {route['backend']!r}")
+            self.routes[task] = (self.backends[route["backend"]], route["model"])
+        if "chat" not in self.routes:
+            raise ValueError("The LLM routing table needs a 'chat' route")
+
+    def route(self, task):
+        return self.routes.get(task) or self.routes["chat"]
+
+    def model_for(self, task):
+        return self.route(task)[1]
+
+    def _routed(self, payload, task):
+        backend, model = self.route(task)
+        return backend, {**payload, "model": payload.get("model") or model}
+
+    async def generate(self, payload, task="chat", caller=None, priority=None, user_id=None):
+        """Runs a non-streaming generation and returns the reply in Ollama's format."""
+        backend, payload = self._routed(payload, task)
+        async with llm_scheduler.slot(priority or TASK_PRIORITIES.get(task, "interactive"), user_id):
+            return await backend.generate(payload, caller or task)
+
+    async def stream(self, payload, task="chat", caller=None, priority=None, user_id=None):
+        """Yields the chunks of a streaming generation, in Ollama's format; the slot is held until it ends.
+
+        Closing the generator early (e.g. on client disconnect) closes the
+        connection, which makes the server stop generating.
+        """
+        backend, payload = self._routed(payload, task)
+        async with llm_scheduler.slot(priority or TASK_PRIORITIES.get(task, "interactive"), user_id):
+            stream = backend.stream(payload, caller or task)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+    def generate_sync(self, payload, task="chat", caller=None):
+        """Blocking counterpart of generate() for code that has no event loop."""
+        backend, payload = self._routed(payload, task)
+        return backend.generate_sync(payload, caller or task)
+
+    async def aclose(self):
+        for backend in self.backends.values():
+            await backend.aclose()
+
+    def stats(self):
+        stats = {}
+        for backend in self.backends.values():
+            stats.update(backend.stats())
+        return stats
+
+
+llm_client = LLMClient()
@@ -1,9 +1,16 @@
-from bot import chat, add_conversation, load_memory, save_memory
-from mcq import mcq_assessment
+from bot import chat
+from memory import MEMORY_TAIL_SIZE, MemoryMigrationError, add_conversation, load_memory, memory_log, save_memory
+from mcq import QUIZ_TOPICS, mcq_assessment, mcq_assessment_batch
 import re
 from user_prof import add_quiz_result # New import
+from vector_memory import VECTOR_MEMORY_TOP_K, LogTurnIndex
 from datetime import datetime # Added for timestamp
 
+# Questions generated per model call in a full quiz. Kept small because a change of
+# difficulty throws away the rest of the batch.
+QUIZ_BATCH_SIZE = 5
+
+
 def detect_mcq_request(user_input):
     # Detect if user wants a full quiz or a single MCQ
     quiz_patterns = [
@@ -89,9 +96,17 @@ def display_recommendations(user_id):
 
 def main():
     user_id = "default_user" # Placeholder for user ID
+    try:
+        load_memory(limit=MEMORY_TAIL_SIZE)
+    except MemoryMigrationError as e:
+        print(e)
+        return
+    # Embeddings of older turns, kept next to the log; only new turns are embedded
+    memory_index = LogTurnIndex(memory_log.path)
     while True:
         user = input("You: ")
-        history = load_memory()
+        # The recent turns are kept in memory, so this doesn't re-read the log
+        history = load_memory(limit=MEMORY_TAIL_SIZE)
         if user.lower() in {"exit", "quit"}:
             break
         if user.lower() == "/clear":
@@ -121,14 +136,21 @@ def main():
 
                 failed_mcq_generations = 0
                 difficulty_map = {"easy": 1, "medium": 2, "hard": 3}
-                topics = ["data science", "machine learning", "deep learning", "statistics", "data engineering", "AI ethics"]
+                topics = QUIZ_TOPICS
                 quiz_results = [] # To store individual question results
+                pending_mcqs = [] # Generated but not yet asked, all at one difficulty
 
                 for i in range(rounds):
                     topic = topics[i % len(topics)]
                     
                     try:
-                        mcq = mcq_assessment(topic=topic, difficulty=current_difficulty, chat_fn=chat)
+                        if not pending_mcqs or pending_mcqs[0]["difficulty"] != current_difficulty:
+                            upcoming = [topics[(i + k) % len(topics)] for k in range(min(rounds - i, QUIZ_BATCH_SIZE))]
+                            pending_mcqs = mcq_assessment_batch(upcoming, difficulty=current_difficulty)
+                            if not pending_mcqs:
+                                raise ValueError("The model returned no valid questions.")
+                        mcq = pending_mcqs.pop(0)
+                        topic = mcq["topic"]
                         failed_mcq_generations = 0 # Reset counter on successful generation
                     except (ValueError, Exception) as e:
                         print(f"Could not generate MCQ for {topic}: {e}")
@@ -195,7 +217,7 @@ def main():
 
         elif mcq_request:
             try:
-                mcq = mcq_assessment(topic=mcq_request, chat_fn=chat)
+                mcq = mcq_assessment(topic=mcq_request)
                 print(f"\nMCQ on {mcq_request.title()}:")
                 print(mcq['question'])
                 for j, opt in enumerate(mcq['options']):
@@ -231,10 +253,12 @@ def main():
                 print(f"Sorry, I couldn't generate an MCQ right now. Error: {e}")
             continue
 
-        bot_response = chat(user, history=history)
+        # Turns older than the recent history are only included when they're relevant
+        memory_index.sync()
+        memories = memory_index.search(user, VECTOR_MEMORY_TOP_K, upto=len(memory_index) - len(history))
+        bot_response = chat(user, history=history, memories=memories)
         print("Bot:", bot_response)
         add_conversation(user, bot_response)
-        history = load_memory()
 
 if __name__ == "__main__":
     main()
@@ -1,34 +1,344 @@
 import json
+import logging
 import os
-import requests
 import random
+import re
+import threading
 
-def mcq_assessment(topic = "machine learning", difficulty = "easy", chat_fn=None):
+from json_stream import JSONObjectStreamParser
+from llm_client import llm_client
+from singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+QUIZ_TOPICS = ["data science", "machine learning", "deep learning", "statistics", "data engineering", "AI ethics"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+def validate_mcq(mcq_data):
+    """Raises ValueError unless mcq_data is a usable question: a text, four options, a correct answer of "1"-"4" and an explanation.
+
+    These are the fields api.QuizQuestion requires from the model; see validate_quiz_question() for `topic`.
+    """
+    if not isinstance(mcq_data, dict):
+        raise ValueError("MCQ data is not a JSON object.")
+    if not isinstance(mcq_data.get("question"), str) or not mcq_data["question"].strip():
+        raise ValueError("MCQ is missing its question.")
+    options = mcq_data.get("options")
+    if not isinstance(options, list) or len(options) != 4 or not all(isinstance(o, str) and o.strip() for o in options):
+        raise ValueError("MCQ must have exactly four options.")
+    if str(mcq_data.get("correct_answer")).strip() not in {"1", "2", "3", "4"}:
+        raise ValueError("MCQ correct_answer must be 1, 2, 3 or 4.")
+    if not isinstance(mcq_data.get("explanation"), str) or not mcq_data["explanation"].strip():
+        raise ValueError("MCQ is missing its explanation.")
+    return mcq_data
+
+def validate_quiz_question(mcq_data):
+    """validate_mcq() plus the `topic` we fill in: everything api.QuizQuestion requires, for questions about to be served."""
+    validate_mcq(mcq_data)
+    if not isinstance(mcq_data.get("topic"), str) or not mcq_data["topic"].strip():
+        raise ValueError("MCQ is missing its topic.")
+    return mcq_data
+
+# Mirrors api.QuizQuestion (minus `topic`, which we fill in). Passed as Ollama's `format`
+# so the model is constrained to emit exactly this shape.
+MCQ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "options": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+        "correct_answer": {"type": "string", "enum": ["1", "2", "3", "4"]},
+        "explanation": {"type": "string"},
+    },
+    "required": ["question", "options", "correct_answer", "explanation"],
+}
+MCQ_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        **MCQ_SCHEMA,
+        "properties": {"topic": {"type": "string"}, **MCQ_SCHEMA["properties"]},
+        "required": ["topic"] + MCQ_SCHEMA["required"],
+    },
+}
+# Generations per question before giving up. Unparseable output is repaired first when possible.
+MCQ_MAX_ATTEMPTS = int(os.environ.get("MCQ_MAX_ATTEMPTS", 2))
+
+# Per-model counters: generations, parse failures, repairs, retries and questions given up on
+_mcq_stats = {}
+_mcq_stats_lock = threading.Lock()
+
+def _count(model, counter, amount=1):
+    with _mcq_stats_lock:
+        stats = _mcq_stats.setdefault(model, {"generations": 0, "parse_failures": 0, "repaired": 0, "retries": 0, "failures": 0})
+        stats[counter] += amount
+
+def mcq_stats():
+    """Parse/retry counters per model, e.g. {"mistral": {"generations": 10, "parse_failures": 1, ...}}."""
+    with _mcq_stats_lock:
+        return {model: dict(stats) for model, stats in _mcq_stats.items()}
+
+def _mcq_prompt(topic, difficulty):
+    return (
+        f"Generate a multiple-choice question on the topic of '{topic}' at a '{difficulty}' difficulty level. "
+        "Provide four options. Indicate the correct answer as a single number (1, 2, 3, or 4) corresponding to the option's position. "
+        "Include a brief explanation. Reply ONLY in valid JSON with keys: question, options, correct_answer, explanation. Do not include any text outside the JSON object."
+    )
+
+# --- Tolerant parsing --- #
+
+_KEY_ALIASES = {
+    "choices": "options",
+    "answers": "options",
+    "answer": "correct_answer",
+    "correct": "correct_answer",
+    "correctanswer": "correct_answer",
+    "correct_option": "correct_answer",
+    "rationale": "explanation",
+    "reason": "explanation",
+    "reasoning": "explanation",
+    "justification": "explanation",
+}
+_OPTION_PREFIX = re.compile(r"^\s*(?:[A-Da-d]|[1-4])\s*[).:\-]\s+")
+
+def extract_json_object(text):
+    """Returns the source of the first complete JSON object in `text`, ignoring prose and code fences."""
+    objects = JSONObjectStreamParser().feed(text)
+    if not objects:
+        raise ValueError("No JSON object found in the model response.")
+    return objects[0]
+
+def _loads_lenient(text):
+    """json.loads, retried once after fixing the usual small mistakes (smart quotes, trailing commas)."""
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        fixed = text.replace("“", '"').replace("”", '"').replace("‘", "'").replace("’", "'")
+        fixed = re.sub(r",\s*([}\]])", r"\1", fixed)
+        return json.loads(fixed), True
+
+def repair_mcq(mcq_data):
+    """Normalises near-miss MCQ output in place; returns True if anything had to be changed.
+
+    Handles renamed keys, options given as a dict or with "A)"/"1." prefixes, and a
+    correct answer given as an int, a letter, "Option 2" or the option text itself.
+    """
+    repaired = False
+    for key in list(mcq_data):
+        target = _KEY_ALIASES.get(key.lower().replace(" ", ""), key.lower())
+        if target != key and target not in mcq_data:
+            mcq_data[target] = mcq_data.pop(key)
+            repaired = True
+
+    options = mcq_data.get("options")
+    if isinstance(options, dict):
+        options = [options[k] for k in sorted(options)]
+        repaired = True
+    if isinstance(options, list):
+        stripped = [_OPTION_PREFIX.sub("", str(o)).strip() for o in options]
+        if stripped != options:
+            repaired = True
+        mcq_data["options"] = options = stripped
+
+    answer = mcq_data.get("correct_answer")
+    if answer is not None and str(answer).strip() not in {"1", "2", "3", "4"}:
+        text = str(answer).strip()
+        normalised = None
+        lowered = [str(o).lower() for o in options] if isinstance(options, list) else []
+        # The option text wins over the letter: "A decision tree" names an option, it isn't "A"
+        for candidate in (text.lower(), _OPTION_PREFIX.sub("", text).lower()):
+            if candidate in lowered:
+                normalised = str(lowered.index(candidate) + 1)
+                break
+        else:
+            # A bare label ("B", "b)", "Option 2"), or one set off by punctuation ("B) ...")
+            match = re.fullmatch(r"(?:option\s*)?([1-4]|[A-Da-d])\s*(?:[).:](?:\s.*)?)?", text, re.IGNORECASE)
+            if match:
+                token = match.group(1)
+                normalised = token if token.isdigit() else str("abcd".index(token.lower()) + 1)
+        if normalised:
+            mcq_data["correct_answer"] = normalised
+            repaired = True
+    elif answer is not None and not isinstance(answer, str):
+        mcq_data["correct_answer"] = str(answer)
+        repaired = True
+    return repaired
+
+def parse_mcq_response(model_response, model=None):
+    """Extracts, repairs and validates one MCQ from raw model output. Raises ValueError if it can't."""
+    model = model or llm_client.model_for("mcq")
+    try:
+        mcq_data, fixed_json = _loads_lenient(extract_json_object(model_response))
+    except (ValueError, json.JSONDecodeError) as e:
+        _count(model, "parse_failures")
+        raise ValueError(f"Failed to parse MCQ data from response: {e}")
+    if repair_mcq(mcq_data) or fixed_json:
+        _count(model, "repaired")
+    try:
+        return validate_mcq(mcq_data)
+    except ValueError:
+        _count(model, "parse_failures")
+        raise
+
+def _parse_mcq(model_response, topic, difficulty, model=None):
+    mcq_data = parse_mcq_response(model_response, model)
+    mcq_data["topic"] = topic # Add topic to the returned data
+    mcq_data["difficulty"] = difficulty # Add difficulty to the returned data
+    return mcq_data
+
+def _generation_payload(topic, difficulty, model):
+    return {"model": model, "prompt": _mcq_prompt(topic, difficulty), "format": MCQ_SCHEMA}
+
+def mcq_assessment(topic = "machine learning", difficulty = "easy", chat_fn=None, model=None):
     """Conduct a multiple-choice question assessment on a given topic and difficulty.
 
+    The model is constrained to the MCQ JSON schema. Output that still doesn't parse
+    is repaired where possible, and only regenerated (up to MCQ_MAX_ATTEMPTS in
+    total) when it can't be.
+
     Args:
         topic (str): The subject area for the MCQs.
         difficulty (str): The difficulty level of the questions ("easy", "medium", "hard").
+        chat_fn (callable): Optional custom generator called as chat_fn(prompt, model=...);
+            by default the model is called directly in JSON-schema mode.
+        model (str): Defaults to the model routed for the "mcq" task.
 
     Returns:
         dict: A dictionary containing the question, options, correct answer, explanation,
               and the topic and difficulty used to generate it.
     """
-    prompt = (
-        f"Generate a multiple-choice question on the topic of '{topic}' at a '{difficulty}' difficulty level. "
-        "Provide four options. Indicate the correct answer as a single number (1, 2, 3, or 4) corresponding to the option's position. "
-        "Include a brief explanation. Reply ONLY in valid JSON with keys: question, options, correct_answer, explanation. Do not include any text outside the JSON object."
+    model = model or llm_client.model_for("mcq")
+    for attempt in range(MCQ_MAX_ATTEMPTS):
+        if attempt:
+            _count(model, "retries")
+        _count(model, "generations")
+        if chat_fn is not None:
+            model_response = chat_fn(_mcq_prompt(topic, difficulty), model=model)
+        else:
+            model_response = llm_client.generate_sync(_generation_payload(topic, difficulty, model), task="mcq", caller="mcq_assessment")["response"]
+        try:
+            return _parse_mcq(model_response, topic, difficulty, model)
+        except ValueError as e:
+            error = e
+    _count(model, "failures")
+    raise error
+
+# Concurrent requests for the same (topic, difficulty, model, priority) share one generation
+_mcq_flight = single_flight("mcq_assessment")
+
+async def amcq_assessment(topic = "machine learning", difficulty = "easy", chat_fn=None, model=None, priority="quiz", user_id=None):
+    """Async counterpart of mcq_assessment(); a custom chat_fn must be a coroutine function.
+
+    Identical calls already in flight are merged into one generation, so every
+    caller gets the same question; use shuffle_options() to vary it per user.
+    `priority` and `user_id` are passed to the LLM scheduler.
+    """
+    model = model or llm_client.model_for("mcq")
+    if chat_fn is not None:
+        return await _amcq_generate(topic, difficulty, chat_fn, model, priority, user_id)
+    mcq_data = await _mcq_flight.do(
+        (topic, difficulty, model, priority), lambda: _amcq_generate(topic, difficulty, None, model, priority, user_id)
     )
-    if chat_fn is None:
-        raise ValueError("A chat function must be provided to mcq_assessment.")
-    model_response = chat_fn(prompt, model="mistral")
-    try :
-        mcq_data = json.loads(model_response)
-        mcq_data["topic"] = topic # Add topic to the returned data
-        mcq_data["difficulty"] = difficulty # Add difficulty to the returned data
-        return mcq_data
-    except json.JSONDecodeError:
-        raise ValueError("Failed to parse MCQ data from response.")
+    return dict(mcq_data)
+
+async def _amcq_generate(topic, difficulty, chat_fn, model, priority, user_id):
+    for attempt in range(MCQ_MAX_ATTEMPTS):
+        if attempt:
+            _count(model, "retries")
+        _count(model, "generations")
+        if chat_fn is not None:
+            model_response = await chat_fn(_mcq_prompt(topic, difficulty), model=model)
+        else:
+            model_response = (await llm_client.generate(
+                _generation_payload(topic, difficulty, model), task="mcq", caller="mcq_assessment", priority=priority, user_id=user_id
+            ))["response"]
+        try:
+            return _parse_mcq(model_response, topic, difficulty, model)
+        except ValueError as e:
+            error = e
+    _count(model, "failures")
+    raise error
+
+def shuffle_options(mcq_data, seed):
+    """Returns a copy with the options in an order fixed by `seed` (e.g. a user id); correct_answer follows its option."""
+    options = mcq_data["options"]
+    order = list(range(len(options)))
+    random.Random(f"{seed}|{mcq_data['question']}").shuffle(order)
+    correct = int(mcq_data["correct_answer"]) - 1
+    return {**mcq_data, "options": [options[i] for i in order], "correct_answer": str(order.index(correct) + 1)}
+
+# --- Batch generation --- #
+
+MCQ_BATCH_MAX = 20
+
+def _batch_topics(topics, n):
+    """One topic per question, cycling through `topics` in order."""
+    n = min(n or len(topics), MCQ_BATCH_MAX)
+    return [topics[i % len(topics)] for i in range(n)]
+
+def _mcq_batch_prompt(topics, difficulty):
+    listing = "\n".join(f"{i + 1}. {topic}" for i, topic in enumerate(topics))
+    return (
+        f"Generate {len(topics)} multiple-choice questions at a '{difficulty}' difficulty level, one for each of these topics, in this order:\n"
+        f"{listing}\n"
+        "Each question must have four options, the correct answer as a single number (1, 2, 3, or 4) corresponding to the option's position, and a brief explanation. "
+        "Reply ONLY with a JSON array of objects with keys: topic, question, options, correct_answer, explanation. Do not include any text outside the JSON array."
+    )
+
+def _batch_payload(topics, difficulty, model):
+    return {"model": model, "prompt": _mcq_batch_prompt(topics, difficulty), "format": MCQ_BATCH_SCHEMA}
+
+def _parse_batch_element(text, topics, index, difficulty, model=None):
+    """Parses and validates one element of a batch; returns None so that only this element is dropped."""
+    try:
+        mcq_data = parse_mcq_response(text, model)
+    except ValueError as e:
+        logger.warning("Dropping malformed MCQ #%d from batch: %s", index + 1, e)
+        return None
+    # Trust the model's topic label only if it is one we asked for; otherwise go by position
+    requested = {topic.lower(): topic for topic in topics}
+    label = str(mcq_data.get("topic", "")).strip().lower()
+    mcq_data["topic"] = requested.get(label, topics[index % len(topics)])
+    mcq_data["difficulty"] = difficulty
+    return mcq_data
+
+async def amcq_assessment_batch(topics, n=None, difficulty = "easy", model = None, user_id = None):
+    """Generates several MCQs in a single model call, yielding each one as soon as it is complete.
+
+    The model's output is parsed while it streams, so the first question is ready
+    long before the whole array is. A malformed element is skipped without
+    affecting the others.
+
+    Args:
+        topics (list): Topics to cycle through, one per question.
+        n (int): Number of questions (defaults to one per topic, at most MCQ_BATCH_MAX).
+        difficulty (str): The difficulty level of the questions ("easy", "medium", "hard").
+        user_id (str): Who the questions are for, for fair scheduling.
+    """
+    topics = _batch_topics(topics, n)
+    model = model or llm_client.model_for("mcq")
+    parser = JSONObjectStreamParser()
+    index = 0
+    _count(model, "generations")
+    async for chunk in llm_client.stream(
+        _batch_payload(topics, difficulty, model), task="mcq", caller="mcq_assessment_batch", user_id=user_id
+    ):
+        for text in parser.feed(chunk.get("response", "")):
+            mcq_data = _parse_batch_element(text, topics, index, difficulty, model)
+            index += 1
+            if mcq_data is not None:
+                yield mcq_data
+
+def mcq_assessment_batch(topics, n=None, difficulty = "easy", model = None):
+    """Blocking counterpart of amcq_assessment_batch() for the CLI; returns the list of valid MCQs."""
+    topics = _batch_topics(topics, n)
+    model = model or llm_client.model_for("mcq")
+    _count(model, "generations")
+    data = llm_client.generate_sync(_batch_payload(topics, difficulty, model), task="mcq", caller="mcq_assessment_batch")
+    elements = JSONObjectStreamParser().feed(data["response"])
+    return [
+        mcq_data
+        for mcq_data in (_parse_batch_element(text, topics, index, difficulty, model) for index, text in enumerate(elements))
+        if mcq_data is not None
+    ]
    
 
     
@@ -45,6 +355,6 @@ def mcq_score(round = 20):
     score = 0
     correct_answers = 0
     wrong_answers = 0
-    topics = ["data science", "machine learning", "deep learning", "statistics", "data engineering", "AI ethics"]
+    topics = QUIZ_TOPICS
 
 
@@ -1,28 +1,240 @@
 import json
+import logging
 import os
+import threading
+import time
+from collections import deque
 
-def load_memory():
-    """Load conversation history from JSON file.
+logger = logging.getLogger(__name__)
+
+MEMORY_FILE = os.environ.get("MEMORY_FILE", "memory.jsonl")
+# Pre-JSONL store (one JSON array), migrated into MEMORY_FILE on first use
+LEGACY_MEMORY_FILE = os.environ.get("LEGACY_MEMORY_FILE", "memory.json")
+# "always": fsync every turn; "interval": at most every MEMORY_FSYNC_INTERVAL seconds; "never": leave it to the OS
+MEMORY_FSYNC = os.environ.get("MEMORY_FSYNC", "interval")
+MEMORY_FSYNC_INTERVAL = float(os.environ.get("MEMORY_FSYNC_INTERVAL", 1))
+# Recent turns kept in memory, so reading the history doesn't touch the file
+MEMORY_TAIL_SIZE = int(os.environ.get("MEMORY_TAIL_SIZE", 50))
+# The log is compacted to the newest turns that fit in half of this once it grows past it
+MEMORY_MAX_BYTES = int(os.environ.get("MEMORY_MAX_BYTES", 32 * 1024 * 1024))
+
+_READ_BLOCK = 64 * 1024
+
+
+class MemoryMigrationError(Exception):
+    """The legacy memory.json exists but couldn't be converted; it is left untouched and retried on next use."""
+
+
+def _parse_lines(lines):
+    """Decodes JSONL records, skipping blank lines and a torn last line from an interrupted write."""
+    turns = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            turns.append(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning("Skipping malformed line in conversation log")
+    return turns
+
+
+class MemoryLog:
+    """Append-only JSONL log of CLI conversation turns ({"user", "bot"} per line).
+
+    Appending a turn writes one line, whatever the length of the history. The
+    newest turns are kept in memory; older ones are read by seeking backwards
+    from the end of the file, so only the requested lines are parsed. The file
+    is opened on first use, migrating a legacy memory.json array if there is one.
+    """
+
+    def __init__(self, path=MEMORY_FILE, legacy_path=LEGACY_MEMORY_FILE, fsync=MEMORY_FSYNC,
+                 fsync_interval=MEMORY_FSYNC_INTERVAL, tail_size=MEMORY_TAIL_SIZE, max_bytes=MEMORY_MAX_BYTES):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown MEMORY_FSYNC policy {fsync!r}")
+        self.path = path
+        self.legacy_path = legacy_path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.tail_size = tail_size
+        self.max_bytes = max_bytes
+        self._file = None
+        self._tail = deque(maxlen=tail_size)
+        self._last_fsync = 0.0
+        self._lock = threading.RLock()
+
+    # --- opening and migration ---
+
+    def _open(self):
+        if self._file is not None:
+            return self._file
+        if not os.path.exists(self.path) and self.legacy_path and os.path.exists(self.legacy_path):
+            self._migrate()
+        self._file = open(self.path, "ab")
+        if self._file.tell() and not self._ends_with_newline():
+            # A write was cut short; end that line so the next turn starts on its own
+            self._file.write(b"\n")
+            self._file.flush()
+        self._tail.extend(self._read_tail(self.tail_size))
+        return self._file
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _migrate(self):
+        """Converts the legacy file. Raises MemoryMigrationError, without creating the new log, if it can't be read."""
+        try:
+            with open(self.legacy_path, "r") as f:
+                turns = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            raise MemoryMigrationError(f"Could not migrate {self.legacy_path} to {self.path}: {e}. Fix or move it aside.") from e
+        if not isinstance(turns, list):
+            raise MemoryMigrationError(f"Could not migrate {self.legacy_path} to {self.path}: expected a list of turns.")
+        self._write_all(turns)
+        # The legacy file is left as it is (it may be tracked in version control); once the log exists it isn't read again
+        logger.info("Migrated %d turns from %s to %s; %s can be deleted", len(turns), self.legacy_path, self.path,
+                    self.legacy_path)
+
+    def _write_all(self, turns):
+        """Atomically replaces the log with `turns`."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for turn in turns:
+                f.write(json.dumps(turn).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    # --- writing ---
+
+    def append(self, user_input, bot_response):
+        turn = {"user": user_input, "bot": bot_response}
+        with self._lock:
+            f = self._open()
+            f.write(json.dumps(turn).encode() + b"\n")
+            f.flush()
+            now = time.monotonic()
+            if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(f.fileno())
+                self._last_fsync = now
+            self._tail.append(turn)
+            if self.max_bytes and f.tell() > self.max_bytes:
+                self._compact_to_bytes(self.max_bytes // 2)
+
+    def clear(self):
+        with self._lock:
+            self._open().truncate(0)
+            self._tail.clear()
+
+    def replace(self, turns):
+        """Rewrites the whole log with `turns`."""
+        with self._lock:
+            self.close()
+            self._tail.clear()
+            self._write_all(turns)
+            # Reopening reloads the in-memory tail from the new file
+            self._open()
+
+    def compact(self, keep_last=None):
+        """Rewrites the log without malformed lines, keeping only the newest `keep_last` turns if given."""
+        with self._lock:
+            self._open()
+            turns = self.all() if keep_last is None else self.tail(keep_last)
+            self.replace(turns)
+            return len(turns)
+
+    def _compact_to_bytes(self, budget):
+        with self._lock:
+            turns = _parse_lines(self._read_tail_lines(None, budget))
+            logger.info("Compacting %s to its newest %d turns", self.path, len(turns))
+            self.replace(turns)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self.flush()
+                self._file.close()
+                self._file = None
+
+    # --- reading ---
+
+    def tail(self, n=MEMORY_TAIL_SIZE):
+        """The newest `n` turns, oldest first; served from memory when `n` fits in the in-memory tail."""
+        with self._lock:
+            self._open()
+            if n <= len(self._tail) or len(self._tail) < self.tail_size:
+                # A tail that isn't full holds the whole log
+                return list(self._tail)[-n:] if n else []
+            return self._read_tail(n)
+
+    def all(self):
+        """Every turn in the log, oldest first."""
+        with self._lock:
+            self._open()
+            with open(self.path, "rb") as f:
+                return _parse_lines(f)
+
+    def _read_tail(self, n):
+        return _parse_lines(self._read_tail_lines(n))[-n:] if n else []
+
+    def _read_tail_lines(self, n, max_bytes=None):
+        """Reads complete lines backwards from the end of the file: the last `n` lines, or as many as fit in `max_bytes`."""
+        with open(self.path, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            data = b""
+            while position > 0:
+                if n is not None and data.count(b"\n") > n:
+                    break
+                if max_bytes is not None and end - position >= max_bytes:
+                    break
+                step = min(_READ_BLOCK, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+        lines = data.split(b"\n")
+        if position > 0:
+            # The first piece is the end of a line that starts before what was read
+            lines = lines[1:]
+        if max_bytes is not None:
+            kept, size = [], 0
+            for line in reversed(lines):
+                size += len(line) + 1
+                if size > max_bytes:
+                    break
+                kept.append(line)
+            lines = kept[::-1]
+        return lines[-(n + 1):] if n is not None else lines
+
+
+memory_log = MemoryLog()
+
+
+def load_memory(limit=None):
+    """Conversation history, oldest first: the newest `limit` turns, or all of them.
 
     Returns:
-        List of message dictionaries, empty list if file doesn't exist
+        List of message dictionaries, empty list if there is no history yet
     """
-    if not os.path.exists("memory.json"):
-        return []
-    with open("memory.json", "r") as f:
-        return json.load(f)
+    return memory_log.all() if limit is None else memory_log.tail(limit)
 
 
 def save_memory(messages):
-    """Save conversation history to JSON file."""
-    with open("memory.json", "w") as f:
-        json.dump(messages, f, indent=2)
-    
+    """Replaces the conversation history with `messages`."""
+    if messages:
+        memory_log.replace(messages)
+    else:
+        memory_log.clear()
+
 
 def add_conversation(user_input, bot_response):
-    conversations = load_memory()
-    conversations.append({"user":user_input, "bot":bot_response})
-    save_memory(conversations)
-    # Load existing memory
-    # Append new conversation
-    # Save updated
\ No newline at end of file
+    """Appends one turn to the log."""
+    memory_log.append(user_input, bot_response)
@@ -0,0 +1,87 @@
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+# Generations range from sub-second cache hits to minutes on CPU-only nodes
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Wall-clock time of LLM calls, until the last token", ["caller", "model"], buckets=LLM_BUCKETS
+)
+LLM_REQUEST_ERRORS = Counter("llm_request_errors_total", "LLM calls that raised", ["caller", "model"])
+OLLAMA_PROMPT_EVAL_SECONDS = Histogram(
+    "ollama_prompt_eval_seconds", "Ollama's reported prompt evaluation time", ["caller", "model"], buckets=LLM_BUCKETS
+)
+OLLAMA_EVAL_SECONDS = Histogram(
+    "ollama_eval_seconds", "Ollama's reported generation time", ["caller", "model"], buckets=LLM_BUCKETS
+)
+OLLAMA_PROMPT_TOKENS = Histogram(
+    "ollama_prompt_tokens", "Prompt tokens evaluated per call", ["caller", "model"], buckets=TOKEN_BUCKETS
+)
+OLLAMA_EVAL_TOKENS = Histogram(
+    "ollama_eval_tokens", "Tokens generated per call", ["caller", "model"], buckets=TOKEN_BUCKETS
+)
+
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "llm_queue_wait_seconds", "Time LLM jobs wait for a scheduler slot", ["priority"], buckets=(0,) + LLM_BUCKETS
+)
+LLM_SHED = Counter("llm_shed_total", "LLM jobs refused or dropped by the scheduler", ["priority", "reason"])
+
+PROFILE_OP_SECONDS = Histogram("profile_op_seconds", "Time to load or save profile data", ["op"])
+PROFILE_OP_BYTES = Histogram("profile_op_bytes", "JSON-encoded size of profile data loaded or saved", ["op"],
+                             buckets=BYTES_BUCKETS)
+
+SCRAPE_SECONDS = Histogram("scrape_seconds", "Latency of web scrapes", ["source", "outcome"], buckets=LLM_BUCKETS)
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "API request latency", ["method", "route", "status"])
+
+
+def observe_llm_response(caller, model, data):
+    """Records the timings and token counts Ollama reports on its final (done) message."""
+    if "prompt_eval_duration" in data:
+        OLLAMA_PROMPT_EVAL_SECONDS.labels(caller, model).observe(data["prompt_eval_duration"] / 1e9)
+    if "eval_duration" in data:
+        OLLAMA_EVAL_SECONDS.labels(caller, model).observe(data["eval_duration"] / 1e9)
+    if "prompt_eval_count" in data:
+        OLLAMA_PROMPT_TOKENS.labels(caller, model).observe(data["prompt_eval_count"])
+    if "eval_count" in data:
+        OLLAMA_EVAL_TOKENS.labels(caller, model).observe(data["eval_count"])
+
+
+class StatsCollector:
+    """Exposes the numbers from the existing stats() functions as gauges, read at scrape time.
+
+    stats_fns maps a name to a function returning a dict; numeric values become
+    `<name>_<key>` gauges and one level of nested dicts (e.g. per-model counters)
+    becomes a `key` label.
+    """
+
+    def __init__(self, stats_fns):
+        self.stats_fns = stats_fns
+
+    def collect(self):
+        for name, stats_fn in self.stats_fns.items():
+            try:
+                stats = stats_fn()
+            except Exception:
+                continue
+            nested = {}
+            for key, value in stats.items():
+                if isinstance(value, bool) or value is None:
+                    value = float(bool(value))
+                if isinstance(value, (int, float)):
+                    yield GaugeMetricFamily(f"{name}_{key}", f"{name} stats: {key}", value=value)
+                elif isinstance(value, dict):
+                    for field, number in value.items():
+                        if isinstance(number, (int, float)) and not isinstance(number, bool):
+                            nested.setdefault(field, []).append((key, number))
+            for field, samples in nested.items():
+                family = GaugeMetricFamily(f"{name}_{field}", f"{name} stats: {field}", labels=["key"])
+                for key, number in samples:
+                    family.add_metric([str(key)], number)
+                yield family
+
+
+def register_stats(stats_fns):
+    REGISTRY.register(StatsCollector(stats_fns))
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from mcq import DIFFICULTIES, QUIZ_TOPICS, validate_quiz_question
+
+logger = logging.getLogger(__name__)
+
+QUESTION_BANK_FILE = os.environ.get("QUESTION_BANK_FILE", "question_bank.json")
+# Questions kept ready per (topic, difficulty)
+QUESTION_BANK_SIZE = int(os.environ.get("QUESTION_BANK_SIZE", 8))
+# The background worker tops a pool up once it falls to this many questions
+QUESTION_BANK_LOW_WATER = int(os.environ.get("QUESTION_BANK_LOW_WATER", 3))
+# A question is retired after this many users have been served it
+QUESTION_BANK_MAX_SERVES = int(os.environ.get("QUESTION_BANK_MAX_SERVES", 25))
+# How often the worker checks the pools even if nobody has drained them
+QUESTION_BANK_REFILL_INTERVAL = float(os.environ.get("QUESTION_BANK_REFILL_INTERVAL", 60))
+# Question hashes remembered per user, to avoid serving repeats
+QUESTION_BANK_SEEN_LIMIT = int(os.environ.get("QUESTION_BANK_SEEN_LIMIT", 1000))
+
+
+def question_hash(mcq):
+    """Identifies a question by its normalised text, so regenerated duplicates are caught too."""
+    text = " ".join(mcq["question"].lower().split())
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _loaded_entry(entry):
+    """A pool entry read from disk, re-validated and re-hashed, or None if it isn't a usable question."""
+    if not isinstance(entry, dict):
+        return None
+    try:
+        mcq = validate_quiz_question(entry.get("mcq"))
+    except ValueError:
+        return None
+    serves = entry.get("serves")
+    return {"hash": question_hash(mcq), "mcq": mcq, "serves": serves if isinstance(serves, int) else 0}
+
+
+class QuestionBank:
+    """Pools of pre-generated, validated MCQs per (topic, difficulty), persisted to disk.
+
+    take() serves a question the user hasn't seen yet without calling the model.
+    A background worker (run()) regenerates questions for pools that drop below
+    the low-water mark.
+    """
+
+    def __init__(self, path=QUESTION_BANK_FILE, size=QUESTION_BANK_SIZE, low_water=QUESTION_BANK_LOW_WATER,
+                 max_serves=QUESTION_BANK_MAX_SERVES, topics=QUIZ_TOPICS, difficulties=DIFFICULTIES):
+        self.path = path
+        self.size = size
+        self.low_water = low_water
+        self.max_serves = max_serves
+        self.topics = list(topics)
+        self.difficulties = list(difficulties)
+        self._pools = {} # (topic, difficulty) -> list of {"hash", "mcq", "serves"}
+        self._seen = {} # user_id -> OrderedDict of question hashes
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._wakeup = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.rejected = 0
+        self.load()
+
+    # --- persistence ---
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning("Could not load question bank from %s: %s", self.path, e)
+            return
+        if not isinstance(data, dict):
+            logger.warning("Could not load question bank from %s: not a JSON object", self.path)
+            return
+        dropped = 0
+        with self._lock:
+            for key, entries in (data.get("pools") or {}).items():
+                topic, _, difficulty = key.rpartition("|")
+                valid = [_loaded_entry(entry) for entry in (entries if isinstance(entries, list) else [])]
+                pool = [entry for entry in valid if entry is not None]
+                dropped += (len(entries) if isinstance(entries, list) else 1) - len(pool)
+                self._pools[(topic, difficulty)] = pool
+            for user_id, hashes in (data.get("seen") or {}).items():
+                if isinstance(hashes, list):
+                    self._seen[user_id] = OrderedDict.fromkeys(hashes)
+            if dropped:
+                # Rewritten without the bad entries on the next save
+                self.rejected += dropped
+                self._dirty = True
+        if dropped:
+            logger.warning("Dropped %d malformed questions from %s", dropped, self.path)
+
+    def save(self):
+        """Writes the pools and per-user history if anything changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                "pools": {f"{topic}|{difficulty}": entries for (topic, difficulty), entries in self._pools.items()},
+                "seen": {user_id: list(hashes) for user_id, hashes in self._seen.items()},
+            }
+            self._dirty = False
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    # --- serving ---
+
+    def take(self, topic, difficulty, user_id=None):
+        """Returns a copy of a banked question the user hasn't seen, or None on a miss."""
+        with self._lock:
+            pool = self._pools.get((topic, difficulty), [])
+            seen = self._seen.get(user_id, {}) if user_id else {}
+            for entry in pool:
+                if entry["hash"] in seen:
+                    continue
+                entry["serves"] += 1
+                if entry["serves"] >= self.max_serves:
+                    pool.remove(entry)
+                self._mark_seen(user_id, entry["hash"])
+                self._dirty = True
+                self.hits += 1
+                running_low = len(pool) <= self.low_water
+                mcq = dict(entry["mcq"])
+                break
+            else:
+                self.misses += 1
+                return None
+        if running_low:
+            self._wake_worker()
+        return mcq
+
+    def add(self, topic, difficulty, mcq, served_to=None):
+        """Banks a freshly generated question (optionally already shown to `served_to`).
+
+        Returns False if the question is invalid or a duplicate of one already in the pool.
+        """
+        try:
+            validate_quiz_question(mcq)
+        except ValueError:
+            with self._lock:
+                self.rejected += 1
+            return False
+        digest = question_hash(mcq)
+        with self._lock:
+            if served_to:
+                self._mark_seen(served_to, digest)
+                self._dirty = True
+            pool = self._pools.setdefault((topic, difficulty), [])
+            if len(pool) >= self.size or any(entry["hash"] == digest for entry in pool):
+                return False
+            pool.append({"hash": digest, "mcq": mcq, "serves": 1 if served_to else 0})
+            self._dirty = True
+            return True
+
+    def _mark_seen(self, user_id, digest):
+        if not user_id:
+            return
+        seen = self._seen.setdefault(user_id, OrderedDict())
+        seen[digest] = None
+        seen.move_to_end(digest)
+        while len(seen) > QUESTION_BANK_SEEN_LIMIT:
+            seen.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "generated": self.generated,
+                "rejected": self.rejected,
+                "pooled": sum(len(pool) for pool in self._pools.values()),
+                "pools_below_low_water": len(self._low_pools()),
+            }
+
+    # --- background refill ---
+
+    def _low_pools(self):
+        return [
+            (topic, difficulty)
+            for topic in self.topics
+            for difficulty in self.difficulties
+            if len(self._pools.get((topic, difficulty), [])) <= self.low_water
+        ]
+
+    def _wake_worker(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def refill(self, generate_fn):
+        """Tops every pool at or below the low-water mark back up to the target size.
+
+        Questions are generated one at a time, emptiest pool first, so the local
+        model never gets more than one background generation at once. A failing
+        generation ends the round; the next round retries.
+        """
+        with self._lock:
+            targets = sorted(self._low_pools(), key=lambda key: len(self._pools.get(key, [])))
+        for topic, difficulty in targets:
+            # Bounded, since the model may keep producing duplicates or invalid questions
+            for _ in range(self.size * 2):
+                with self._lock:
+                    if len(self._pools.get((topic, difficulty), [])) >= self.size:
+                        break
+                try:
+                    mcq = await generate_fn(topic, difficulty)
+                except Exception as e:
+                    logger.warning("Could not pre-generate an MCQ for %s (%s): %s", topic, difficulty, e)
+                    await asyncio.to_thread(self.save)
+                    return
+                with self._lock:
+                    self.generated += 1
+                self.add(topic, difficulty, mcq)
+        await asyncio.to_thread(self.save)
+
+    async def run(self, generate_fn, interval=QUESTION_BANK_REFILL_INTERVAL):
+        """Background loop: refills low pools on a schedule or as soon as take() drains one."""
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                await self.refill(generate_fn)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            self._wakeup = None
+            self.save()
+
+
+question_bank = QuestionBank()
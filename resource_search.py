@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import quote_plus
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from metrics import SCRAPE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_SEARCH_CACHE_FILE = os.environ.get("RESOURCE_SEARCH_CACHE_FILE", "resource_search_cache.json")
+# How long a topic's search results are reused before searching again
+RESOURCE_SEARCH_TTL = float(os.environ.get("RESOURCE_SEARCH_TTL", 24 * 3600))
+# Searches that found nothing are retried sooner
+RESOURCE_SEARCH_EMPTY_TTL = float(os.environ.get("RESOURCE_SEARCH_EMPTY_TTL", 600))
+# Total time a caller waits for fresh results before falling back to what's cached
+RESOURCE_SEARCH_DEADLINE = float(os.environ.get("RESOURCE_SEARCH_DEADLINE", 4))
+RESOURCE_SEARCH_CONNECT_TIMEOUT = float(os.environ.get("RESOURCE_SEARCH_CONNECT_TIMEOUT", 3))
+RESOURCE_SEARCH_READ_TIMEOUT = float(os.environ.get("RESOURCE_SEARCH_READ_TIMEOUT", 8))
+RESOURCE_SEARCH_WORKERS = int(os.environ.get("RESOURCE_SEARCH_WORKERS", 4))
+RESOURCE_SEARCH_URL = os.environ.get("RESOURCE_SEARCH_URL", "https://www.google.com/search?q={query}&hl=en&gl=us")
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0;Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
+
+
+def parse_search_results(html, topic, limit=5):
+    """Pulls course links out of a Google results page."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Find all potential result blocks. This is a heuristic.
+    # Look for divs that contain an h3 (title) and an a tag (link)
+    potential_results = []
+    for h3_tag in soup.find_all('h3'):
+        # Find the closest parent div that contains an 'a' tag
+        parent_div = h3_tag.find_parent('div')
+        while parent_div:
+            if parent_div.find('a', href=True):
+                potential_results.append(parent_div)
+                break
+            parent_div = parent_div.find_parent('div')
+
+    resources = []
+    for result_block in potential_results[:limit]:
+        title_element = result_block.find('h3')
+        link_element = result_block.find('a', href=True)
+
+        # Try to find a description element within the result block
+        description_element = result_block.find(['span', 'div', 'p'], class_=lambda x: x and ('st' in x.split() or 's' in x.split() or 'aCOpRe' in x.split() or 'VwiC3b' in x.split()))
+
+        if title_element and link_element:
+            url = link_element['href']
+            # Basic filtering for valid URLs
+            if not url.startswith("http"):
+                continue
+            resources.append({
+                "title": title_element.get_text(),
+                "url": url,
+                "description": description_element.get_text() if description_element else "No description available.",
+                "topics_covered": [topic],
+                "difficulty_level": "mixed",
+            })
+    return resources
+
+
+class ResourceSearch:
+    """Per-topic web search for learning resources, shared by every user.
+
+    Results are cached per topic with a TTL and persisted to disk, so a restart
+    doesn't trigger a fresh round of searches. Searches run concurrently on a
+    small thread pool over one pooled HTTP session, and callers never wait longer
+    than the deadline: a search that's still running keeps going in the
+    background and fills the cache for the next caller. Concurrent callers for
+    the same topic share one search.
+    """
+
+    def __init__(self, path=RESOURCE_SEARCH_CACHE_FILE, ttl=RESOURCE_SEARCH_TTL, empty_ttl=RESOURCE_SEARCH_EMPTY_TTL,
+                 workers=RESOURCE_SEARCH_WORKERS):
+        self.path = path
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self._cache = {} # topic -> {"fetched_at", "results"}
+        self._in_flight = {} # topic -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resource-search")
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self.hits = 0
+        self.stale = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.load()
+
+    # --- persistence ---
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning("Could not load resource search cache from %s: %s", self.path, e)
+            return
+        with self._lock:
+            self._cache.update(data)
+
+    def save(self):
+        with self._lock:
+            data = dict(self._cache)
+        tmp_path = f"{self.path}.tmp.{threading.get_ident()}"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not save resource search cache to %s: %s", self.path, e)
+
+    # --- fetching ---
+
+    def _is_fresh(self, entry):
+        ttl = self.ttl if entry["results"] else self.empty_ttl
+        return time.time() - entry["fetched_at"] < ttl
+
+    def _fetch(self, topic):
+        start = time.perf_counter()
+        try:
+            response = self._session.get(
+                RESOURCE_SEARCH_URL.format(query=quote_plus(f"best online courses for {topic}")),
+                headers=HEADERS,
+                timeout=(RESOURCE_SEARCH_CONNECT_TIMEOUT, RESOURCE_SEARCH_READ_TIMEOUT),
+            )
+            response.raise_for_status()
+            results = parse_search_results(response.text, topic)
+        except Exception as e:
+            SCRAPE_SECONDS.labels("recommendations", "error").observe(time.perf_counter() - start)
+            with self._lock:
+                self.failures += 1
+                self._in_flight.pop(topic, None)
+            logger.warning("Could not perform web search for %r: %s", topic, e)
+            raise
+        SCRAPE_SECONDS.labels("recommendations", "ok" if results else "empty").observe(time.perf_counter() - start)
+        with self._lock:
+            self._cache[topic] = {"fetched_at": time.time(), "results": results}
+            self._in_flight.pop(topic, None)
+        self.save()
+        return results
+
+    def search(self, topics, deadline=RESOURCE_SEARCH_DEADLINE):
+        """Returns {topic: results} for the topics that have fresh or cached results by the deadline."""
+        found = {}
+        pending = {}
+        with self._lock:
+            for topic in topics:
+                entry = self._cache.get(topic)
+                if entry is not None and self._is_fresh(entry):
+                    self.hits += 1
+                    found[topic] = entry["results"]
+                    continue
+                future = self._in_flight.get(topic)
+                if future is None:
+                    self.fetches += 1
+                    future = self._in_flight[topic] = self._executor.submit(self._fetch, topic)
+                else:
+                    self.coalesced += 1
+                pending[future] = topic
+
+        done, not_done = wait(pending, timeout=deadline)
+        for future, topic in pending.items():
+            if future in done and future.exception() is None:
+                found[topic] = future.result()
+                continue
+            with self._lock:
+                if future in not_done:
+                    self.timeouts += 1
+                # Expired or failed: fall back to whatever we had for the topic
+                entry = self._cache.get(topic)
+                if entry is not None:
+                    self.stale += 1
+                    found[topic] = entry["results"]
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached_topics": len(self._cache),
+                "hits": self.hits,
+                "stale": self.stale,
+                "fetches": self.fetches,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._in_flight),
+            }
+
+
+resource_search = ResourceSearch()
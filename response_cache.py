@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Total size of cached responses (UTF-8 bytes plus keys)
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 24 * 3600))
+# Empty disables persistence; otherwise the cache is loaded on startup and saved on shutdown
+RESPONSE_CACHE_FILE = os.environ.get("RESPONSE_CACHE_FILE", "")
+
+_PUNCTUATION_RE = re.compile(r"[\s.!?,;:]+$")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_message(message):
+    """Case, surrounding whitespace and trailing punctuation don't change the answer: "Hello!" == "hello"."""
+    message = _WHITESPACE_RE.sub(" ", message.strip().casefold())
+    return _PUNCTUATION_RE.sub("", message) or message
+
+
+class ResponseCache:
+    """LRU cache of chat responses, bounded by bytes and expiring after a TTL.
+
+    Keys hash the model together with the exact prompt that would be sent for the
+    normalized message, so the system instruction, rolling summary and whichever
+    history turns survived truncation are all part of the key. In practice the
+    hits are first messages of new sessions, which all share the same prompt.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL, path=RESPONSE_CACHE_FILE):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict() # key -> (expires_at, response, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expired = 0
+        if path:
+            self.load()
+
+    @staticmethod
+    def key(model, prompt):
+        return hashlib.blake2b(f"{model}\0{prompt}".encode(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._drop(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, response, expires_at=None):
+        if not response:
+            return
+        size = len(response.encode()) + len(key)
+        with self._lock:
+            self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (expires_at or time.time() + self.ttl, response, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def bypass(self):
+        """Counts a request that skipped the cache."""
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    # --- persistence ---
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning("Could not load response cache from %s: %s", self.path, e)
+            return
+        now = time.time()
+        # Saved least recently used first, so replaying put() restores the LRU order
+        for key, expires_at, response in data:
+            if expires_at > now:
+                self.put(key, response, expires_at)
+        logger.info("Loaded %d cached responses from %s", len(self._entries), self.path)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = [(key, expires_at, response) for key, (expires_at, response, _) in self._entries.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not save response cache to %s: %s", self.path, e)
+
+
+response_cache = ResponseCache()
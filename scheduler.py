@@ -0,0 +1,226 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from metrics import LLM_QUEUE_WAIT_SECONDS, LLM_SHED
+
+# Priority classes, highest first
+PRIORITIES = ("interactive", "quiz", "background")
+
+# Generations running at once across every class
+LLM_SCHEDULER_SLOTS = int(os.environ.get("LLM_SCHEDULER_SLOTS", os.environ.get("LLM_MAX_IN_FLIGHT", 4)))
+# Queued jobs a single user may have per class before getting 429s
+LLM_SCHEDULER_USER_QUEUE = int(os.environ.get("LLM_SCHEDULER_USER_QUEUE", 4))
+# Service time assumed for a class until some of its jobs have finished
+LLM_SCHEDULER_INITIAL_ESTIMATE = float(os.environ.get("LLM_SCHEDULER_INITIAL_ESTIMATE", 5))
+
+
+def _class_limits(priority, concurrency, queue, max_wait):
+    prefix = f"LLM_{priority.upper()}"
+    return {
+        "concurrency": int(os.environ.get(f"{prefix}_CONCURRENCY", concurrency)),
+        "queue": int(os.environ.get(f"{prefix}_QUEUE", queue)),
+        # Longest a job may wait for a slot; jobs that can't start in time are shed
+        "max_wait": float(os.environ.get(f"{prefix}_MAX_WAIT", max_wait)),
+    }
+
+
+# Quiz generation leaves a slot free for chat; background work gets one slot and waits as long as it takes
+DEFAULT_LIMITS = {
+    "interactive": _class_limits("interactive", LLM_SCHEDULER_SLOTS, 64, 30),
+    "quiz": _class_limits("quiz", max(LLM_SCHEDULER_SLOTS - 1, 1), 64, 20),
+    "background": _class_limits("background", 1, 16, 600),
+}
+
+
+class LLMOverloaded(Exception):
+    """A job the scheduler refused or gave up on. The API turns it into 429/503 with Retry-After."""
+
+    def __init__(self, status_code, retry_after, reason):
+        super().__init__(f"LLM overloaded ({reason}); retry after {retry_after}s")
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Job:
+    __slots__ = ("priority", "user_id", "granted", "enqueued_at")
+
+    def __init__(self, priority, user_id):
+        self.priority = priority
+        self.user_id = user_id
+        self.granted = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """Orders LLM jobs by priority class and sheds what can't be served in time.
+
+    A freed slot goes to the highest class with queued jobs that is below its own
+    concurrency limit. Within a class, users take turns, so one user's burst
+    doesn't delay everyone else's single request. A job is refused up front when
+    its class queue is full (503), when its user already has too many queued
+    jobs (429), or when the estimated wait exceeds the class's max_wait (503); a
+    queued job that is still waiting at max_wait is shed too. Wait estimates use
+    a moving average of each class's service time.
+
+    Single event loop only, like the rest of the async LLM path.
+    """
+
+    def __init__(self, slots=LLM_SCHEDULER_SLOTS, limits=None, user_queue=LLM_SCHEDULER_USER_QUEUE):
+        self.slots = slots
+        self.limits = limits or DEFAULT_LIMITS
+        self.user_queue = user_queue
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES} # priority -> user_id -> deque of jobs
+        self._queued = dict.fromkeys(PRIORITIES, 0)
+        self._running = dict.fromkeys(PRIORITIES, 0)
+        self._service = dict.fromkeys(PRIORITIES, LLM_SCHEDULER_INITIAL_ESTIMATE)
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.shed = dict.fromkeys(PRIORITIES, 0)
+
+    @asynccontextmanager
+    async def slot(self, priority="interactive", user_id=None):
+        """Holds one generation slot for the duration of the block."""
+        if priority not in self.limits:
+            raise ValueError(f"Unknown LLM priority {priority!r}")
+        await self._wait(self._admit(priority, user_id))
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - started)
+
+    def check(self, priority="interactive", user_id=None):
+        """Raises LLMOverloaded if a job submitted now would be refused, without queuing anything.
+
+        For streaming endpoints, which can't change their status code once the body has started.
+        """
+        if not self._can_start(priority):
+            self._refusal(priority, user_id)
+
+    # --- admission ---
+
+    def _dispatchable(self, priority):
+        return self._queued[priority] and self._running[priority] < self.limits[priority]["concurrency"]
+
+    def _can_start(self, priority):
+        """Whether a new job of this class would be dispatched right away."""
+        return (
+            self._queued[priority] == 0
+            and self._running[priority] < self.limits[priority]["concurrency"]
+            and sum(self._running.values()) < self.slots
+            and not any(self._dispatchable(p) for p in PRIORITIES[:PRIORITIES.index(priority)])
+        )
+
+    def _estimated_wait(self, priority, ahead):
+        concurrency = min(self.limits[priority]["concurrency"], self.slots)
+        return (ahead + 1) * self._service[priority] / max(concurrency, 1)
+
+    def _refusal(self, priority, user_id):
+        """Raises if a new job of this class must be refused; otherwise returns."""
+        limits = self.limits[priority]
+        user_jobs = self._queues[priority].get(user_id, ())
+        if self._queued[priority] >= limits["queue"]:
+            self._shed(priority, "queue_full", 503, self._estimated_wait(priority, self._queued[priority]))
+        if user_id is not None and len(user_jobs) >= self.user_queue:
+            self._shed(priority, "user_queue_full", 429, self._estimated_wait(priority, len(user_jobs)))
+        # Higher classes go first, so their queues are ahead of this job too
+        ahead = sum(self._queued[p] for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+        wait = self._estimated_wait(priority, ahead)
+        if wait > limits["max_wait"]:
+            self._shed(priority, "deadline", 503, wait)
+
+    def _admit(self, priority, user_id):
+        """Queues the job, or raises LLMOverloaded. A job that can start right away is granted here."""
+        if not self._can_start(priority):
+            self._refusal(priority, user_id)
+        job = _Job(priority, user_id)
+        self._queues[priority].setdefault(user_id, deque()).append(job)
+        self._queued[priority] += 1
+        self._dispatch()
+        return job
+
+    async def _wait(self, job):
+        timeout = self.limits[job.priority]["max_wait"]
+        try:
+            if not job.granted.done():
+                await asyncio.wait_for(asyncio.shield(job.granted), timeout)
+        except asyncio.TimeoutError:
+            if not job.granted.done():
+                self._dequeue(job)
+                self._shed(job.priority, "deadline", 503, self._estimated_wait(job.priority, self._queued[job.priority]))
+        except asyncio.CancelledError:
+            # The caller went away: give back the slot if it was just granted, otherwise leave the queue
+            if job.granted.done():
+                self._release(job.priority, None)
+            else:
+                self._dequeue(job)
+            raise
+        LLM_QUEUE_WAIT_SECONDS.labels(job.priority).observe(time.monotonic() - job.enqueued_at)
+
+    def _shed(self, priority, reason, status_code, wait):
+        self.shed[priority] += 1
+        LLM_SHED.labels(priority, reason).inc()
+        raise LLMOverloaded(status_code, max(1, math.ceil(wait)), reason)
+
+    # --- dispatch ---
+
+    def _start(self, priority):
+        self._running[priority] += 1
+        self.admitted[priority] += 1
+
+    def _dequeue(self, job):
+        users = self._queues[job.priority]
+        jobs = users.get(job.user_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            self._queued[job.priority] -= 1
+            if not jobs:
+                del users[job.user_id]
+
+    def _next_job(self, priority):
+        """Pops the next job of a class, taking users in turn."""
+        users = self._queues[priority]
+        user_id, jobs = next(iter(users.items()))
+        job = jobs.popleft()
+        del users[user_id]
+        if jobs:
+            # Back of the line for this user's next job
+            users[user_id] = jobs
+        self._queued[priority] -= 1
+        return job
+
+    def _release(self, priority, service_seconds):
+        self._running[priority] -= 1
+        if service_seconds is not None:
+            self._service[priority] = 0.8 * self._service[priority] + 0.2 * service_seconds
+        self._dispatch()
+
+    def _dispatch(self):
+        while sum(self._running.values()) < self.slots:
+            for priority in PRIORITIES:
+                if self._dispatchable(priority):
+                    job = self._next_job(priority)
+                    self._start(priority)
+                    job.granted.set_result(True)
+                    break
+            else:
+                return
+
+    def stats(self):
+        return {
+            priority: {
+                "queued": self._queued[priority],
+                "running": self._running[priority],
+                "admitted": self.admitted[priority],
+                "shed": self.shed[priority],
+                "service_seconds": round(self._service[priority], 3),
+            }
+            for priority in PRIORITIES
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+
+class AsyncSingleFlight:
+    """Merges concurrent identical calls into one upstream execution.
+
+    do(key, fn) runs `fn()` unless a call with the same key is already in flight,
+    in which case it waits for that one and gets the same result (or exception).
+    The upstream call runs as its own task, so a caller that goes away (e.g. a
+    client disconnect) doesn't cancel it for the others. Results are shared
+    objects: callers that modify them must copy first.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._in_flight = {} # key -> Task
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+
+    async def do(self, key, fn):
+        with self._lock:
+            self.calls += 1
+            task = self._in_flight.get(key)
+            if task is None:
+                self.executions += 1
+                task = self._in_flight[key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+        if not task.cancelled():
+            # Retrieved here so an exception nobody awaited isn't reported as unhandled
+            task.exception()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.calls - self.executions,
+                "in_flight": len(self._in_flight),
+            }
+
+
+_flights = {}
+
+
+def single_flight(name):
+    """Returns the AsyncSingleFlight registered under `name`, creating it on first use."""
+    flight = _flights.get(name)
+    if flight is None:
+        flight = _flights.setdefault(name, AsyncSingleFlight(name))
+    return flight
+
+
+def single_flight_stats():
+    """Calls before and after coalescing, per flight."""
+    return {name: flight.stats() for name, flight in _flights.items()}
@@ -0,0 +1,662 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+USER_PROFILES_FILE = os.environ.get("USER_PROFILES_FILE", "user_profiles.json")
+USER_PROFILES_DB = os.environ.get("USER_PROFILES_DB", "user_profiles.db")
+# "sqlite" (default) or "json" to fall back to the single-file store
+USER_PROFILES_BACKEND = os.environ.get("USER_PROFILES_BACKEND", "sqlite")
+
+
+def _new_profile():
+    return {"quiz_history": [], "chat_sessions": {}, "performance_aggregates": {}}
+
+
+def _add_to_aggregates(aggregates, quiz_session_data):
+    """Adds one quiz session's results to {topic: {difficulty: {"correct", "total"}}} in place."""
+    for result in quiz_session_data.get("results", []):
+        topic = result.get("topic")
+        difficulty = result.get("difficulty")
+        if topic and difficulty is not None:
+            stats = aggregates.setdefault(topic, {}).setdefault(str(difficulty), {"correct": 0, "total": 0})
+            stats["total"] += 1
+            if result.get("correct"):
+                stats["correct"] += 1
+    return aggregates
+
+
+def _page(items, limit=None, before=None, after=None, newest_first=False):
+    """Slices [(seq, item), ...] in ascending seq order the way the SQL backend's queries do."""
+    items = [(seq, item) for seq, item in items
+             if (before is None or seq < before) and (after is None or seq > after)]
+    if newest_first:
+        items.reverse()
+    return [{**item, "seq": seq} for seq, item in items[:limit]]
+
+
+def _range_clause(column, before, after):
+    clause, params = "", []
+    if before is not None:
+        clause += f" AND {column} < ?"
+        params.append(before)
+    if after is not None:
+        clause += f" AND {column} > ?"
+        params.append(after)
+    return clause, params
+
+
+def compute_performance_aggregates(quiz_history):
+    """Full recompute of the per topic x difficulty counters from a quiz history."""
+    aggregates = {}
+    for quiz_session_data in quiz_history:
+        _add_to_aggregates(aggregates, quiz_session_data)
+    return aggregates
+
+
+class JSONStorage:
+    """The original storage: every profile lives in one JSON file that is rewritten on each change."""
+
+    name = "json"
+
+    def __init__(self, path=USER_PROFILES_FILE):
+        self.path = path
+        # Serialises read-modify-write cycles so concurrent requests don't lose updates
+        self._lock = threading.RLock()
+
+    def version(self):
+        """A cheap token that changes whenever the file is rewritten (by us or anyone else)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load_all(self):
+        """Load all user profiles from the JSON file, ensuring it's a dictionary."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                # Handle empty file case
+                content = f.read()
+                if not content:
+                    return {}
+                data = json.loads(content)
+                # Ensure the loaded data is a dictionary
+                if not isinstance(data, dict):
+                    logger.warning("%s did not contain a dictionary. Resetting.", self.path)
+                    return {}
+                return data
+        except json.JSONDecodeError:
+            logger.warning("%s is malformed. Starting with an empty profile.", self.path)
+            return {}
+
+    def save_all(self, profiles):
+        """Save all user profiles, writing to a temp file first so readers never see a partial file."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(profiles, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def _update(self, user_id, fn):
+        """Runs fn(user_profile) under the lock and saves only if it returns True."""
+        with self._lock:
+            profiles = self.load_all()
+            user_profile = profiles.setdefault(user_id, _new_profile())
+            user_profile.setdefault("chat_sessions", {})
+            user_profile.setdefault("quiz_history", [])
+            changed = fn(user_profile)
+            if changed:
+                self.save_all(profiles)
+            return changed
+
+    def get_user(self, user_id):
+        return self.load_all().get(user_id)
+
+    def ensure_user(self, user_id):
+        self._update(user_id, lambda profile: True)
+
+    def create_session(self, user_id, chat_id, title):
+        def _create(profile):
+            now = time.time()
+            profile["chat_sessions"][chat_id] = {
+                "id": chat_id, "title": title, "history": [], "created_at": now, "updated_at": now,
+            }
+            return True
+        self._update(user_id, _create)
+
+    def get_sessions(self, user_id, limit=None, before=None, after=None, newest_first=False):
+        """Session metadata in creation order; seq is the session's position, usable as a cursor."""
+        profile = self.get_user(user_id) or {}
+        sessions = [
+            (seq, {
+                "id": s["id"],
+                "title": s["title"],
+                "message_count": len(s.get("history", [])),
+                "updated_at": s.get("updated_at"),
+            })
+            for seq, s in enumerate(profile.get("chat_sessions", {}).values())
+        ]
+        return _page(sessions, limit, before, after, newest_first)
+
+    def get_history(self, user_id, chat_id, limit=None, before=None, after=None, newest_first=False):
+        """Turns of a session, each with its seq (position), or None if the session doesn't exist."""
+        profile = self.get_user(user_id) or {}
+        session = profile.get("chat_sessions", {}).get(chat_id)
+        if not session:
+            return None
+        return _page(enumerate(session["history"]), limit, before, after, newest_first)
+
+    def delete_session(self, user_id, chat_id):
+        def _delete(profile):
+            return profile["chat_sessions"].pop(chat_id, None) is not None
+        return self._update(user_id, _delete)
+
+    def append_message(self, user_id, chat_id, user_message, bot_message):
+        """Returns the session's new turn count (the appended turn is the last), or False for an unknown session."""
+        def _append(profile):
+            session = profile["chat_sessions"].get(chat_id)
+            if not session:
+                return False
+            # If this is the first message, use it to set the title
+            if not session["history"]:
+                session["title"] = user_message[:50]
+            session["history"].append({"user": user_message, "bot": bot_message})
+            session["updated_at"] = time.time()
+            return len(session["history"])
+        return self._update(user_id, _append)
+
+    def set_session_summary(self, user_id, chat_id, summary, upto):
+        def _set(profile):
+            session = profile["chat_sessions"].get(chat_id)
+            if not session:
+                return False
+            session["summary"] = summary
+            session["summary_upto"] = upto
+            return True
+        return self._update(user_id, _set)
+
+    def add_quiz_result(self, user_id, quiz_session_data):
+        def _add(profile):
+            if "performance_aggregates" not in profile:
+                # Profile written before aggregates existed: backfill it from its history first
+                profile["performance_aggregates"] = compute_performance_aggregates(profile["quiz_history"])
+            profile["quiz_history"].append(quiz_session_data)
+            _add_to_aggregates(profile["performance_aggregates"], quiz_session_data)
+            return True
+        self._update(user_id, _add)
+
+    def backfill_performance_aggregates(self):
+        """Recomputes the stored aggregates of every profile from its quiz history. Returns the number of users."""
+        with self._lock:
+            profiles = self.load_all()
+            for profile in profiles.values():
+                profile["performance_aggregates"] = compute_performance_aggregates(profile.get("quiz_history", []))
+            self.save_all(profiles)
+            return len(profiles)
+
+    def get_quiz_history(self, user_id):
+        profile = self.get_user(user_id) or {}
+        return profile.get("quiz_history", [])
+
+    def count_quiz_sessions(self, user_id):
+        """Number of quiz sessions the user has taken; None if the user doesn't exist."""
+        profile = self.get_user(user_id)
+        return None if profile is None else len(profile.get("quiz_history", []))
+
+    def get_performance_aggregates(self, user_id):
+        profile = self.get_user(user_id) or {}
+        aggregates = profile.get("performance_aggregates")
+        if aggregates is None:
+            # Profile written before aggregates existed and not backfilled yet
+            aggregates = compute_performance_aggregates(profile.get("quiz_history", []))
+        return aggregates
+
+    def iter_quiz_results(self):
+        """Yields (user_id, topic, difficulty, correct, timestamp) for every answered question."""
+        for user_id, profile in self.load_all().items():
+            for session in profile.get("quiz_history", []):
+                for r in session.get("results", []):
+                    if r.get("topic") and r.get("difficulty") is not None:
+                        yield user_id, r["topic"], r["difficulty"], bool(r.get("correct")), session.get("timestamp")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id     TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    user_id       TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    chat_id       TEXT NOT NULL,
+    title         TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    summary       TEXT NOT NULL DEFAULT '',
+    summary_upto  INTEGER NOT NULL DEFAULT 0,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL,
+    PRIMARY KEY (user_id, chat_id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id     TEXT NOT NULL,
+    chat_id     TEXT NOT NULL,
+    seq         INTEGER NOT NULL,
+    user_text   TEXT NOT NULL,
+    bot_text    TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (user_id, chat_id, seq),
+    FOREIGN KEY (user_id, chat_id) REFERENCES chat_sessions(user_id, chat_id) ON DELETE CASCADE
+);
+CREATE TABLE IF NOT EXISTS quiz_sessions (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id     TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    timestamp   TEXT,
+    type        TEXT,
+    score       INTEGER,
+    payload     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quiz_sessions_user ON quiz_sessions(user_id, id);
+CREATE TABLE IF NOT EXISTS quiz_results (
+    quiz_session_id INTEGER NOT NULL REFERENCES quiz_sessions(id) ON DELETE CASCADE,
+    user_id         TEXT NOT NULL,
+    topic           TEXT,
+    difficulty      TEXT,
+    correct         INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quiz_results_user ON quiz_results(user_id);
+CREATE TABLE IF NOT EXISTS quiz_aggregates (
+    user_id     TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    topic       TEXT NOT NULL,
+    difficulty  TEXT NOT NULL,
+    correct     INTEGER NOT NULL,
+    total       INTEGER NOT NULL,
+    PRIMARY KEY (user_id, topic, difficulty)
+);
+"""
+
+# Bumped (via PRAGMA user_version) when existing databases need a one-time data migration
+SCHEMA_VERSION = 1
+
+# Columns added after the first release; older databases get them via ALTER TABLE
+ADDED_COLUMNS = {
+    "chat_sessions": [
+        ("summary", "TEXT NOT NULL DEFAULT ''"),
+        ("summary_upto", "INTEGER NOT NULL DEFAULT 0"),
+    ],
+}
+
+
+class SQLiteStorage:
+    """Row-level storage in a SQLite database running in WAL mode.
+
+    Each chat turn or quiz session is a single INSERT, so writes no longer cost
+    O(total users), and WAL lets readers proceed while a writer commits.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=USER_PROFILES_DB, json_path=USER_PROFILES_FILE):
+        self.path = path
+        self._local = threading.local()
+        is_new = not os.path.exists(path)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        self._add_missing_columns(conn)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if not is_new and version < 1:
+            # Databases created before quiz_aggregates existed
+            self.backfill_performance_aggregates()
+        if version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        # First start after switching backends: carry the existing JSON profiles over
+        if is_new and json_path and os.path.exists(json_path):
+            migrated = self.save_all(JSONStorage(json_path).load_all())
+            logger.info("Migrated %d user profiles from %s to %s.", migrated, json_path, path)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _add_missing_columns(conn):
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _write(self, fn):
+        """Runs fn(conn) inside an immediate transaction."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    @staticmethod
+    def _ensure_user(conn, user_id):
+        conn.execute(
+            "INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)",
+            (user_id, time.time()),
+        )
+
+    def version(self):
+        """A cheap token that changes whenever the database or its WAL is written."""
+        token = []
+        for path in (self.path, f"{self.path}-wal"):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                token.append(None)
+                continue
+            token.append((st.st_mtime_ns, st.st_size))
+        return tuple(token)
+
+    def load_all(self):
+        conn = self._conn()
+        return {
+            user_id: self.get_user(user_id)
+            for (user_id,) in conn.execute("SELECT user_id FROM users ORDER BY rowid")
+        }
+
+    def save_all(self, profiles):
+        """Replaces the whole store with `profiles` (JSON layout). Returns the number of users written."""
+        def _replace(conn):
+            conn.execute("DELETE FROM users")
+            for user_id, profile in profiles.items():
+                self._import_profile(conn, user_id, profile)
+            return len(profiles)
+        return self._write(_replace)
+
+    def _import_profile(self, conn, user_id, profile):
+        now = time.time()
+        self._ensure_user(conn, user_id)
+        for chat_id, session in (profile.get("chat_sessions") or {}).items():
+            history = session.get("history", [])
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions"
+                " (user_id, chat_id, title, message_count, summary, summary_upto, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, session.get("title", "New Chat"), len(history),
+                 session.get("summary", ""), session.get("summary_upto", 0), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO messages (user_id, chat_id, seq, user_text, bot_text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, chat_id, seq, turn.get("user", ""), turn.get("bot", ""), now)
+                 for seq, turn in enumerate(history)],
+            )
+        for quiz_session_data in profile.get("quiz_history") or []:
+            self._insert_quiz_session(conn, user_id, quiz_session_data)
+
+    def get_user(self, user_id):
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is None:
+            return None
+        sessions = {}
+        for chat_id, title, summary, summary_upto in conn.execute(
+            "SELECT chat_id, title, summary, summary_upto FROM chat_sessions WHERE user_id = ? ORDER BY rowid", (user_id,)
+        ):
+            sessions[chat_id] = {"id": chat_id, "title": title, "history": []}
+            if summary:
+                sessions[chat_id]["summary"] = summary
+                sessions[chat_id]["summary_upto"] = summary_upto
+        for chat_id, user_text, bot_text in conn.execute(
+            "SELECT chat_id, user_text, bot_text FROM messages WHERE user_id = ? ORDER BY chat_id, seq", (user_id,)
+        ):
+            sessions[chat_id]["history"].append({"user": user_text, "bot": bot_text})
+        return {
+            "quiz_history": self.get_quiz_history(user_id),
+            "chat_sessions": sessions,
+            "performance_aggregates": self.get_performance_aggregates(user_id),
+        }
+
+    def ensure_user(self, user_id):
+        self._write(lambda conn: self._ensure_user(conn, user_id))
+
+    def create_session(self, user_id, chat_id, title):
+        def _create(conn):
+            now = time.time()
+            self._ensure_user(conn, user_id)
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (user_id, chat_id, title, message_count, created_at, updated_at)"
+                " VALUES (?, ?, ?, 0, ?, ?)",
+                (user_id, chat_id, title, now, now),
+            )
+        self._write(_create)
+
+    def get_sessions(self, user_id, limit=None, before=None, after=None, newest_first=False):
+        """Session metadata in creation order; seq (the rowid) is usable as a cursor."""
+        clause, params = _range_clause("rowid", before, after)
+        rows = self._conn().execute(
+            "SELECT rowid, chat_id, title, message_count, updated_at FROM chat_sessions WHERE user_id = ?"
+            f"{clause} ORDER BY rowid {'DESC' if newest_first else 'ASC'} LIMIT ?",
+            (user_id, *params, -1 if limit is None else limit),
+        )
+        return [
+            {"id": chat_id, "title": title, "message_count": message_count, "updated_at": updated_at, "seq": seq}
+            for seq, chat_id, title, message_count, updated_at in rows
+        ]
+
+    def get_history(self, user_id, chat_id, limit=None, before=None, after=None, newest_first=False):
+        """Turns of a session, each with its seq, or None if the session doesn't exist.
+
+        Only the requested slice is read, via the (user_id, chat_id, seq) primary key.
+        """
+        conn = self._conn()
+        if conn.execute(
+            "SELECT 1 FROM chat_sessions WHERE user_id = ? AND chat_id = ?", (user_id, chat_id)
+        ).fetchone() is None:
+            return None
+        clause, params = _range_clause("seq", before, after)
+        rows = conn.execute(
+            "SELECT seq, user_text, bot_text FROM messages WHERE user_id = ? AND chat_id = ?"
+            f"{clause} ORDER BY seq {'DESC' if newest_first else 'ASC'} LIMIT ?",
+            (user_id, chat_id, *params, -1 if limit is None else limit),
+        )
+        return [{"user": user_text, "bot": bot_text, "seq": seq} for seq, user_text, bot_text in rows]
+
+    def delete_session(self, user_id, chat_id):
+        def _delete(conn):
+            cursor = conn.execute(
+                "DELETE FROM chat_sessions WHERE user_id = ? AND chat_id = ?", (user_id, chat_id)
+            )
+            return cursor.rowcount > 0
+        return self._write(_delete)
+
+    def append_message(self, user_id, chat_id, user_message, bot_message):
+        """Returns the session's new turn count (the appended turn is the last), or False for an unknown session."""
+        def _append(conn):
+            row = conn.execute(
+                "SELECT message_count FROM chat_sessions WHERE user_id = ? AND chat_id = ?", (user_id, chat_id)
+            ).fetchone()
+            if row is None:
+                return False
+            seq = row[0]
+            now = time.time()
+            conn.execute(
+                "INSERT INTO messages (user_id, chat_id, seq, user_text, bot_text, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, seq, user_message, bot_message, now),
+            )
+            # If this is the first message, use it to set the title
+            conn.execute(
+                "UPDATE chat_sessions SET message_count = message_count + 1, updated_at = ?,"
+                " title = CASE WHEN message_count = 0 THEN ? ELSE title END"
+                " WHERE user_id = ? AND chat_id = ?",
+                (now, user_message[:50], user_id, chat_id),
+            )
+            return seq + 1
+        return self._write(_append)
+
+    def set_session_summary(self, user_id, chat_id, summary, upto):
+        def _set(conn):
+            cursor = conn.execute(
+                "UPDATE chat_sessions SET summary = ?, summary_upto = ? WHERE user_id = ? AND chat_id = ?",
+                (summary, upto, user_id, chat_id),
+            )
+            return cursor.rowcount > 0
+        return self._write(_set)
+
+    @staticmethod
+    def _insert_quiz_session(conn, user_id, quiz_session_data):
+        cursor = conn.execute(
+            "INSERT INTO quiz_sessions (user_id, timestamp, type, score, payload) VALUES (?, ?, ?, ?, ?)",
+            (
+                user_id,
+                quiz_session_data.get("timestamp"),
+                quiz_session_data.get("type"),
+                quiz_session_data.get("score"),
+                json.dumps(quiz_session_data),
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO quiz_results (quiz_session_id, user_id, topic, difficulty, correct) VALUES (?, ?, ?, ?, ?)",
+            [(cursor.lastrowid, user_id, r.get("topic"), r.get("difficulty"), int(bool(r.get("correct"))))
+             for r in quiz_session_data.get("results", [])],
+        )
+        # Keep the running per topic x difficulty counters in the same transaction
+        for topic, difficulties in _add_to_aggregates({}, quiz_session_data).items():
+            for difficulty, stats in difficulties.items():
+                conn.execute(
+                    "INSERT INTO quiz_aggregates (user_id, topic, difficulty, correct, total) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (user_id, topic, difficulty)"
+                    " DO UPDATE SET correct = correct + excluded.correct, total = total + excluded.total",
+                    (user_id, topic, difficulty, stats["correct"], stats["total"]),
+                )
+
+    def add_quiz_result(self, user_id, quiz_session_data):
+        def _add(conn):
+            self._ensure_user(conn, user_id)
+            self._insert_quiz_session(conn, user_id, quiz_session_data)
+        self._write(_add)
+
+    def get_quiz_history(self, user_id):
+        rows = self._conn().execute(
+            "SELECT payload FROM quiz_sessions WHERE user_id = ? ORDER BY id", (user_id,)
+        )
+        return [json.loads(payload) for (payload,) in rows]
+
+    def count_quiz_sessions(self, user_id):
+        """Number of quiz sessions the user has taken; None if the user doesn't exist."""
+        row = self._conn().execute(
+            "SELECT (SELECT COUNT(*) FROM quiz_sessions WHERE user_id = ?) FROM users WHERE user_id = ?",
+            (user_id, user_id),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def iter_quiz_results(self):
+        """Yields (user_id, topic, difficulty, correct, timestamp) for every answered question."""
+        yield from self._conn().execute(
+            "SELECT r.user_id, r.topic, r.difficulty, r.correct, s.timestamp"
+            " FROM quiz_results r JOIN quiz_sessions s ON s.id = r.quiz_session_id"
+            " WHERE r.topic IS NOT NULL AND r.topic <> '' AND r.difficulty IS NOT NULL"
+            " ORDER BY r.rowid"
+        )
+
+    def get_performance_aggregates(self, user_id):
+        aggregates = {}
+        for topic, difficulty, correct, total in self._conn().execute(
+            "SELECT topic, difficulty, correct, total FROM quiz_aggregates WHERE user_id = ? ORDER BY rowid", (user_id,)
+        ):
+            aggregates.setdefault(topic, {})[difficulty] = {"correct": correct, "total": total}
+        return aggregates
+
+    def backfill_performance_aggregates(self):
+        """Rebuilds quiz_aggregates from the individual quiz_results rows. Returns the number of users."""
+        def _backfill(conn):
+            conn.execute("DELETE FROM quiz_aggregates")
+            # Same filter as _add_to_aggregates: a topic is required, a difficulty must be present
+            conn.execute(
+                "INSERT INTO quiz_aggregates (user_id, topic, difficulty, correct, total)"
+                " SELECT user_id, topic, difficulty, SUM(correct), COUNT(*) FROM quiz_results"
+                " WHERE topic IS NOT NULL AND topic <> '' AND difficulty IS NOT NULL"
+                " GROUP BY user_id, topic, difficulty ORDER BY MIN(rowid)"
+            )
+            return conn.execute("SELECT COUNT(DISTINCT user_id) FROM quiz_aggregates").fetchone()[0]
+        return self._write(_backfill)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Returns the process-wide storage backend selected by USER_PROFILES_BACKEND."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if USER_PROFILES_BACKEND == "json":
+                    _storage = JSONStorage(USER_PROFILES_FILE)
+                elif USER_PROFILES_BACKEND == "sqlite":
+                    _storage = SQLiteStorage(USER_PROFILES_DB, USER_PROFILES_FILE)
+                else:
+                    raise ValueError(f"Unknown USER_PROFILES_BACKEND: {USER_PROFILES_BACKEND!r}")
+    return _storage
+
+
+def verify_performance_aggregates(storage, user_ids=None):
+    """Compares stored aggregates against a full recompute from the quiz history.
+
+    Returns {user_id: {"stored": ..., "recomputed": ...}} for every user that doesn't match.
+    """
+    if user_ids is None:
+        user_ids = list(storage.load_all())
+    mismatches = {}
+    for user_id in user_ids:
+        profile = storage.get_user(user_id)
+        if profile is None:
+            continue
+        recomputed = compute_performance_aggregates(profile.get("quiz_history", []))
+        stored = profile.get("performance_aggregates")
+        if stored != recomputed:
+            mismatches[user_id] = {"stored": stored, "recomputed": recomputed}
+    return mismatches
+
+
+def migrate_json_to_sqlite(json_path=USER_PROFILES_FILE, db_path=USER_PROFILES_DB):
+    """Copies every profile from the JSON file into the SQLite database, replacing its contents."""
+    profiles = JSONStorage(json_path).load_all()
+    return SQLiteStorage(db_path, json_path=None).save_all(profiles)
+
+
+if __name__ == "__main__":
+    # Usage:
+    #   python storage.py migrate [user_profiles.json] [user_profiles.db]
+    #   python storage.py backfill-aggregates
+    #   python storage.py verify-aggregates
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "migrate":
+        json_path = sys.argv[2] if len(sys.argv) > 2 else USER_PROFILES_FILE
+        db_path = sys.argv[3] if len(sys.argv) > 3 else USER_PROFILES_DB
+        count = migrate_json_to_sqlite(json_path, db_path)
+        print(f"Migrated {count} user profiles from {json_path} to {db_path}.")
+    elif command == "backfill-aggregates":
+        count = get_storage().backfill_performance_aggregates()
+        print(f"Backfilled performance aggregates for {count} users.")
+    elif command == "verify-aggregates":
+        mismatches = verify_performance_aggregates(get_storage())
+        for user_id, diff in mismatches.items():
+            print(f"{user_id}: stored {diff['stored']} != recomputed {diff['recomputed']}")
+        print(f"{len(mismatches)} user(s) with inconsistent aggregates.")
+        sys.exit(1 if mismatches else 0)
+    else:
+        print("Usage: python storage.py migrate [json_path] [db_path] | backfill-aggregates | verify-aggregates")
+        sys.exit(1)
@@ -0,0 +1,67 @@
+import asyncio
+
+import bot
+
+
+class _StubContextCache:
+    """Has a KV context for every turn after the first."""
+
+    def get(self, user_id, chat_id, model, turns):
+        return [1, 2, 3] if turns else None
+
+    def put(self, *args):
+        pass
+
+
+def _run_chat(monkeypatch, history, summary=None):
+    payloads = []
+    recalls = []
+
+    async def generate(payload, **kwargs):
+        payloads.append(payload)
+        return {"response": "ok", "context": [1, 2, 3, 4]}
+
+    monkeypatch.setattr(bot, "context_cache", _StubContextCache())
+    monkeypatch.setattr(bot.llm_client, "generate", generate)
+    def recall(user_id, message, chat_id, window_start):
+        recalls.append((chat_id, window_start))
+        return [{"chat_id": "older", "user": "I used to work as a nurse", "bot": "That helps for clinical data roles.", "score": 0.6}]
+
+    monkeypatch.setattr(bot.vector_memory, "recall", recall)
+    asyncio.run(bot.achat("Which data roles suit me?", history=history, model="m", summary=summary,
+                          session=("u", "c"), use_cache=False))
+    return payloads[0], recalls[0]
+
+
+def test_recalled_turns_reach_the_first_turn_prompt(monkeypatch):
+    payload, _ = _run_chat(monkeypatch, [])
+    assert "context" not in payload
+    assert "I used to work as a nurse" in payload["prompt"]
+
+
+def test_recalled_turns_reach_continuation_prompts(monkeypatch):
+    for turns in (1, 5):
+        history = [{"user": f"question {i}", "bot": f"answer {i}"} for i in range(turns)]
+        payload, _ = _run_chat(monkeypatch, history)
+        assert payload["context"] == [1, 2, 3]
+        assert "I used to work as a nurse" in payload["prompt"]
+        assert payload["prompt"].endswith("User: Which data roles suit me?")
+
+
+def test_recall_leaves_out_only_the_turns_still_in_the_prompt(monkeypatch):
+    history = [{"user": f"question {i}", "bot": f"answer {i}"} for i in range(8)]
+    _, recall = _run_chat(monkeypatch, history)
+    assert recall == ("c", 0)
+    _, recall = _run_chat(monkeypatch, history, summary={"summary": "Asked about SQL.", "upto": 5})
+    assert recall == ("c", 5)
+
+
+def test_turn_index_excludes_the_window_of_the_current_chat():
+    from vector_memory import TurnIndex
+
+    index = TurnIndex()
+    for turn in range(3):
+        index.add("current", turn, "How do I learn SQL joins?", "Practice joins on sample tables.")
+    index.add("older", None, "How do I learn SQL joins?", "Start with inner joins.")
+    hits = index.search("learning SQL joins", k=10, min_score=0, exclude_chat_id="current", exclude_from=1)
+    assert sorted(hit["chat_id"] for hit in hits) == ["current", "older"]
@@ -0,0 +1,78 @@
+import pytest
+
+from mcq import repair_mcq, validate_mcq
+
+
+def _mcq(correct_answer):
+    return {
+        "question": "Which model splits the data on feature thresholds?",
+        "options": ["Linear regression", "K-means", "A decision tree", "Decision tree ensemble"],
+        "correct_answer": correct_answer,
+        "explanation": "A decision tree splits on one feature at a time.",
+    }
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("A decision tree", "3"),
+    ("a decision tree", "3"),
+    ("Decision tree ensemble", "4"),
+    ("C) A decision tree", "3"),
+])
+def test_answer_given_as_option_text_starting_with_a_letter(answer, expected):
+    mcq = _mcq(answer)
+    assert repair_mcq(mcq)
+    assert validate_mcq(mcq)["correct_answer"] == expected
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("B", "2"),
+    ("b)", "2"),
+    ("Option 2", "2"),
+    ("d.", "4"),
+    ("C) something else", "3"),
+    (3, "3"),
+])
+def test_answer_given_as_label(answer, expected):
+    mcq = _mcq(answer)
+    repair_mcq(mcq)
+    assert validate_mcq(mcq)["correct_answer"] == expected
+
+
+def test_unknown_answer_text_is_left_invalid():
+    mcq = _mcq("A random forest")
+    repair_mcq(mcq)
+    with pytest.raises(ValueError):
+        validate_mcq(mcq)
+
+
+@pytest.mark.parametrize("explanation", [None, "", "   ", 42])
+def test_question_without_a_usable_explanation_is_invalid(explanation):
+    mcq = _mcq("3")
+    if explanation is None:
+        del mcq["explanation"]
+    else:
+        mcq["explanation"] = explanation
+    with pytest.raises(ValueError):
+        validate_mcq(mcq)
+
+
+def test_explanation_aliases_are_renamed():
+    mcq = _mcq("3")
+    mcq["rationale"] = mcq.pop("explanation")
+    assert repair_mcq(mcq)
+    assert validate_mcq(mcq)["explanation"] == "A decision tree splits on one feature at a time."
+
+
+def test_missing_explanation_is_a_parse_failure_and_retried(monkeypatch):
+    import json
+    import mcq as mcq_module
+
+    without_explanation = _mcq("3")
+    del without_explanation["explanation"]
+    replies = [json.dumps(without_explanation), json.dumps(_mcq("3"))]
+    before = mcq_module.mcq_stats().get("m", {}).get("parse_failures", 0)
+    result = mcq_module.mcq_assessment("statistics", chat_fn=lambda prompt, model: replies.pop(0), model="m")
+    assert result["explanation"] == "A decision tree splits on one feature at a time."
+    stats = mcq_module.mcq_stats()["m"]
+    assert stats["parse_failures"] == before + 1
+    assert stats["retries"] >= 1
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from storage import get_storage
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+
+
+class UserIndexCache:
+    """LRU of per-user indexes over chat turns, shared by the chat search and the vector memory.
+
+    An index is anything with add(chat_id, turn, user_text, bot_text) that skips
+    turns it already holds. A user's index is built from storage the first time
+    it's used, then kept up to date by add_turn() and remove_session(); updates
+    for users without a built index are skipped, since the build will read them
+    from storage. The cache lock only guards the LRU itself: builds, searches and
+    updates run under a lock of their own per user, so building one user's index
+    doesn't hold up anyone else.
+    """
+
+    def __init__(self, new_index, max_users):
+        self._new_index = new_index
+        self.max_users = max_users
+        self._entries = OrderedDict() # user_id -> _Entry
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def _build(self, user_id):
+        index = self._new_index()
+        profile = get_storage().get_user(user_id) or {}
+        for chat_id, session in (profile.get("chat_sessions") or {}).items():
+            for position, turn in enumerate(session.get("history", [])):
+                index.add(chat_id, position, turn.get("user", ""), turn.get("bot", ""))
+        return index
+
+    @contextmanager
+    def index(self, user_id):
+        """The user's index, built from storage if needed and locked for the duration of the block."""
+        with self._lock:
+            # Registered before reading storage, so a turn saved during the build reaches it through add_turn()
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _Entry()
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(user_id)
+        with entry.lock:
+            if entry.index is None:
+                entry.index = self._build(user_id)
+                with self._lock:
+                    self.builds += 1
+            yield entry.index
+
+    @contextmanager
+    def _built(self, user_id):
+        """The user's index if it's in the cache, else None; doesn't count as a use."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            yield None
+            return
+        with entry.lock:
+            yield entry.index
+
+    def add_turn(self, user_id, chat_id, turn, user_text, bot_text):
+        """Adds a newly saved turn at position `turn` of its session, if the user's index is built."""
+        with self._built(user_id) as index:
+            if index is not None:
+                index.add(chat_id, turn, user_text, bot_text)
+
+    def remove_session(self, user_id, chat_id):
+        with self._built(user_id) as index:
+            if index is not None:
+                index.remove_session(chat_id)
+
+    def reset(self):
+        """Drops every index; they are rebuilt from storage on next use."""
+        with self._lock:
+            self._entries.clear()
+
+    def built(self):
+        """The indexes currently built, for stats."""
+        with self._lock:
+            return [entry.index for entry in self._entries.values() if entry.index is not None]
@@ -1,136 +1,254 @@
 import json
+import logging
 import os
-import requests
-from bs4 import BeautifulSoup
-from collections import defaultdict
+from collections import OrderedDict
+import threading
 import time
 
-USER_PROFILES_FILE = "user_profiles.json"
+from storage import get_storage
+from kv_cache import context_cache
+from analytics import quiz_results_store
+from resource_search import resource_search
+from chat_search import chat_search_index
+from vector_memory import vector_memory
+from catalog import DIFFICULTY_RANK, ResourceCatalog, resource_catalog
+from metrics import PROFILE_OP_BYTES, PROFILE_OP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the (JSON-encoded) size of profiles kept in memory
+PROFILE_CACHE_MAX_BYTES = int(os.environ.get("PROFILE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+def _observe_profile_op(op, start, size):
+    PROFILE_OP_SECONDS.labels(op).observe(time.perf_counter() - start)
+    PROFILE_OP_BYTES.labels(op).observe(size)
+
+class ProfileCache:
+    """Read-through, LRU cache of parsed user profiles.
+
+    Entries are dropped when this process writes to a user, and the whole cache is
+    flushed when the backing store's version token (file mtime/size) changes
+    underneath us, e.g. because the CLI or another worker wrote to it.
+    Cached profiles are shared, so callers must treat them as read-only.
+    """
+
+    def __init__(self, max_bytes=PROFILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # user_id -> (profile or None, size)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id, storage):
+        with self._lock:
+            version = storage.version()
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._clear()
+                self._version = version
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        start = time.perf_counter()
+        profile = storage.get_user(user_id)
+        size = len(json.dumps(profile)) if profile is not None else 0
+        _observe_profile_op("load", start, size)
+        with self._lock:
+            # Don't cache something that a concurrent writer has already made stale
+            if storage.version() == self._version and size <= self.max_bytes:
+                self._put(user_id, profile, size)
+        return profile
+
+    def invalidate(self, user_id, storage):
+        """Forget one user after a local write and accept the store's new version."""
+        with self._lock:
+            self._drop(user_id)
+            self._version = storage.version()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
 
-def load_user_profiles():
-    """Load all user profiles from the JSON file, ensuring it's a dictionary."""
-    if not os.path.exists(USER_PROFILES_FILE):
-        return {}
-    try:
-        with open(USER_PROFILES_FILE, "r") as f:
-            # Handle empty file case
-            content = f.read()
-            if not content:
-                return {}
-            data = json.loads(content)
-            # Ensure the loaded data is a dictionary
-            if not isinstance(data, dict):
-                print(f"Warning: {USER_PROFILES_FILE} did not contain a dictionary. Resetting.")
-                return {}
-            return data
-    except json.JSONDecodeError:
-        print(f"Warning: {USER_PROFILES_FILE} is malformed. Starting with an empty profile.")
-        return {}
+    def _put(self, user_id, profile, size):
+        self._drop(user_id)
+        self._entries[user_id] = (profile, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
 
-def save_user_profiles(profiles):
-    """Save all user profiles to the JSON file."""
-    with open(USER_PROFILES_FILE, "w") as f:
-        json.dump(profiles, f, indent=2)
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+_profile_cache = ProfileCache()
+
+def profile_cache_stats():
+    """Hit/miss counters and memory usage of the in-process profile cache."""
+    return _profile_cache.stats()
+
+def _get_user_profile(user_id):
+    """Cached lookup of a single user's profile; None if the user doesn't exist."""
+    return _profile_cache.get(user_id, get_storage())
+
+def _invalidate_user_profile(user_id):
+    _profile_cache.invalidate(user_id, get_storage())
+
+def load_user_profiles():
+    """Load all user profiles from the configured storage backend."""
+    return get_storage().load_all()
 
 def _get_or_create_user_profile(user_id):
-    """Helper to get a user profile or create a default one."""
-    profiles = load_user_profiles()
-    if user_id not in profiles:
-        profiles[user_id] = {
+    """Helper to get a user profile or a default (unsaved) one."""
+    user_profile = _get_user_profile(user_id)
+    if user_profile is None:
+        user_profile = {
             "quiz_history": [],
             "chat_sessions": {}
         }
-    elif "chat_sessions" not in profiles[user_id]:
-        profiles[user_id]["chat_sessions"] = {}
-    return profiles, profiles[user_id]
+    elif "chat_sessions" not in user_profile:
+        user_profile = {**user_profile, "chat_sessions": {}}
+    return user_profile
 
 # --- New Chat Session Management Functions ---
 
 def create_chat_session(user_id: str) -> str:
     """Creates a new, empty chat session for a user."""
-    profiles, user_profile = _get_or_create_user_profile(user_id)
     chat_id = f"session_{int(time.time())}"
-    user_profile["chat_sessions"][chat_id] = {
-        "id": chat_id,
-        "title": "New Chat",
-        "history": []
-    }
-    save_user_profiles(profiles)
+    get_storage().create_session(user_id, chat_id, "New Chat")
+    _invalidate_user_profile(user_id)
     return chat_id
 
-def get_chat_sessions(user_id: str) -> list:
-    """Returns a list of all chat sessions for a user (id and title only)."""
-    _, user_profile = _get_or_create_user_profile(user_id)
-    sessions = user_profile.get("chat_sessions", {})
-    # Return a list of {"id": "...", "title": "..."}
-    return [{"id": s["id"], "title": s["title"]} for s in sessions.values()]
+def get_chat_sessions(user_id: str, limit=None, before=None, after=None, newest_first=False) -> list:
+    """Returns a page of a user's chat sessions: id, title, message_count, updated_at and seq.
 
-def get_chat_history(user_id: str, chat_id: str) -> list:
-    """Returns the full message history for a specific chat session."""
-    _, user_profile = _get_or_create_user_profile(user_id)
-    session = user_profile.get("chat_sessions", {}).get(chat_id)
-    return session["history"] if session else []
+    Pages are selected with seq cursors: sessions created before/after the given
+    one, oldest first unless newest_first. Histories aren't read.
+    """
+    return get_storage().get_sessions(user_id, limit, before, after, newest_first)
+
+def get_chat_history(user_id: str, chat_id: str, limit=None, before=None, after=None, newest_first=False) -> list:
+    """Returns the message history for a specific chat session.
+
+    Without paging arguments this is the full history from the profile cache.
+    Otherwise only the requested slice is read from storage, with each turn's
+    seq included to use as the next before/after cursor.
+    """
+    if limit is None and before is None and after is None and not newest_first:
+        user_profile = _get_or_create_user_profile(user_id)
+        session = user_profile.get("chat_sessions", {}).get(chat_id)
+        return session["history"] if session else []
+    return get_storage().get_history(user_id, chat_id, limit, before, after, newest_first) or []
 
 def delete_chat_session(user_id: str, chat_id: str):
     """Deletes a specific chat session for a user."""
-    profiles, user_profile = _get_or_create_user_profile(user_id)
-    if chat_id in user_profile.get("chat_sessions", {}):
-        del user_profile["chat_sessions"][chat_id]
-        save_user_profiles(profiles)
+    get_storage().delete_session(user_id, chat_id)
+    _invalidate_user_profile(user_id)
+    context_cache.invalidate(user_id, chat_id)
+    chat_search_index.remove_session(user_id, chat_id)
+    vector_memory.remove_session(user_id, chat_id)
 
 def add_message_to_chat(user_id: str, chat_id: str, user_message: str, bot_message: str):
-    """Adds a new user/bot message pair to a chat session's history."""
-    profiles, user_profile = _get_or_create_user_profile(user_id)
+    """Adds a new user/bot message pair to a chat session's history.
+
+    The first message of a session also becomes its title. Unknown sessions are ignored.
+    """
+    start = time.perf_counter()
+    turn_count = get_storage().append_message(user_id, chat_id, user_message, bot_message)
+    _observe_profile_op("save", start, len(user_message) + len(bot_message))
+    _invalidate_user_profile(user_id)
+    if turn_count:
+        # An index built from storage since the append already has this turn and skips it
+        chat_search_index.add_turn(user_id, chat_id, turn_count - 1, user_message, bot_message)
+        vector_memory.add_turn(user_id, chat_id, turn_count - 1, user_message, bot_message)
+
+def get_chat_summary(user_id: str, chat_id: str):
+    """Returns the rolling summary of a chat session as {"summary": str, "upto": int}, or None.
+
+    `upto` is the number of leading turns of the history that the summary covers.
+    """
+    user_profile = _get_or_create_user_profile(user_id)
     session = user_profile.get("chat_sessions", {}).get(chat_id)
-    if not session:
-        return # Or raise an error
+    if not session or not session.get("summary"):
+        return None
+    return {"summary": session["summary"], "upto": session.get("summary_upto", 0)}
 
-    # If this is the first message, use it to set the title
-    if not session["history"]:
-        session["title"] = user_message[:50] # Use first 50 chars as title
-
-    session["history"].append({"user": user_message, "bot": bot_message})
-    save_user_profiles(profiles)
+def update_chat_summary(user_id: str, chat_id: str, summary: str, upto: int):
+    """Stores a new rolling summary covering the first `upto` turns of a chat session."""
+    start = time.perf_counter()
+    get_storage().set_session_summary(user_id, chat_id, summary, upto)
+    _observe_profile_op("save", start, len(summary))
+    _invalidate_user_profile(user_id)
 
 
 # --- Existing Functions ---
 
 def add_quiz_result(user_id, quiz_session_data):
     """Save a quiz session's results for a user."""
-    profiles, _ = _get_or_create_user_profile(user_id)
-    print(f"DEBUG: Before appending, quiz_history for {user_id}: {profiles[user_id]['quiz_history']}")
-    profiles[user_id]["quiz_history"].append(quiz_session_data)
-    print(f"DEBUG: After appending, quiz_history for {user_id}: {profiles[user_id]['quiz_history']}")
-    save_user_profiles(profiles)
+    logger.debug("Appending quiz session user_id=%s results=%d", user_id, len(quiz_session_data.get("results", [])))
+    start = time.perf_counter()
+    get_storage().add_quiz_result(user_id, quiz_session_data)
+    _observe_profile_op("save", start, len(json.dumps(quiz_session_data)))
+    _invalidate_user_profile(user_id)
+    quiz_results_store.append_session(user_id, quiz_session_data)
 
 def save_user_profiles(profiles):
-    """Save all user profiles to the JSON file."""
-    print(f"DEBUG: Saving profiles: {profiles}")
-    with open(USER_PROFILES_FILE, "w") as f:
-        json.dump(profiles, f, indent=2)
+    """Replace all user profiles in the configured storage backend."""
+    logger.debug("Saving profiles count=%d", len(profiles))
+    start = time.perf_counter()
+    get_storage().save_all(profiles)
+    _observe_profile_op("save", start, len(json.dumps(profiles)))
+    _profile_cache.clear()
+    quiz_results_store.reset()
+    chat_search_index.reset()
+    vector_memory.reset()
 
 def analyze_performance(user_id):
-    """Analyze a user's performance history to identify weak areas based on topic and difficulty."""
-    profiles = load_user_profiles()
-    if user_id not in profiles:
+    """Analyze a user's performance history to identify weak areas based on topic and difficulty.
+
+    Works from the stored per topic x difficulty aggregates, so the cost depends on
+    the number of topics rather than the length of the quiz history.
+    """
+    storage = get_storage()
+    quiz_sessions = storage.count_quiz_sessions(user_id)
+    if quiz_sessions is None:
         return {"error": "User profile not found."}
-    
-    user_profile = profiles[user_id]
-    quiz_history = user_profile.get("quiz_history", [])
 
-    if not quiz_history:
+    if not quiz_sessions:
         return {"error": "No quiz history available for analysis."}
 
-    topic_performance = defaultdict(lambda: defaultdict(lambda: {'correct': 0, 'total': 0}))
-    for session in quiz_history:
-        for result in session.get("results", []):
-            topic = result.get("topic")
-            difficulty = result.get("difficulty")
-            correct = result.get("correct")
-            if topic and difficulty is not None:
-                topic_performance[topic][difficulty]['total'] += 1
-                if correct:
-                    topic_performance[topic][difficulty]['correct'] += 1
+    # Running per topic x difficulty counters, maintained by add_quiz_result
+    topic_performance = storage.get_performance_aggregates(user_id)
 
     if not topic_performance:
         return {"message": "Not enough data to provide a performance analysis."}
@@ -218,97 +336,70 @@ GENERIC_RESOURCES = [
     },
 ]
 
+_generic_catalog = ResourceCatalog(GENERIC_RESOURCES)
+
+# Resources returned from the catalog per recommendation request
+RECOMMENDATION_LIMIT = int(os.environ.get("RECOMMENDATION_LIMIT", 5))
+
+def _topic_needs(user_id, weak_areas):
+    """Maps each weak topic to (weight, difficulty to target) for ResourceCatalog.recommend.
+
+    The weight is the share of questions missed in the topic. The target is the
+    easiest difficulty the user is below 60% on, or the level above the hardest
+    one they've attempted if they're doing fine at every level tried.
+    """
+    aggregates = get_storage().get_performance_aggregates(user_id)
+    needs = {}
+    for topic in weak_areas:
+        difficulties = {d: stats for d, stats in aggregates.get(topic, {}).items() if stats["total"]}
+        correct = sum(stats["correct"] for stats in difficulties.values())
+        total = sum(stats["total"] for stats in difficulties.values())
+        ranked = sorted((d for d in difficulties if d in DIFFICULTY_RANK), key=DIFFICULTY_RANK.get)
+        struggling = [d for d in ranked if difficulties[d]["correct"] / difficulties[d]["total"] < 0.6]
+        if struggling:
+            target = struggling[0]
+        elif ranked:
+            target = ("medium", "hard", "hard")[DIFFICULTY_RANK[ranked[-1]]]
+        else:
+            target = "easy"
+        needs[topic] = (1 - correct / total if total else 1.0, target)
+    return needs
 
 def recommend_resources(user_id):
     """Recommends learning resources based on the user's weak areas."""
-    print(f"DEBUG: Starting recommend_resources for user: {user_id}")
     analysis = analyze_performance(user_id)
-    print(f"DEBUG: Analysis result: {analysis}")
 
     if analysis.get("error"):
-        print(f"DEBUG: Analysis returned an error: {analysis['error']}")
+        logger.debug("No recommendations user_id=%s error=%r", user_id, analysis["error"])
         return []
     
     weak_areas = analysis.get("weakest_areas", [])
-    print(f"DEBUG: Weak areas identified: {weak_areas}")
+    logger.debug("Recommending resources user_id=%s weak_areas=%s", user_id, weak_areas)
 
     if not weak_areas:
-        print("DEBUG: No weak areas found, returning empty recommendations.")
         return []
 
-    recommended_resources = []
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0;Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
-
-    for weak_topic in weak_areas[:2]:
-        print(f"DEBUG: Searching web for resources to help with '{weak_topic}'...")
-        try:
-            search_query = f"best online courses for {weak_topic}"
-            search_url = f"https://www.google.com/search?q={search_query.replace(' ', '+')}&hl=en&gl=us"
-            response = requests.get(search_url, headers=headers)
-            response.raise_for_status()
-            print(f"DEBUG: Raw Google search HTML for '{weak_topic}':\n{response.text[:1000]}...") # Print first 1000 chars
-            
-            # Updated scraping logic
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Attempt to find search results using more common and robust selectors
-            # Google often uses 'div' with role 'heading' for titles, and 'a' for links
-            # Or 'div' with specific data attributes
-            
-            # Find all potential result blocks. This is a heuristic.
-            # Look for divs that contain an h3 (title) and an a tag (link)
-            potential_results = []
-            for h3_tag in soup.find_all('h3'):
-                # Find the closest parent div that contains an 'a' tag
-                parent_div = h3_tag.find_parent('div')
-                while parent_div:
-                    if parent_div.find('a', href=True):
-                        potential_results.append(parent_div)
-                        break
-                    parent_div = parent_div.find_parent('div')
-            
-            found_results_for_topic = 0
-            for result_block in potential_results[:5]: # Check more results
-                title_element = result_block.find('h3')
-                link_element = result_block.find('a', href=True)
-                
-                # Try to find a description element within the result block
-                description_element = result_block.find(['span', 'div', 'p'], class_=lambda x: x and ('st' in x.split() or 's' in x.split() or 'aCOpRe' in x.split() or 'VwiC3b' in x.split()))
-                
-                if title_element and link_element:
-                    title = title_element.get_text()
-                    url = link_element['href']
-                    description = description_element.get_text() if description_element else "No description available."
-                    
-                    # Basic filtering for valid URLs
-                    if not url.startswith("http"):
-                        continue
-                    
-                    recommended_resources.append({
-                        "title": title,
-                        "url": url,
-                        "description": description,
-                        "topics_covered": [weak_topic],
-                        "difficulty_level": "mixed",
-                    })
-                    found_results_for_topic += 1
-            print(f"DEBUG: Found {found_results_for_topic} results for '{weak_topic}'.")
-
-        except Exception as e:
-            print(f"DEBUG: Could not perform web search for '{weak_topic}': {str(e)}")
+    # Local catalog first; the web is only searched for weak topics it doesn't cover
+    needs = _topic_needs(user_id, weak_areas)
+    recommended_resources = resource_catalog.recommend(needs, limit=RECOMMENDATION_LIMIT)
+    uncovered = [topic for topic in weak_areas[:2] if not resource_catalog.ids_for_topic(topic)]
+    logger.debug("Catalog recommendations user_id=%s results=%d uncovered=%s", user_id, len(recommended_resources), uncovered)
+
+    if uncovered:
+        # Shared per-topic cache; topics whose search misses the deadline are simply left out
+        search_results = resource_search.search(uncovered)
+        for weak_topic in uncovered:
+            found = search_results.get(weak_topic, [])
+            logger.debug("Web search results topic=%r results=%d", weak_topic, len(found))
+            recommended_resources.extend(found)
     
     # Fallback to generic resources if no specific recommendations were found
     if not recommended_resources:
-        print("DEBUG: No specific recommendations found via web scraping. Providing generic resources.")
-        # Filter generic resources to match weak areas if possible, otherwise return all
-        filtered_generic = [
-            res for res in GENERIC_RESOURCES 
-            if any(topic in weak_areas for topic in res["topics_covered"])
-        ]
-        if filtered_generic:
-            recommended_resources.extend(filtered_generic)
-        else:
-            recommended_resources.extend(GENERIC_RESOURCES) # If no match, just add all generic
+        logger.debug("No specific recommendations, using generic resources user_id=%s", user_id)
+        # Generic resources matching the weak areas if possible, otherwise all of them
+        recommended_resources = _generic_catalog.recommend(needs, limit=len(GENERIC_RESOURCES))
+        if not recommended_resources:
+            recommended_resources = list(GENERIC_RESOURCES)
 
-    print(f"DEBUG: Final recommended_resources: {recommended_resources}")
+    logger.debug("Recommended resources user_id=%s count=%d", user_id, len(recommended_resources))
     return recommended_resources
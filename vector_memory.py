@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from catalog import tokenize
+from user_indexes import UserIndexCache
+
+logger = logging.getLogger(__name__)
+
+# Width of the hashed feature vectors; 1 KiB of float32 per stored turn at the default
+VECTOR_MEMORY_DIM = int(os.environ.get("VECTOR_MEMORY_DIM", 256))
+# Character n-gram lengths hashed into each vector
+VECTOR_MEMORY_NGRAMS = tuple(int(n) for n in os.environ.get("VECTOR_MEMORY_NGRAMS", "3,5").split(","))
+# Past turns recalled into a chat prompt, and the cosine similarity they need to be worth including
+VECTOR_MEMORY_TOP_K = int(os.environ.get("VECTOR_MEMORY_TOP_K", 4))
+VECTOR_MEMORY_MIN_SCORE = float(os.environ.get("VECTOR_MEMORY_MIN_SCORE", 0.2))
+# Users whose index is kept in memory; the least recently used are rebuilt on demand
+VECTOR_MEMORY_MAX_USERS = int(os.environ.get("VECTOR_MEMORY_MAX_USERS", 200))
+
+# Words too common to say anything about what a turn is about
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my of on or so that the "
+    "their them then there these this to was we what when which who why will with would you your".split()
+)
+
+_HASH_BASE = np.uint32(0x01000193)
+_HASH_MIX = np.uint32(0x45D9F3B)
+
+
+def embed(text, dim=VECTOR_MEMORY_DIM, ngrams=VECTOR_MEMORY_NGRAMS):
+    """Unit-length hashed character n-gram vector of `text` (all zeros if it has no content words).
+
+    Stopwords are dropped and the rest joined with single spaces, so n-grams that
+    cross a space pick up word pairs as well as word pieces. Each n-gram is hashed
+    to a column and a sign, then counts are damped with log1p. Deterministic and
+    CPU-only: a handful of NumPy operations per text.
+    """
+    words = [word for word in tokenize(text) if word not in STOPWORDS]
+    counts = np.zeros(dim, dtype=np.float32)
+    if not words:
+        return counts
+    data = np.frombuffer(f" {' '.join(words)} ".encode(), dtype=np.uint8).astype(np.uint32)
+    for n in ngrams:
+        if len(data) < n:
+            continue
+        hashes = np.full(len(data) - n + 1, n, dtype=np.uint32)
+        for offset in range(n):
+            hashes = hashes * _HASH_BASE + data[offset:len(data) - n + 1 + offset]
+        hashes ^= hashes >> np.uint32(16)
+        hashes *= _HASH_MIX
+        hashes ^= hashes >> np.uint32(16)
+        signs = np.where(hashes & np.uint32(0x80000000), -1.0, 1.0)
+        counts += np.bincount(hashes % np.uint32(dim), weights=signs, minlength=dim).astype(np.float32)
+    counts = np.sign(counts) * np.log1p(np.abs(counts))
+    norm = np.linalg.norm(counts)
+    return counts / norm if norm else counts
+
+
+def _top_rows(scores, k, min_score):
+    """Rows of the `k` highest scores that reach `min_score`, best first."""
+    n = len(scores)
+    top = np.argpartition(scores, n - k)[n - k:] if k < n else np.arange(n)
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [row for row in top if scores[row] >= min_score]
+
+
+class TurnIndex:
+    """Embedded chat turns in one growable float32 matrix; a search is one matrix-vector product.
+
+    Rows are kept in insertion order. Each turn belongs to a chat session, whose
+    rows can be excluded from a search or removed together.
+    """
+
+    def __init__(self, dim=VECTOR_MEMORY_DIM, initial_capacity=64):
+        self.dim = dim
+        self._vectors = np.empty((initial_capacity, dim), dtype=np.float32)
+        self._turns = [] # row -> (chat_id, turn position, user text, bot text)
+        self._sessions = {} # chat_id -> {turn position: row}
+
+    def __len__(self):
+        return len(self._turns)
+
+    def add(self, chat_id, turn, user_text, bot_text):
+        """Adds a turn at position `turn` of its session, unless it's indexed already; None appends it."""
+        rows = self._sessions.setdefault(chat_id, {})
+        if turn is None:
+            turn = len(rows)
+        elif turn in rows:
+            return
+        row = len(self._turns)
+        if row == len(self._vectors):
+            grown = np.empty((2 * row, self.dim), dtype=np.float32)
+            grown[:row] = self._vectors
+            self._vectors = grown
+        self._vectors[row] = embed(f"{user_text} {bot_text}", self.dim)
+        self._turns.append((chat_id, turn, user_text, bot_text))
+        rows[turn] = row
+
+    def remove_session(self, chat_id):
+        if self._sessions.pop(chat_id, None) is None:
+            return
+        keep = [row for row, turn in enumerate(self._turns) if turn[0] != chat_id]
+        self._vectors = self._vectors[keep] if keep else np.empty((64, self.dim), dtype=np.float32)
+        self._turns = [self._turns[row] for row in keep]
+        self._sessions = {}
+        for row, (session_id, turn, _, _) in enumerate(self._turns):
+            self._sessions.setdefault(session_id, {})[turn] = row
+
+    def search(self, text, k=VECTOR_MEMORY_TOP_K, min_score=VECTOR_MEMORY_MIN_SCORE, exclude_chat_id=None,
+               exclude_from=0, upto=None):
+        """The `k` turns most similar to `text`, best first, as {"chat_id", "user", "bot", "score"} dicts.
+
+        Turns of `exclude_chat_id` from position `exclude_from` on and rows from
+        `upto` on are left out, for turns that are already in the prompt.
+        """
+        n = len(self._turns) if upto is None else max(0, min(upto, len(self._turns)))
+        query = embed(text, self.dim)
+        if not n or k <= 0 or not query.any():
+            return []
+        scores = self._vectors[:n] @ query
+        excluded = self._sessions.get(exclude_chat_id, {}) if exclude_chat_id is not None else {}
+        excluded = [row for turn, row in excluded.items() if turn >= exclude_from and row < n]
+        if excluded:
+            scores[excluded] = -np.inf
+        hits = []
+        for row in _top_rows(scores, k, min_score):
+            chat_id, _, user_text, bot_text = self._turns[row]
+            hits.append({"chat_id": chat_id, "user": user_text, "bot": bot_text, "score": round(float(scores[row]), 4)})
+        return hits
+
+    def nbytes(self):
+        return self._vectors[:len(self._turns)].nbytes
+
+
+class LogTurnIndex:
+    """Embeddings of a JSONL conversation log, persisted next to it so they are computed once per turn.
+
+    The sidecar file (`<log>.vectors`) holds one fixed-size record per log line:
+    the line's byte offset, length and CRC, and its vector. sync() embeds only
+    the lines appended since the last indexed one; if that line no longer
+    matches (the log was cleared or compacted), the sidecar is rebuilt from the
+    log. Hits are read back from the log at their offsets, so turn texts aren't
+    kept in memory.
+    """
+
+    def __init__(self, log_path, dim=VECTOR_MEMORY_DIM):
+        self.log_path = log_path
+        self.path = f"{log_path}.vectors"
+        self.dim = dim
+        self._dtype = np.dtype([("offset", np.int64), ("length", np.int64), ("crc", np.uint32),
+                                ("vector", np.float32, (dim,))])
+        self._records = None
+
+    def __len__(self):
+        return 0 if self._records is None else len(self._records)
+
+    def _load(self):
+        records = np.empty(0, dtype=self._dtype)
+        if os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+            # A record cut short by an interrupted write is dropped and recomputed
+            usable = size - size % self._dtype.itemsize
+            if usable != size:
+                os.truncate(self.path, usable)
+            records = np.fromfile(self.path, dtype=self._dtype)
+        self._records = records
+
+    def _covers_log(self, log):
+        """Whether the last indexed record still describes the same line of the log."""
+        if not len(self._records):
+            return True
+        last = self._records[-1]
+        log.seek(int(last["offset"]))
+        line = log.read(int(last["length"]))
+        return len(line) == last["length"] and zlib.crc32(line) == last["crc"]
+
+    def sync(self):
+        """Embeds the log lines that aren't indexed yet; returns how many were added."""
+        if self._records is None:
+            self._load()
+        if not os.path.exists(self.log_path):
+            return 0
+        with open(self.log_path, "rb") as log:
+            if not self._covers_log(log):
+                logger.info("%s was rewritten, re-indexing it", self.log_path)
+                self._records = np.empty(0, dtype=self._dtype)
+                open(self.path, "wb").close()
+            last = self._records[-1] if len(self._records) else None
+            position = 0 if last is None else int(last["offset"] + last["length"])
+            log.seek(position)
+            new = []
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break # Still being written; indexed on a later sync
+                if line.strip():
+                    try:
+                        turn = json.loads(line)
+                        text = f"{turn.get('user', '')} {turn.get('bot', '')}"
+                    except (json.JSONDecodeError, AttributeError):
+                        text = ""
+                    new.append((position, len(line), zlib.crc32(line), embed(text, self.dim)))
+                position += len(line)
+        if new:
+            records = np.array(new, dtype=self._dtype)
+            with open(self.path, "ab") as f:
+                records.tofile(f)
+            self._records = np.concatenate([self._records, records])
+        return len(new)
+
+    def search(self, text, k=VECTOR_MEMORY_TOP_K, min_score=VECTOR_MEMORY_MIN_SCORE, upto=None):
+        """The `k` logged turns most similar to `text`, best first, as {"user", "bot", "score"} dicts.
+
+        Only the first `upto` lines are searched when given, to leave out turns already in the prompt.
+        """
+        if self._records is None:
+            self.sync()
+        n = len(self._records) if upto is None else max(0, min(upto, len(self._records)))
+        query = embed(text, self.dim)
+        if not n or k <= 0 or not query.any():
+            return []
+        scores = self._records["vector"][:n] @ query
+        hits = []
+        with open(self.log_path, "rb") as log:
+            for row in _top_rows(scores, k, min_score):
+                log.seek(int(self._records[row]["offset"]))
+                try:
+                    turn = json.loads(log.read(int(self._records[row]["length"])))
+                except json.JSONDecodeError:
+                    continue
+                hits.append({"user": turn.get("user", ""), "bot": turn.get("bot", ""), "score": round(float(scores[row]), 4)})
+        return hits
+
+
+class VectorMemory:
+    """Long-term chat memory: one TurnIndex per user over every turn of every session."""
+
+    def __init__(self, max_users=VECTOR_MEMORY_MAX_USERS, dim=VECTOR_MEMORY_DIM):
+        self.dim = dim
+        self._indexes = UserIndexCache(lambda: TurnIndex(dim), max_users)
+        self._lock = threading.Lock()
+        self.recalls = 0
+        self.recalled = 0
+
+    def recall(self, user_id, message, chat_id=None, window_start=0, k=VECTOR_MEMORY_TOP_K,
+               min_score=VECTOR_MEMORY_MIN_SCORE):
+        """The user's past turns most relevant to `message`.
+
+        Turns of `chat_id` from position `window_start` on are still in the prompt,
+        so they are left out; its older turns, folded into the summary, can be recalled.
+        """
+        with self._indexes.index(user_id) as index:
+            hits = index.search(message, k, min_score, chat_id, window_start)
+        with self._lock:
+            self.recalls += 1
+            self.recalled += len(hits)
+        return hits
+
+    def add_turn(self, user_id, chat_id, turn, user_text, bot_text):
+        """Embeds a newly saved turn at position `turn` of its session, if the user's index is built."""
+        self._indexes.add_turn(user_id, chat_id, turn, user_text, bot_text)
+
+    def remove_session(self, user_id, chat_id):
+        self._indexes.remove_session(user_id, chat_id)
+
+    def reset(self):
+        self._indexes.reset()
+
+    def stats(self):
+        indexes = self._indexes.built()
+        with self._lock:
+            return {
+                "users": len(indexes),
+                "turns": sum(len(index) for index in indexes),
+                "bytes": sum(index.nbytes() for index in indexes),
+                "builds": self._indexes.builds,
+                "recalls": self.recalls,
+                "recalled": self.recalled,
+            }
+
+
+vector_memory = VectorMemory()